@@ -0,0 +1,119 @@
+"use client";
+
+
+import React, { useEffect, useState, Suspense } from "react";
+import { useRouter, useSearchParams } from "next/navigation";
+import { useAuth } from "@/context/AuthContext";
+import { ApiClient } from "@/lib/api";
+import { Loader2 } from "lucide-react";
+
+// Landing page for PAYMENT_CALLBACK_MODE=deferred: the backend callback has
+// already handed verification to a background worker, so this page only
+// long-polls the read-only status endpoint until the payment is final.
+// Backends on the sync worker answer without waiting; the page then
+// short-polls every POLL_INTERVAL_MS instead.
+function VerifyingContent() {
+  const router = useRouter();
+  const searchParams = useSearchParams();
+  const { refreshStatus } = useAuth();
+
+  const txnrefRef = React.useRef(
+    searchParams.get("txnref") || searchParams.get("txnRef") || ""
+  );
+  const txnref = txnrefRef.current;
+
+  const [slow, setSlow] = useState(false);
+  const MAX_WAIT_MS = 3 * 60 * 1000;  // give up after 3 minutes
+  const LONG_POLL_SECONDS = 15;
+  const RETRY_DELAY_MS = 3000;
+  const POLL_INTERVAL_MS = 3000;
+
+
+  useEffect(() => {
+    router.replace("/applicant/payment/verifying", { scroll: false });
+
+  }, []);
+
+  useEffect(() => {
+    if (!txnref) {
+      router.replace("/applicant/dashboard");
+      return;
+    }
+
+    let cancelled = false;
+    let failures = 0;
+    const startedAt = Date.now();
+
+    const poll = async () => {
+      while (!cancelled && Date.now() - startedAt < MAX_WAIT_MS) {
+        try {
+          const requestedAt = Date.now();
+          const res = await ApiClient.getPaymentStatus(txnref, LONG_POLL_SECONDS);
+          if (cancelled) return;
+          failures = 0;
+
+          if (res.is_successful) {
+            ApiClient.clearCache();
+            try { await refreshStatus?.(); } catch (_) { }
+            router.replace("/applicant/dashboard");
+            return;
+          }
+          if (res.tran_status === "cancelled") {
+            router.replace("/applicant/payment");
+            return;
+          }
+          if (res.tran_status === "failed") {
+            router.replace("/applicant/dashboard");
+            return;
+          }
+          if (Date.now() - startedAt > 30000) setSlow(true);
+          // Answered without holding the request open: don't hammer the backend
+          const elapsed = Date.now() - requestedAt;
+          if (elapsed < POLL_INTERVAL_MS) {
+            await new Promise((r) => setTimeout(r, POLL_INTERVAL_MS - elapsed));
+          }
+        } catch (err: any) {
+          if (cancelled) return;
+          failures += 1;
+          if (failures >= 5) break;
+          await new Promise((r) => setTimeout(r, RETRY_DELAY_MS));
+        }
+      }
+      if (!cancelled) router.replace("/applicant/dashboard");
+    };
+
+    poll();
+    return () => { cancelled = true; };
+  }, [txnref]);
+
+  return (
+    <div className="min-h-screen flex items-center justify-center bg-[#f8fafc]">
+      <div className="text-center space-y-4 px-6">
+        <Loader2 className="h-12 w-12 animate-spin text-[#433878] mx-auto" />
+        <p className="text-slate-700 font-semibold">Confirming your payment…</p>
+        <p className="text-slate-500 text-sm max-w-sm mx-auto">
+          {slow
+            ? "Bank transfers can take a few minutes to confirm. You can leave this page — your dashboard will update once the payment is confirmed."
+            : "Please don't close this page. This usually takes a few seconds."}
+        </p>
+      </div>
+    </div>
+  );
+}
+
+export default function PaymentVerifyingPage() {
+  return (
+    <Suspense
+      fallback={
+        <div className="min-h-screen flex items-center justify-center bg-[#f8fafc]">
+          <div className="text-center space-y-4">
+            <Loader2 className="h-12 w-12 animate-spin text-[#433878] mx-auto" />
+            <p className="text-slate-500 font-medium">Loading payment status…</p>
+          </div>
+        </div>
+      }
+    >
+      <VerifyingContent />
+    </Suspense>
+  );
+}
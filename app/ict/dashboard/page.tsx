@@ -197,6 +197,32 @@ export default function ICTDashboard() {
                     {dashboardLoading ? <Skeleton className="h-4 w-20 bg-slate-700" /> : (systemStatus?.api_status || "Checking...")}
                   </span>
                 </div>
+                <div className="flex justify-between items-center text-sm">
+                  <span className="text-slate-400">Payment Gateway:</span>
+                  <span className={`${systemStatus?.interswitch_breaker?.state === "open" ? "text-red-400" : systemStatus?.interswitch_breaker?.state === "half_open" ? "text-yellow-400" : "text-green-400"} font-medium`}>
+                    {dashboardLoading ? <Skeleton className="h-4 w-20 bg-slate-700" /> : ({
+                      closed: "Healthy",
+                      half_open: "Recovering",
+                      open: "Unavailable",
+                      disabled: "Unmonitored",
+                    } as Record<string, string>)[systemStatus?.interswitch_breaker?.state] || "Checking..."}
+                  </span>
+                </div>
+                <div className="flex justify-between items-center text-sm">
+                  <span className="text-slate-400">Requery Worker:</span>
+                  <span
+                    className={`${systemStatus?.requery_worker?.state === "active" ? "text-green-400" : systemStatus?.requery_worker?.state === "disabled" ? "text-slate-400" : "text-yellow-400"} font-medium`}
+                    title={systemStatus?.requery_worker?.leader || undefined}
+                  >
+                    {dashboardLoading ? <Skeleton className="h-4 w-20 bg-slate-700" /> : ({
+                      active: "Leader active",
+                      expired: "Failing over",
+                      unclaimed: "No leader",
+                      not_started: "Not started",
+                      disabled: "Every worker",
+                    } as Record<string, string>)[systemStatus?.requery_worker?.state] || "Checking..."}
+                  </span>
+                </div>
                 <div className="flex justify-between items-center text-sm border-t border-slate-800 pt-3">
                   <span className="text-slate-400">Internal 500 Errors:</span>
                   <span className={`${(systemStatus?.counts?.errors_500 || 0) > 0 ? "text-red-400 font-bold" : "text-green-400"} font-medium`}>
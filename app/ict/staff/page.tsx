@@ -16,7 +16,7 @@ type Department = { id: number; name: string };
 type Faculty    = { id: number; name: string };
 type Course     = { id: number; course_code: string; course_title: string };
 
-const ROLES = ["lecturer","deo","hod","dean","registrar","admissions_officer","ict_director","admin"];
+const ROLES = ["lecturer","deo","hod","dean","registrar","bursar","admissions_officer","ict_director","admin"];
 
 export default function ICTStaffPage() {
   const router  = useRouter();
@@ -1,7 +1,9 @@
-from flask import Flask, request
+from flask import Flask, request, g, Response
 from flask_cors import CORS
 from config import config
+import hmac
 import os
+import time
 import logging
 
 logging.basicConfig(
@@ -43,6 +45,8 @@ def create_app(config_name='development'):
     from routes.pgdean import pgdean_bp
     from routes.pgadmin import pgadmin_bp
     from routes.ptadmin import ptadmin_bp
+    from routes.diagnostics import diagnostics_bp
+    from routes.finance import finance_bp
 
     app.register_blueprint(auth_bp, url_prefix='/e-portal/api/auth')
     app.register_blueprint(applicant_bp, url_prefix='/e-portal/api/applicant')
@@ -57,34 +61,86 @@ def create_app(config_name='development'):
     app.register_blueprint(pgdean_bp, url_prefix='/e-portal/api/pgdean')
     app.register_blueprint(pgadmin_bp, url_prefix='/e-portal/api/pgadmin')
     app.register_blueprint(ptadmin_bp, url_prefix='/e-portal/api/ptadmin')
+    app.register_blueprint(diagnostics_bp, url_prefix='/e-portal/api/diagnostics')
+    app.register_blueprint(finance_bp, url_prefix='/e-portal/api/finance')
 
-    # ── Background payment-requery worker ─────────────────────────────────────
+    # ── Warmup + background requery, webhook-inbox, rollup and archive workers
     # Guard against double-start when Flask debug mode forks a reloader child.
     # In production (gunicorn) WERKZEUG_RUN_MAIN is not set, so worker always starts.
+    # Warmup runs before the worker thread so both share an already-open pool.
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not app.debug:
+        from warmup import run_warmup
+        run_warmup()
+
         from background_requery import start_background_worker
         start_background_worker()
 
+        from webhook_inbox import start_webhook_workers
+        start_webhook_workers()
+
+        from utils.payment_rollup import start_rollup_worker
+        start_rollup_worker()
+
+        from utils.payment_archive import start_archive_worker
+        start_archive_worker()
+
+    # ── Request metrics ───────────────────────────────────────────────────────
+    from utils import metrics
+    from utils import profiler
+    from utils import memory
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_started = time.perf_counter()
+        g._db_time = 0.0
+        memory.start_request_tracking(g, request)
+        profiler.start_request_profile(g, request)
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = getattr(g, '_request_started', None)
+        if started is None:
+            return response
+        rule      = request.url_rule.rule if request.url_rule else '<unmatched>'
+        blueprint = request.blueprint or 'app'
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, blueprint=blueprint, route=rule, method=request.method,
+        )
+        metrics.HTTP_REQUESTS.inc(
+            blueprint=blueprint, route=rule, method=request.method, status=response.status_code,
+        )
+        metrics.HTTP_REQUEST_DB_SECONDS.observe(getattr(g, '_db_time', 0.0), blueprint=blueprint, route=rule)
+        memory.finish_request_tracking(g, request, response)
+        return profiler.finish_request_profile(g, request, response)
+
     @app.route('/e-portal/api/health', methods=['GET'])
     def health():
         return {'status': 'ok'}, 200
 
+    @app.route('/e-portal/api/metrics', methods=['GET'])
+    def metrics_endpoint():
+        # Shared secret required; with no METRICS_TOKEN configured the
+        # endpoint does not exist, so route / DB timings are never public
+        expected = app.config.get('METRICS_TOKEN')
+        if not expected:
+            return {'error': 'Not found'}, 404
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not (hmac.compare_digest(supplied, expected)
+                or hmac.compare_digest(request.args.get('token', ''), expected)):
+            return {'error': 'Not found'}, 404
+        return Response(metrics.render_latest(), content_type=metrics.CONTENT_TYPE)
+
     @app.errorhandler(404)
     def handle_404(e):
-        try:
-            from database import Database
-            Database.execute_update("INSERT INTO error_logs (error_type, message, path) VALUES (%s, %s, %s)", ('404', 'Page Not Found', request.path))
-        except:
-            pass
+        from utils.error_recorder import record_error
+        record_error('404', request.path, 'Page Not Found')
         return {'error': 'Not found'}, 404
 
     @app.errorhandler(500)
     def handle_500(e):
-        try:
-            from database import Database
-            Database.execute_update("INSERT INTO error_logs (error_type, message, path) VALUES (%s, %s, %s)", ('500', str(e), request.path))
-        except:
-            pass
+        from utils.error_recorder import record_error
+        rule = request.url_rule.rule if request.url_rule else None
+        record_error('500', request.path, str(e), rule=rule)
         return {'error': 'Internal server error'}, 500
 
     return app
@@ -6,114 +6,215 @@ Started automatically when the Flask app boots (see app.py).
 Uses only stdlib threading — no extra dependencies required.
 
 Schedule:
-  - Every 5 minutes: requery all 'pending' / 'requery_error' transactions
-    that are <= 24 hours old.
-  - Logs a WARNING for any transaction pending > STALE_THRESHOLD_MINUTES.
+  - Every minute: requery the 'pending' / 'requery_error' transactions
+    (<= 24 hours old) whose next_requery_at is due, oldest-due first, at
+    most Config.REQUERY_BATCH_LIMIT per run.
+  - Each requery reschedules the row with exponential backoff by
+    requery_count and response class (see payment_status.REQUERY_BACKOFF),
+    so Interswitch traffic follows what is due, not the backlog size.
+  - Expires every unresolved transaction older than STALE_THRESHOLD_MINUTES
+    in batches of Config.REQUERY_EXPIRE_BATCH (payment_status.expire_stale_pending).
+    Expired rows are final: a bank transfer confirmed later is not settled.
   - Marks 'failed' only after requery_count reaches FAIL_AFTER_REQUERIES.
+
+Leader election: every gunicorn worker on every node starts this thread, but
+only the holder of the 'payment-requery' lease (utils/leader_lease.py) runs
+the loop; the others wait and take over within REQUERY_LEASE_TTL_SECONDS if
+the leader dies.  A run can last longer than the TTL, so the lease is
+re-checked before every write-back; a leader that lost it mid-run stops
+writing and leaves the rest to its successor.  requery_leader_status()
+reports who holds it.
+
+Requeries run concurrently (Config.REQUERY_CONCURRENCY threads) under a
+global Config.REQUERY_RATE_PER_SECOND limit and a per-run deadline
+(Config.REQUERY_RUN_DEADLINE_SECONDS).  Only the HTTP calls are concurrent:
+results are written back to the DB from the calling thread, in the same
+next_requery_at order the rows were fetched.  Successful payments are settled
+one by one; everything else is queued on a RequeryWriteBatch and written with
+one multi-row UPDATE per Config.REQUERY_WRITE_BATCH rows.  Rows not started before
+the deadline are left untouched for the next run.
 """
 
 import threading
 import time
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger('payment_requery')
 logger.setLevel(logging.INFO)
 
-# ── How often to run (seconds) ────────────────────────────────────────────────
-POLL_INTERVAL_SECONDS = 5 * 60   # 5 minutes
-
 # ── Imported lazily inside the worker so we don't import at module load time ──
 _started = False
 _lock    = threading.Lock()
+_lease   = None     # LeaderLease, when Config.REQUERY_LEADER_ELECTION is on
+
+_DEFERRED = object()   # requery not attempted before the run deadline
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Concurrent requery engine
+# ─────────────────────────────────────────────────────────────────────────────
+
+def requery_concurrently(items, requery, concurrency: int, rate_per_second: float,
+                         deadline_seconds: float, keep_going=None):
+    """
+    Run `requery(item)` for every item on a bounded thread pool and yield
+    (item, response, error) in the original order of `items`.
+
+    response is _DEFERRED when the item could not be started before the
+    deadline, or once keep_going() (optional) returns False; error is the
+    exception raised by `requery`, if any.  Yielding
+    in order lets the caller write results back sequentially while later
+    requeries are still in flight.
+    """
+    from utils.rate_limit import TokenBucket
+
+    deadline = time.monotonic() + deadline_seconds
+    bucket   = TokenBucket(rate_per_second)
+
+    def _task(item):
+        if time.monotonic() >= deadline or (keep_going is not None and not keep_going()):
+            return _DEFERRED, None
+        if not bucket.acquire(deadline):
+            return _DEFERRED, None
+        try:
+            return requery(item), None
+        except Exception as exc:
+            return None, exc
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='requery') as pool:
+        futures = [pool.submit(_task, item) for item in items]
+        for item, future in zip(items, futures):
+            response, error = future.result()
+            yield item, response, error
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Core requery logic (also imported by the manual script)
 # ─────────────────────────────────────────────────────────────────────────────
 
-def requery_all_pending(dry_run: bool = False) -> dict:
+def requery_all_pending(dry_run: bool = False, is_leader=None) -> dict:
     """
     Fetch all unresolved transactions and requery each one.
 
+    is_leader: optional callable (LeaderLease.is_leader).  A run can outlast
+    the lease TTL, so it is checked before expiring, before every write-back
+    and before the final flush; once it returns False the run stops writing,
+    leaving the remaining rows (counted in `abandoned`) to the new leader.
+
     Returns a summary dict: {total, resolved_success, resolved_failed,
-                              still_pending, errors, stale_alerts}.
+                              still_pending, errors, gateway_unavailable,
+                              expired, deferred, abandoned, requeried,
+                              elapsed_seconds, requeries_per_second}.
+    resolved_failed includes the `expired` stale rows.
     """
+    from config import Config
     from database import Database
-    from utils.interswitch import InterswitchClient
+    from utils.interswitch import InterswitchClient, GatewayUnavailable
     from utils.payment_status import (
         classify_response,
-        apply_downstream_success,
-        build_update_sql_params,
-        generate_receipt_no,
-        FAIL_AFTER_REQUERIES,
-        STALE_THRESHOLD_MINUTES,
+        ensure_requery_schedule,
+        expire_stale_pending,
+        RequeryWriteBatch,
     )
 
     summary = dict(total=0, resolved_success=0, resolved_failed=0,
-                   still_pending=0, errors=0, stale_alerts=0)
+                   still_pending=0, errors=0, gateway_unavailable=0, expired=0, deferred=0,
+                   abandoned=0, requeried=0, elapsed_seconds=0.0, requeries_per_second=0.0)
+    run_started = time.perf_counter()
+
+    def still_leader():
+        return is_leader is None or is_leader()
+
+    if not ensure_requery_schedule():
+        logger.error('[requery_worker] next_requery_at column unavailable, skipping run')
+        return summary
 
-    pending = Database.execute_query(
+    # ── Expire stale rows in batches; everything due is requeried ────────────
+    if not still_leader():
+        return summary
+    try:
+        summary['expired'] = expire_stale_pending(dry_run=dry_run)
+    except Exception as exc:
+        logger.error(f'[requery_worker] Could not expire stale transactions: {exc}')
+    summary['resolved_failed'] += summary['expired']
+    if summary['expired']:
+        logger.warning(f'[requery_worker] Expired {summary["expired"]} stale pending transaction(s)')
+
+    # "Due now" — served by idx_payment_transactions_due
+    to_requery = Database.execute_query(
         """SELECT id, reference_no, receipt_no, amount_in_kobo, amount,
                   tran_type, user_id,
-                  COALESCE(requery_count, 0)  AS requery_count,
-                  EXTRACT(EPOCH FROM (NOW() - created_at)) / 60 AS age_minutes
+                  COALESCE(requery_count, 0)  AS requery_count
            FROM payment_transactions
            WHERE tran_status IN ('pending', 'requery_error')
+             AND next_requery_at <= NOW()
              AND created_at >= NOW() - INTERVAL '24 hours'
-           ORDER BY created_at ASC"""
+           ORDER BY next_requery_at ASC
+           LIMIT %s""",
+        (Config.REQUERY_BATCH_LIMIT,)
     )
 
-    if not pending:
+    summary['total'] = summary['expired'] + len(to_requery or [])
+    if not to_requery:
         return summary
 
-    summary['total'] = len(pending)
+    # Fetch the OAuth token once up front instead of racing for it in every thread
+    try:
+        InterswitchClient._get_token()
+    except Exception as exc:
+        logger.error(f'[requery_worker] Could not fetch Interswitch token: {exc}')
 
-    for txn in pending:
+    def _requery(txn):
+        amount_kobo = txn['amount_in_kobo'] or int(float(txn['amount'] or 0) * 100)
+        return InterswitchClient.requery_transaction(txn['reference_no'], amount_kobo)
+
+    results = requery_concurrently(
+        to_requery, _requery,
+        concurrency=Config.REQUERY_CONCURRENCY,
+        rate_per_second=Config.REQUERY_RATE_PER_SECOND,
+        deadline_seconds=Config.REQUERY_RUN_DEADLINE_SECONDS,
+        keep_going=still_leader,
+    )
+
+    # ── Ordered write-back (this thread only) ────────────────────────────────
+    writer = RequeryWriteBatch(Config.REQUERY_WRITE_BATCH)
+    leading = True
+    for txn, isw_resp, exc in results:
         ref           = txn['reference_no']
-        amount_kobo   = txn['amount_in_kobo'] or int(float(txn['amount'] or 0) * 100)
         requery_count = int(txn['requery_count'])
-        age_minutes   = float(txn['age_minutes'] or 0)
-        payment_type  = txn['tran_type']
-        user_id       = txn['user_id']
 
-        
-        if age_minutes > STALE_THRESHOLD_MINUTES:
-            if not dry_run:
-                Database.execute_update(
-                    """UPDATE payment_transactions
-                       SET tran_status = 'failed',
-                           response_description = 'Transaction expired (stale pending)',
-                           updated_at = NOW()
-                       WHERE reference_no = %s""",
-                    (ref,)
-                )
-            summary['resolved_failed'] += 1
+        # Lost the lease mid-run: another process may already be writing these
+        # rows; drop the queued batch and leave the rest for it
+        if leading and not dry_run and not still_leader():
+            leading = False
+            summary['abandoned'] += len(writer)
+            writer.clear()
+        if not leading:
+            summary['abandoned'] += 1
             continue
 
-        # ── Requery Interswitch ───────────────────────────────────────────────
-        try:
-            isw_resp = InterswitchClient.requery_transaction(ref, amount_kobo)
-        except Exception as exc:
-            logger.error(f'[requery_worker] Requery network error for {ref}: {exc}')
+        if isw_resp is _DEFERRED:
+            summary['deferred'] += 1
+            continue
+        summary['requeried'] += 1
+
+        # ── Requery outcome ───────────────────────────────────────────────────
+        if exc is not None:
+            if isinstance(exc, GatewayUnavailable):
+                # Circuit open: rejected without a call; one summary line, not one per row
+                summary['gateway_unavailable'] += 1
+            else:
+                logger.error(f'[requery_worker] Requery network error for {ref}: {exc}')
             if not dry_run:
-                Database.execute_update(
-                    """UPDATE payment_transactions
-                       SET tran_status    = 'requery_error',
-                           requery_count  = COALESCE(requery_count, 0) + 1,
-                           updated_at     = NOW()
-                       WHERE reference_no = %s""",
-                    (ref,)
-                )
+                writer.add_error(ref)
             summary['errors'] += 1
             continue
 
-        response_code = str(isw_resp.get('ResponseCode', '')).strip()
-        response_desc = isw_resp.get('ResponseDescription', '')
-        tran_status   = classify_response(response_code, requery_count, response_desc)
-
-
         if dry_run:
+            response_code = str(isw_resp.get('ResponseCode', '')).strip()
+            tran_status   = classify_response(response_code, requery_count, isw_resp.get('ResponseDescription', ''))
             if tran_status == 'pending':
                 summary['still_pending'] += 1
             elif tran_status == 'successful':
@@ -122,42 +223,94 @@ def requery_all_pending(dry_run: bool = False) -> dict:
                 summary['resolved_failed'] += 1
             continue
 
-        # ── Write to DB ───────────────────────────────────────────────────────
-        if tran_status == 'successful':
-            from utils.payment_status import atomic_settle_payment
-            settled = atomic_settle_payment(ref, user_id, payment_type)
-        else:
-            settled = False
+        write_requery_result(txn, isw_resp, summary, writer=writer)
+
+    if leading and still_leader():
+        writer.flush()
+    elif leading:
+        summary['abandoned'] += len(writer)
+        leading = False
+
+    elapsed = time.perf_counter() - run_started
+    summary['elapsed_seconds']      = round(elapsed, 3)
+    summary['requeries_per_second'] = round(summary['requeried'] / elapsed, 2) if elapsed > 0 else 0.0
+    if summary['gateway_unavailable']:
+        logger.warning(f'[requery_worker] Interswitch circuit open, {summary["gateway_unavailable"]} '
+                       f'transaction(s) marked requery_error for retry')
+    if summary['deferred']:
+        logger.warning(f'[requery_worker] Deadline reached, {summary["deferred"]} transaction(s) deferred to next run')
+    if not leading:
+        logger.warning(f'[requery_worker] Lost the requery lease mid-run, {summary["abandoned"]} '
+                       f'result(s) left for the new leader')
+    logger.info(f'[requery_worker] Run complete: {summary}')
+    return summary
+
+
+def write_requery_result(txn: dict, isw_resp: dict, summary: dict, writer=None) -> str:
+    """
+    Classify one requery response and write it back: the worker's per-row
+    step.  Successful payments are claimed and settled in one DB transaction
+    (atomic_settle_payment).  Other outcomes are queued on `writer` (a
+    RequeryWriteBatch) when given, else written straight away.  Updates
+    `summary` counts; returns tran_status.
+    """
+    from database import Database
+    from utils.payment_status import (
+        classify_response,
+        atomic_settle_payment,
+        build_update_sql_params,
+        generate_receipt_no,
+        SettlementFailed,
+    )
+
+    ref           = txn['reference_no']
+    amount_kobo   = txn['amount_in_kobo'] or int(float(txn['amount'] or 0) * 100)
+    requery_count = int(txn['requery_count'])
+    payment_type  = txn['tran_type']
+    user_id       = txn['user_id']
 
+    response_code = str(isw_resp.get('ResponseCode', '')).strip()
+    response_desc = isw_resp.get('ResponseDescription', '')
+    tran_status   = classify_response(response_code, requery_count, response_desc)
+
+    # ── Write to DB ───────────────────────────────────────────────────────────
+    if tran_status != 'successful' and writer is not None:
+        writer.add_result(tran_status, ref, response_code, response_desc, isw_resp, amount_kobo)
+    else:
         receipt_no = txn['receipt_no'] or (generate_receipt_no(payment_type=payment_type) if tran_status == 'successful' else None)
         sql, params = build_update_sql_params(
             tran_status, ref, response_code, response_desc,
             isw_resp, amount_kobo, receipt_no,
         )
-        Database.execute_update(sql, params)
 
-        if tran_status == 'successful':
-            if settled:
-                logger.info(
-                    f'[requery_worker] SUCCESS: {ref} | type={payment_type} | user={user_id}'
-                )
-                summary['resolved_success'] += 1
-            else:
-                logger.info(f'[requery_worker] Already settled by another handler: {ref}')
-                summary['resolved_success'] += 1
-
-        elif tran_status == 'failed':
-            logger.warning(
-                f'[requery_worker] FAILED: {ref} | code={response_code} | '
-                f'requery_count={requery_count + 1}'
+    if tran_status == 'successful':
+        try:
+            settled = atomic_settle_payment(ref, user_id, payment_type, final_update=(sql, params))
+        except SettlementFailed as exc:
+            logger.error(f'[requery_worker] Settlement failed for {ref}, will retry: {exc}')
+            summary['errors'] += 1
+            return 'requery_error'
+        if settled:
+            logger.info(
+                f'[requery_worker] SUCCESS: {ref} | type={payment_type} | user={user_id}'
             )
-            summary['resolved_failed'] += 1
-
-        else:  
-            summary['still_pending'] += 1
+        else:
+            Database.execute_update(sql, params)
+            logger.info(f'[requery_worker] Already settled by another handler: {ref}')
+        summary['resolved_success'] += 1
+        return tran_status
 
-    logger.info(f'[requery_worker] Run complete: {summary}')
-    return summary
+    if writer is None:
+        Database.execute_update(sql, params)
+    if tran_status == 'failed':
+        logger.warning(
+            f'[requery_worker] FAILED: {ref} | code={response_code} | '
+            f'requery_count={requery_count + 1}'
+        )
+        summary['resolved_failed'] += 1
+    else:
+        summary['still_pending'] += 1
+    return tran_status
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -165,19 +318,54 @@ def requery_all_pending(dry_run: bool = False) -> dict:
 # ─────────────────────────────────────────────────────────────────────────────
 
 def _worker_loop():
+    from config import Config
+    from utils import metrics
     while True:
+        if _lease is not None and not _lease.is_leader():
+            # Follower: check again on the heartbeat schedule so a takeover
+            # starts running straight away rather than a poll interval later
+            time.sleep(_lease.ttl_seconds / 3)
+            continue
+        started = time.perf_counter()
         try:
-            requery_all_pending()
+            summary = requery_all_pending(is_leader=_lease.is_leader if _lease is not None else None)
+            metrics.BACKGROUND_RUN_SECONDS.observe(time.perf_counter() - started, worker='payment-requery', outcome='ok')
+            if _lease is not None:
+                _lease.record_run(summary)
         except Exception as exc:
+            metrics.BACKGROUND_RUN_SECONDS.observe(time.perf_counter() - started, worker='payment-requery', outcome='error')
             logger.exception(f'[requery_worker] Unhandled error in worker loop: {exc}')
-        time.sleep(POLL_INTERVAL_SECONDS)
+        time.sleep(Config.REQUERY_POLL_SECONDS)
 
 
 def start_background_worker():
-    global _started
+    global _started, _lease
+    from config import Config
     with _lock:
         if _started:
             return
+        # Read-only check; logs which migration to run if the column is missing
+        from utils.payment_status import ensure_requery_schedule
+        ensure_requery_schedule()
+        if Config.REQUERY_LEADER_ELECTION:
+            from database import MissingTable
+            from utils.leader_lease import LeaderLease, ensure_table
+            try:
+                ensure_table()
+                _lease = LeaderLease('payment-requery', ttl_seconds=Config.REQUERY_LEASE_TTL_SECONDS)
+                _lease.start()
+            except MissingTable as exc:
+                # Every process runs the loop, as without leader election;
+                # settlement claims keep that safe, only requery traffic grows
+                logger.error(f'[requery_worker] Leader election unavailable, running in every process: {exc}')
         thread = threading.Thread(target=_worker_loop, name='payment-requery', daemon=True)
         thread.start()
         _started = True
+
+
+def requery_leader_status() -> dict:
+    """Which process runs the requery loop, cluster-wide (for the system-status readout)."""
+    if _lease is None:
+        from config import Config
+        return {'name': 'payment-requery', 'state': 'disabled' if not Config.REQUERY_LEADER_ELECTION else 'not_started'}
+    return _lease.status()
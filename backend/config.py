@@ -19,14 +19,101 @@ class Config:
 
     # ── Interswitch Payment Gateway ───────────────────────────────────────────
     INTERSWITCH_BASE_URL          = os.getenv('INTERSWITCH_BASE_URL', 'https://sandbox.interswitchng.com')
+    INTERSWITCH_PASSPORT_URL      = os.getenv('INTERSWITCH_PASSPORT_URL', 'https://passport.interswitchng.com')
     INTERSWITCH_CLIENT_ID         = os.getenv('INTERSWITCH_CLIENT_ID', '')
     INTERSWITCH_CLIENT_SECRET     = os.getenv('INTERSWITCH_CLIENT_SECRET', '')
     INTERSWITCH_MERCHANT_CODE     = os.getenv('INTERSWITCH_MERCHANT_CODE', '')
     INTERSWITCH_PAY_ITEM_ID_APP   = os.getenv('INTERSWITCH_PAY_ITEM_ID_APP', '')   # Application fee
     INTERSWITCH_PAY_ITEM_ID_ACC   = os.getenv('INTERSWITCH_PAY_ITEM_ID_ACC', '')   # Acceptance fee
     INTERSWITCH_PAY_ITEM_ID_TUI   = os.getenv('INTERSWITCH_PAY_ITEM_ID_TUI', '')   # Tuition fee
+    INTERSWITCH_CONNECT_TIMEOUT   = float(os.getenv('INTERSWITCH_CONNECT_TIMEOUT', 5))
+    INTERSWITCH_READ_TIMEOUT      = float(os.getenv('INTERSWITCH_READ_TIMEOUT', 30))
+    INTERSWITCH_CONNECT_RETRIES   = int(os.getenv('INTERSWITCH_CONNECT_RETRIES', 2))
+    INTERSWITCH_POOL_SIZE         = int(os.getenv('INTERSWITCH_POOL_SIZE', 10))
+    INTERSWITCH_TOKEN_SHARED      = os.getenv('INTERSWITCH_TOKEN_SHARED', 'true').lower() == 'true'   # share via DB row
+    INTERSWITCH_TOKEN_REFRESH_AHEAD = float(os.getenv('INTERSWITCH_TOKEN_REFRESH_AHEAD', 300))        # 0 = no proactive refresh
+    INTERSWITCH_REQUERY_CACHE_TTL = float(os.getenv('INTERSWITCH_REQUERY_CACHE_TTL', 5))     # seconds; 0 = no cache
+    INTERSWITCH_REQUERY_CACHE_SHARED = os.getenv('INTERSWITCH_REQUERY_CACHE_SHARED', 'false').lower() == 'true'   # share via DB table
+
+    # Circuit breaker around requeries (see utils/circuit_breaker.py)
+    INTERSWITCH_BREAKER_ENABLED        = os.getenv('INTERSWITCH_BREAKER_ENABLED', 'true').lower() == 'true'
+    INTERSWITCH_BREAKER_FAILURE_RATE   = float(os.getenv('INTERSWITCH_BREAKER_FAILURE_RATE', 0.5))
+    INTERSWITCH_BREAKER_SLOW_SECONDS   = float(os.getenv('INTERSWITCH_BREAKER_SLOW_SECONDS', 10))
+    INTERSWITCH_BREAKER_SLOW_RATE      = float(os.getenv('INTERSWITCH_BREAKER_SLOW_RATE', 0.8))
+    INTERSWITCH_BREAKER_MIN_CALLS      = int(os.getenv('INTERSWITCH_BREAKER_MIN_CALLS', 10))
+    INTERSWITCH_BREAKER_WINDOW_SECONDS = float(os.getenv('INTERSWITCH_BREAKER_WINDOW_SECONDS', 60))
+    INTERSWITCH_BREAKER_OPEN_SECONDS   = float(os.getenv('INTERSWITCH_BREAKER_OPEN_SECONDS', 30))
+    INTERSWITCH_BREAKER_PROBES         = int(os.getenv('INTERSWITCH_BREAKER_PROBES', 3))
     FRONTEND_BASE_URL             = os.getenv('FRONTEND_BASE_URL') or os.getenv('NEXT_PUBLIC_APP_URL') or 'http://localhost:3000'
 
+    # Background requery engine (see background_requery.py)
+    REQUERY_POLL_SECONDS          = float(os.getenv('REQUERY_POLL_SECONDS', 60))       # cheap: each run reads due rows via a partial index
+    REQUERY_BATCH_LIMIT           = int(os.getenv('REQUERY_BATCH_LIMIT', 500))         # rows requeried per run
+    REQUERY_WRITE_BATCH           = int(os.getenv('REQUERY_WRITE_BATCH', 200))         # rows per multi-row UPDATE
+    REQUERY_EXPIRE_BATCH          = int(os.getenv('REQUERY_EXPIRE_BATCH', 1000))       # stale rows expired per UPDATE
+    REQUERY_CONCURRENCY           = int(os.getenv('REQUERY_CONCURRENCY', 8))
+    REQUERY_RATE_PER_SECOND       = float(os.getenv('REQUERY_RATE_PER_SECOND', 10))    # 0 = unlimited
+    REQUERY_RUN_DEADLINE_SECONDS  = float(os.getenv('REQUERY_RUN_DEADLINE_SECONDS', 240))
+    REQUERY_LEADER_ELECTION       = os.getenv('REQUERY_LEADER_ELECTION', 'true').lower() == 'true'   # one runner cluster-wide
+    REQUERY_LEASE_TTL_SECONDS     = float(os.getenv('REQUERY_LEASE_TTL_SECONDS', 30))   # failover within ~TTL + TTL/3
+
+    # Payment callback: 'inline' requeries before redirecting, 'deferred' hands
+    # verification to a background executor (see utils/payment_verifier.py)
+    PAYMENT_CALLBACK_MODE            = os.getenv('PAYMENT_CALLBACK_MODE', 'inline').lower()
+    PAYMENT_VERIFY_WORKERS           = int(os.getenv('PAYMENT_VERIFY_WORKERS', 4))
+    PAYMENT_STATUS_MAX_WAIT_SECONDS  = float(os.getenv('PAYMENT_STATUS_MAX_WAIT_SECONDS', 20))
+    GUNICORN_THREADS                 = int(os.getenv('GUNICORN_THREADS', 1))   # same var as gunicorn.conf.py; 1 = sync worker, no long-polls
+
+    # Repeat initiate_payment calls (see routes/applicant.initiate_payment)
+    PAYMENT_INITIATE_REUSE_SECONDS       = float(os.getenv('PAYMENT_INITIATE_REUSE_SECONDS', 600))     # reuse a pending row this young
+    PAYMENT_IDEMPOTENCY_KEY_TTL_SECONDS  = float(os.getenv('PAYMENT_IDEMPOTENCY_KEY_TTL_SECONDS', 86400))
+
+    # Cached fee configuration (see utils/fee_matrix.py)
+    FEE_MATRIX_CHECK_SECONDS      = float(os.getenv('FEE_MATRIX_CHECK_SECONDS', 5))     # how often to compare the version row
+    FEE_MATRIX_FALLBACK_TTL       = float(os.getenv('FEE_MATRIX_FALLBACK_TTL', 300))    # reload interval until migration_add_fee_matrix_version.sql has run
+
+    # Daily revenue / funnel rollups (see utils/payment_rollup.py)
+    PAYMENT_ROLLUP_ENABLED         = os.getenv('PAYMENT_ROLLUP_ENABLED', 'true').lower() == 'true'
+    PAYMENT_ROLLUP_REFRESH_SECONDS = float(os.getenv('PAYMENT_ROLLUP_REFRESH_SECONDS', 60))
+    PAYMENT_ROLLUP_TRAILING_DAYS   = int(os.getenv('PAYMENT_ROLLUP_TRAILING_DAYS', 3))     # always recomputed, catches non-settlement changes
+
+    # Failed / cancelled payment archive (see utils/payment_archive.py)
+    PAYMENT_ARCHIVE_ENABLED          = os.getenv('PAYMENT_ARCHIVE_ENABLED', 'true').lower() == 'true'
+    PAYMENT_ARCHIVE_AFTER_DAYS       = float(os.getenv('PAYMENT_ARCHIVE_AFTER_DAYS', 90))    # since the row last changed
+    PAYMENT_ARCHIVE_BATCH_SIZE       = int(os.getenv('PAYMENT_ARCHIVE_BATCH_SIZE', 5000))
+    PAYMENT_ARCHIVE_INTERVAL_SECONDS = float(os.getenv('PAYMENT_ARCHIVE_INTERVAL_SECONDS', 3600))
+
+    # Webhook inbox (see webhook_inbox.py)
+    WEBHOOK_INBOX_ENABLED         = os.getenv('WEBHOOK_INBOX_ENABLED', 'true').lower() == 'true'
+    WEBHOOK_WORKERS               = int(os.getenv('WEBHOOK_WORKERS', 2))
+    WEBHOOK_POLL_SECONDS          = float(os.getenv('WEBHOOK_POLL_SECONDS', 2))
+    WEBHOOK_MAX_BODY_BYTES        = int(os.getenv('WEBHOOK_MAX_BODY_BYTES', 16384))   # larger bodies get 413
+    WEBHOOK_INBOX_RETENTION_DAYS  = float(os.getenv('WEBHOOK_INBOX_RETENTION_DAYS', 7))  # 'done' rows older than this are purged
+
+    # ── Observability ─────────────────────────────────────────────────────────
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')   # empty = /metrics disabled (404)
+
+    # Error recording (see utils/error_recorder.py)
+    ERROR_LOG_FLUSH_SECONDS   = float(os.getenv('ERROR_LOG_FLUSH_SECONDS', 30))
+    ERROR_LOG_SAMPLE_RATE_404 = float(os.getenv('ERROR_LOG_SAMPLE_RATE_404', 0.01))
+    ERROR_LOG_SAMPLE_RATE_500 = float(os.getenv('ERROR_LOG_SAMPLE_RATE_500', 1.0))
+
+    # On-demand request profiling (see utils/profiler.py)
+    PROFILE_ENABLED     = os.getenv('PROFILE_ENABLED', 'true').lower() == 'true'
+    PROFILE_DIR         = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+
+    # Endpoints whose RSS before/after is logged (see utils/memory.py)
+    MEMORY_TRACKED_ENDPOINTS = {s.strip() for s in os.getenv(
+        'MEMORY_TRACKED_ENDPOINTS',
+        'pgdean.print_application,pgadmin.print_application,ptadmin.print_application,'
+        'pgadmin.send_pg_department_letters,applicant.scan_document_endpoint,applicant.get_payment_receipt',
+    ).split(',') if s.strip()}
+
+    # ── Worker warmup (see warmup.py) ─────────────────────────────────────────
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_STEPS   = [s.strip() for s in os.getenv('WARMUP_STEPS', 'db_pool,fee_matrix,interswitch_token,pdf_templates').split(',') if s.strip()]
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -1,15 +1,46 @@
 import os
+import time
+import threading
+import uuid
 import psycopg2
 import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 from contextlib import contextmanager
 from dotenv import load_dotenv
+from utils import metrics
 
 load_dotenv()
 
 # Errors that indicate a stale/dropped connection (not a query logic error)
 _CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
 
+# Pool sizing (per worker process)
+POOL_MINCONN = int(os.getenv("DB_POOL_MINCONN", 2))
+POOL_MAXCONN = int(os.getenv("DB_POOL_MAXCONN", 10))
+
+# Transaction pinned to the current thread by Database.transaction()
+_local = threading.local()
+
+
+class TransactionAborted(Exception):
+    """A statement inside Database.transaction() failed; everything was rolled back."""
+
+
+class MissingTable(RuntimeError):
+    """A table a feature relies on does not exist yet; its migration has not been run."""
+
+
+class _Transaction:
+    __slots__ = ("cursor", "error")
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.error  = None
+
+
+def _current_transaction():
+    return getattr(_local, "transaction", None)
+
 
 class Database:
     _pool = None
@@ -19,9 +50,10 @@ class Database:
         if cls._pool is None:
             ssl_mode = os.getenv("DATABASE_SSL_MODE", "require")
             dsn = os.getenv("DATABASE_URL")
+            metrics.DB_POOL_MAX.set(POOL_MAXCONN)
             cls._pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=2,
-                maxconn=10,
+                minconn=POOL_MINCONN,
+                maxconn=POOL_MAXCONN,
                 dsn=dsn,
                 cursor_factory=RealDictCursor,
                 keepalives=1,
@@ -42,12 +74,37 @@ class Database:
             pass
         cls._pool = None
 
+    @classmethod
+    def warm_pool(cls) -> int:
+        """
+        Check out ``minconn`` connections, ping each one and hand them back so
+        the TCP + TLS handshakes to Neon are paid before the first request.
+        Returns the number of connections that answered.
+        """
+        conns = []
+        try:
+            for _ in range(POOL_MINCONN):
+                conn = cls.get_connection()
+                if conn is None:
+                    break
+                conns.append(conn)
+            for conn in conns:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            return len(conns)
+        finally:
+            for conn in conns:
+                cls.release_connection(conn)
+
     @classmethod
     def get_connection(cls):
         """Get a validated connection from the pool."""
+        started = time.perf_counter()
         try:
             conn = cls._get_pool().getconn()
             if conn is None:
+                metrics.DB_POOL_ERRORS.inc()
                 return None
 
             # Discard connections that Neon has already closed on its side
@@ -59,23 +116,62 @@ class Database:
                 cls._reset_pool()
                 conn = cls._get_pool().getconn()
 
+            metrics.DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+            metrics.DB_POOL_IN_USE.inc()
             return conn
         except psycopg2.Error as e:
+            metrics.DB_POOL_ERRORS.inc()
             print(f"Database connection error: {e}")
             return None
 
     @classmethod
-    def release_connection(cls, conn):
-        """Return a connection to the pool."""
+    def release_connection(cls, conn, close=False):
+        """Return a connection to the pool (or discard it when close=True)."""
+        metrics.DB_POOL_IN_USE.dec()
         try:
-            cls._get_pool().putconn(conn)
+            cls._get_pool().putconn(conn, close=close)
         except Exception:
             pass
 
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """
+        Run every Database call made on this thread inside one transaction on
+        one connection: get_cursor / execute_query / execute_update all reuse
+        the pinned cursor and nothing is committed until the block exits.
+
+        execute_query / execute_update keep their "log and return None/False"
+        behaviour, but a failed statement poisons the transaction: later
+        calls are skipped and the block raises TransactionAborted after
+        rolling back.  Nested transaction() blocks join the outer one.
+        """
+        if _current_transaction() is not None:
+            yield _current_transaction().cursor
+            return
+        with Database.get_cursor() as cursor:
+            tx = _local.transaction = _Transaction(cursor)
+            try:
+                yield cursor
+                if tx.error is not None:
+                    raise TransactionAborted(str(tx.error)) from tx.error
+            finally:
+                _local.transaction = None
+
     @staticmethod
     @contextmanager
     def get_cursor():
         """Context manager: yields a cursor; commits or rolls back; returns conn to pool."""
+        tx = _current_transaction()
+        if tx is not None:
+            # Inside Database.transaction(): share its cursor, commit happens there
+            try:
+                yield tx.cursor
+            except Exception as e:
+                tx.error = tx.error or e
+                raise
+            return
+
         conn = Database.get_connection()
         if not conn:
             raise Exception("Failed to connect to database")
@@ -93,11 +189,8 @@ class Database:
                 conn.rollback()
             except Exception:
                 pass
-            try:
-                Database._get_pool().putconn(conn, close=True)
-                returned = True
-            except Exception:
-                pass
+            Database.release_connection(conn, close=True)
+            returned = True
             Database._reset_pool()
             raise e
         except Exception as e:
@@ -118,13 +211,17 @@ class Database:
     @staticmethod
     def execute_query(query, params=None):
         """Execute a SELECT query and return all rows. Retries once on connection error."""
+        tx = _current_transaction()
+        if tx is not None and tx.error is not None:
+            return None   # transaction already failed; it will be rolled back
         for attempt in range(2):
+            started = time.perf_counter()
             try:
                 with Database.get_cursor() as cursor:
                     cursor.execute(query, params or ())
                     return cursor.fetchall()
             except _CONNECTION_ERRORS as e:
-                if attempt == 0:
+                if attempt == 0 and tx is None:
                     print(f"[DB] Stale connection, retrying query... ({e})")
                     continue
                 print(f"Query execution error: {e}")
@@ -132,11 +229,68 @@ class Database:
             except psycopg2.Error as e:
                 print(f"Query execution error: {e}")
                 return None
+            finally:
+                metrics.record_db_time('query', time.perf_counter() - started, query)
+
+    @staticmethod
+    def iter_query(query, params=None, batch_size=2000):
+        """
+        Yield the rows of a large SELECT through a server-side (named) cursor,
+        batch_size rows per round trip, so memory stays flat however many rows
+        match.  Holds its own connection while the generator is alive; exhaust
+        or close() it to hand the connection back.  Unlike execute_query,
+        errors are raised — a half-sent export must not end silently.
+        """
+        conn = Database.get_connection()
+        if not conn:
+            raise Exception("Failed to connect to database")
+        started = time.perf_counter()
+        stale = False
+        try:
+            with conn.cursor(name=f"iter_{uuid.uuid4().hex[:12]}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params or ())
+                for row in cursor:
+                    yield row
+        except _CONNECTION_ERRORS:
+            stale = True
+            raise
+        finally:
+            metrics.record_db_time('query', time.perf_counter() - started, query)
+            if not stale:
+                try:
+                    conn.rollback()   # read-only; ends the cursor's transaction
+                except Exception:
+                    stale = True
+            Database.release_connection(conn, close=stale)
+            if stale:
+                Database._reset_pool()
+
+    @staticmethod
+    def require_tables(migration, *tables):
+        """
+        Raise MissingTable unless every one of `tables` exists.  Read-only:
+        schema changes live in scripts/migration_*.sql, never in app code.
+        """
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                'SELECT t FROM unnest(%s::text[]) AS t WHERE to_regclass(t) IS NULL',
+                (list(tables),)
+            )
+            missing = [r['t'] for r in cursor.fetchall()]
+        if missing:
+            raise MissingTable(
+                f"Missing table(s) {', '.join(missing)}: run scripts/{migration}"
+            )
 
     @staticmethod
     def execute_update(query, params=None, return_id=False):
         """Execute INSERT / UPDATE / DELETE. Retries once on connection error."""
+        tx = _current_transaction()
+        if tx is not None and tx.error is not None:
+            return None if return_id else False
         for attempt in range(2):
+            started = time.perf_counter()
             try:
                 with Database.get_cursor() as cursor:
                     cursor.execute(query, params or ())
@@ -147,11 +301,13 @@ class Database:
                         return None
                     return True
             except _CONNECTION_ERRORS as e:
-                if attempt == 0:
+                if attempt == 0 and tx is None:
                     print(f"[DB] Stale connection, retrying update... ({e})")
                     continue
                 print(f"Update execution error: {e}")
                 return False
             except psycopg2.Error as e:
                 print(f"Update execution error: {e}")
-                return False
\ No newline at end of file
+                return False
+            finally:
+                metrics.record_db_time('update', time.perf_counter() - started, query)
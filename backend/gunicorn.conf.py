@@ -0,0 +1,34 @@
+"""
+gunicorn.conf.py — picked up automatically by `gunicorn app:app` when run
+from backend/ (see Procfile / render.yaml).
+
+Workers are recycled after GUNICORN_MAX_REQUESTS requests, plus a random
+0..GUNICORN_MAX_REQUESTS_JITTER so they do not all restart at once.  This
+caps the slow RSS growth from the PDF / image endpoints; set
+GUNICORN_MAX_REQUESTS=0 to disable recycling.
+
+GUNICORN_THREADS defaults to 1 (the sync worker, as before).  Setting it
+above 1 switches gunicorn to the gthread worker, so a payment-status
+long-poll (applicant.payment_status) waits on a thread instead of blocking
+a whole worker process; opt in per deployment.  With the sync worker the
+status endpoint answers at once (no long-poll) and the /verifying page
+short-polls, so PAYMENT_CALLBACK_MODE=deferred never parks a worker.
+"""
+
+import os
+
+threads             = int(os.getenv('GUNICORN_THREADS', 1))
+max_requests        = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+
+def worker_exit(server, worker):
+    # Log how big the worker got before it was recycled
+    try:
+        from utils.memory import current_rss_bytes, peak_rss_bytes
+        server.log.info(
+            f'[memory] worker pid={worker.pid} exiting after {worker.nr} request(s): '
+            f'rss={current_rss_bytes() / 1048576:.1f}MB peak={peak_rss_bytes() / 1048576:.1f}MB'
+        )
+    except Exception:
+        pass
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, Response
 from database import Database
 from utils.auth import AuthHandler
+from utils.fee_matrix import invalidate as invalidate_fee_matrix
 from datetime import datetime
 from email_utils import send_email
 from utils.pdf_generator import PDFGenerator
@@ -1856,6 +1857,7 @@ def update_program(payload, program_id):
             f"UPDATE program_setup SET {', '.join(updates)}, updated_at = NOW() WHERE id = %s",
             tuple(params)
         )
+        invalidate_fee_matrix()
         return jsonify({'message': 'Program updated successfully'}), 200
     except Exception as e:
         return jsonify({'message': f'Error updating program: {e}'}), 500
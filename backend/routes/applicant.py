@@ -7,20 +7,19 @@ from utils.scanner import scan_document, ScannerError
 from utils.pdf_generator import PDFGenerator
 from utils.payment_receipt_generator import PaymentReceiptGenerator
 from utils.medical_form_generator import MedicalFormGenerator
-from utils.interswitch import InterswitchClient
+from utils.interswitch import InterswitchClient, GatewayUnavailable
+from utils.fee_matrix import get_fee_matrix
+from utils import session_ledger, metrics
 from utils.payment_status import (
-    classify_response,
     apply_downstream_success,
-    atomic_settle_payment,
-    build_update_sql_params,
-    generate_receipt_no,
+    generate_form_no,
+    mark_requery_error,
 )
 from config import Config
 from datetime import datetime, date
 import os
 import uuid
 import secrets
-import string
 import json
 import copy
 
@@ -69,27 +68,6 @@ def generate_reference_no() -> str:
     return f"REF-{date.today().strftime('%Y%m%d')}-{secrets.token_hex(8).upper()}"
 
 
-
-
-def _prog_code(pt_id) -> str:
-    """Return a short uppercase code for a program_type (e.g. UTME, PG, DE)."""
-    res  = Database.execute_query('SELECT name FROM program_types WHERE id = %s', (pt_id,))
-    name = (res[0]['name'] if res else '').upper()
-    TYPE_MAP = {
-        'UTME':         'UTME',
-        'POSTGRADUATE': 'PG',
-        'DIRECT':       'DE',
-        'JUPEB':        'JUP',
-        'PART':         'PT',
-        'HND':          'HND',
-    }
-    for key, code in TYPE_MAP.items():
-        if key in name:
-            return code
-    letters = ''.join(c for c in name if c.isalpha())
-    return letters[:4] if letters else 'APP'
-
-
 def _ensure_application_row(user_id, program_type_id, current_session_id, reference_no):
     """
     Create an application row if one doesn't already exist for this user +
@@ -173,13 +151,7 @@ def _ensure_application_row(user_id, program_type_id, current_session_id, refere
 
             return app_id
 
-        year = datetime.now().year
-        code = _prog_code(program_type_id)
-        while True:
-            suffix  = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(4))
-            form_no = f"PCU/{year}/{code}{suffix}"
-            if not Database.execute_query('SELECT uuid FROM pg_application WHERE form_no = %s', (form_no,)):
-                break
+        form_no = generate_form_no(program_type_id)
 
         Database.execute_update(
             '''INSERT INTO pg_application
@@ -237,13 +209,7 @@ def _ensure_application_row(user_id, program_type_id, current_session_id, refere
 
         return app_id
 
-    year = datetime.now().year
-    code = _prog_code(program_type_id)
-    while True:
-        suffix  = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(4))
-        form_no = f"PCU/{year}/{code}{suffix}"
-        if not Database.execute_query('SELECT id FROM applications WHERE form_no = %s', (form_no,)):
-            break
+    form_no = generate_form_no(program_type_id)
 
     level_id = None
     pt_res = Database.execute_query(
@@ -265,98 +231,54 @@ def _ensure_application_row(user_id, program_type_id, current_session_id, refere
     return res[0]['id'] if res else None
 
 
-def _get_applicant_fee_context(user_id):
-    # Try pg_application first
-    pg_res = Database.execute_query(
-        '''SELECT pg.uuid,
-                  pg.finalised_course,
-                  pg.approved_course,
-                  pg.proposed_course AS program_setup_id
-           FROM pg_application pg
-           WHERE pg.user_id = %s AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-           ORDER BY pg.created_date DESC LIMIT 1''',
-        (user_id,)
-    )
-    if pg_res:
-        pg_row = pg_res[0]
-        finalised_course = (pg_row.get('finalised_course') or '').strip()
-        if not finalised_course:
-            finalised_course = (pg_row.get('approved_course') or '').strip()
-        if not finalised_course and pg_row.get('program_setup_id'):
-            ps_res = Database.execute_query(
-                'SELECT name FROM pg_program_setup WHERE id = %s',
-                (pg_row['program_setup_id'],)
-            )
-            if ps_res:
-                finalised_course = ps_res[0]['name']
-
-        if not finalised_course:
-            raise ValueError('finalised_course is required to resolve faculty and fees')
-
-        faculty_res = Database.execute_query(
-            '''SELECT faculty_id
-               FROM pg_program_setup
-               WHERE LOWER(name) = LOWER(%s)
-               LIMIT 1''',
-            (finalised_course,)
-        )
-        if not faculty_res or faculty_res[0].get('faculty_id') is None:
-            raise ValueError(f"No faculty found for finalised_course '{finalised_course}'")
-
-        pt_res = Database.execute_query('SELECT level_id FROM program_types WHERE id = 2')
-        level_id = pt_res[0]['level_id'] if pt_res else None
-
-        return {
-            'program_type': 2,
-            'level': level_id,
-            'faculty_id': faculty_res[0]['faculty_id'],
-            'finalised_course': finalised_course,
-        }
-
-    app_res = Database.execute_query(
-        '''SELECT app.prog_type,
-                  pt.level_id,
-                  app.finalised_course,
-                  app.approved_course,
-                  app.program_setup_id
-           FROM applications app
-           JOIN program_types pt ON app.prog_type = pt.id
-           WHERE app.user_id = %s AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-           ORDER BY app.created_at DESC LIMIT 1''',
-        (user_id,)
+def _get_applicant_fee_context(user_id, matrix=None):
+    """
+    Program type, level and faculty that the applicant's fees are keyed by.
+    One query for the applicant's latest admitted PG and UG rows; everything
+    else comes from the cached fee matrix.
+    """
+    matrix = matrix or get_fee_matrix()
+    rows = Database.execute_query(
+        '''(SELECT TRUE AS is_pg, 2 AS prog_type,
+                   pg.finalised_course, pg.approved_course,
+                   pg.proposed_course::text AS program_setup_id
+            FROM pg_application pg
+            WHERE pg.user_id = %s AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
+            ORDER BY pg.created_date DESC LIMIT 1)
+           UNION ALL
+           (SELECT FALSE, app.prog_type,
+                   app.finalised_course, app.approved_course,
+                   app.program_setup_id::text
+            FROM applications app
+            WHERE app.user_id = %s AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
+            ORDER BY app.created_at DESC LIMIT 1)''',
+        (user_id, user_id)
+    ) or []
+    # pg_application wins; a UG row only counts if its program type exists
+    row = next((r for r in rows if r['is_pg']), None) or next(
+        (r for r in rows if r['prog_type'] in matrix.program_levels), None
     )
-    if not app_res:
+    if not row:
         raise ValueError('No admitted or accepted application found for this user')
 
-    app_row = app_res[0]
-    finalised_course = (app_row.get('finalised_course') or '').strip()
+    is_pg = row['is_pg']
+    finalised_course = (row.get('finalised_course') or '').strip()
     if not finalised_course:
-        finalised_course = (app_row.get('approved_course') or '').strip()
-    if not finalised_course and app_row.get('program_setup_id'):
-        ps_res = Database.execute_query(
-            'SELECT name FROM program_setup WHERE id = %s',
-            (app_row['program_setup_id'],)
-        )
-        if ps_res:
-            finalised_course = ps_res[0]['name']
+        finalised_course = (row.get('approved_course') or '').strip()
+    if not finalised_course and row.get('program_setup_id'):
+        finalised_course = matrix.course_name(row['program_setup_id'], postgraduate=is_pg) or ''
 
     if not finalised_course:
         raise ValueError('finalised_course is required to resolve faculty and fees')
 
-    faculty_res = Database.execute_query(
-        '''SELECT faculty_id
-           FROM program_setup
-           WHERE LOWER(name) = LOWER(%s)
-           LIMIT 1''',
-        (finalised_course,)
-    )
-    if not faculty_res or faculty_res[0].get('faculty_id') is None:
+    faculty_id = matrix.faculty_for_course(finalised_course, postgraduate=is_pg)
+    if faculty_id is None:
         raise ValueError(f"No faculty found for finalised_course '{finalised_course}'")
 
     return {
-        'program_type': app_row['prog_type'],
-        'level': app_row['level_id'],
-        'faculty_id': faculty_res[0]['faculty_id'],
+        'program_type': row['prog_type'],
+        'level': matrix.program_levels.get(row['prog_type']),
+        'faculty_id': faculty_id,
         'finalised_course': finalised_course,
     }
 
@@ -366,6 +288,8 @@ def _resolve_fee_amount(payment_type: str, user_id, program_type_id=None, instal
     Resolve the fee amount in Naira for a given payment_type.
     Raises ValueError if it cannot be determined.
     """
+    matrix = get_fee_matrix()
+
     if payment_type == 'application_fee':
         if not program_type_id:
             raise ValueError('program_type_id is required for application_fee')
@@ -376,108 +300,52 @@ def _resolve_fee_amount(payment_type: str, user_id, program_type_id=None, instal
         if not fee_id:
             raise ValueError(f'No fee mapping for program_type_id {program_type_id}')
 
-        res = Database.execute_query('SELECT amount FROM program_fees WHERE id = %s', (fee_id,))
-        if not res:
+        amount = matrix.fee_amounts.get(fee_id)
+        if amount is None:
             raise ValueError(f'Fee record not found for program_fees.id={fee_id}')
-        return float(res[0]['amount'])
+        return amount
 
     if payment_type == 'acceptance_fee':
-        pg_res = Database.execute_query(
-            'SELECT uuid FROM pg_application WHERE user_id = %s ORDER BY created_date DESC LIMIT 1',
-            (user_id,)
-        )
-        if pg_res:
-            prog_type = 2
-        else:
-            app_res = Database.execute_query(
-                'SELECT prog_type FROM applications WHERE user_id = %s ORDER BY created_at DESC LIMIT 1',
-                (user_id,)
-            )
-            if not app_res:
-                raise ValueError('No application found for this user')
-            prog_type = app_res[0]['prog_type']
-
-        fee_res = Database.execute_query(
-            '''SELECT pf.amount
-               FROM program_fees pf
-               JOIN fee_components fc ON fc.id = pf.fee_component_id
-               WHERE LOWER(fc.name) LIKE %s
-                 AND pf.program_type = %s
-                 AND pf.academic_session_id = (
-                     SELECT id FROM academic_sessions WHERE is_active = TRUE LIMIT 1
-                 )
-               LIMIT 1''',
-            ('%acceptance%', str(prog_type))
-        )
-        # Fallback: any acceptance fee for the active session
-        if not fee_res:
-            fee_res = Database.execute_query(
-                '''SELECT pf.amount
-                   FROM program_fees pf
-                   JOIN fee_components fc ON fc.id = pf.fee_component_id
-                   WHERE LOWER(fc.name) LIKE %s
-                     AND pf.academic_session_id = (
-                         SELECT id FROM academic_sessions WHERE is_active = TRUE LIMIT 1
-                     )
-                   LIMIT 1''',
-                ('%acceptance%',)
-            )
-        if not fee_res:
+        res = Database.execute_query(
+            '''SELECT CASE WHEN EXISTS (SELECT 1 FROM pg_application WHERE user_id = %s) THEN 2
+                           ELSE (SELECT prog_type FROM applications
+                                 WHERE user_id = %s ORDER BY created_at DESC LIMIT 1)
+                      END AS prog_type''',
+            (user_id, user_id)
+        )
+        if not res or res[0]['prog_type'] is None:
+            raise ValueError('No application found for this user')
+
+        # Falls back to any acceptance fee for the active session
+        amount = matrix.acceptance_fee(res[0]['prog_type'])
+        if amount is None:
             raise ValueError('Acceptance fee not configured for this program')
-        return float(fee_res[0]['amount'])
+        return amount
 
-    context = _get_applicant_fee_context(user_id)
+    context = _get_applicant_fee_context(user_id, matrix)
 
     if payment_type == 'tuition':
-        fee_rows = Database.execute_query(
-            '''SELECT pf.amount
-               FROM program_fees pf
-               JOIN fee_components fc ON fc.id = pf.fee_component_id
-               WHERE LOWER(fc.name) NOT LIKE '%%acceptance%%'
-                 AND pf.program_type = %s
-                 AND pf.level = %s
-                 AND pf.faculty_id = %s
-                 AND pf.academic_session_id = (
-                     SELECT id FROM academic_sessions WHERE is_active = TRUE LIMIT 1
-                 )''',
-            (str(context['program_type']), str(context['level']), str(context['faculty_id']))
-        )
-        total = sum(float(fee.get('amount') or 0) for fee in (fee_rows or []))
+        total = matrix.tuition_total(context['program_type'], context['level'], context['faculty_id'])
         if total <= 0:
             raise ValueError('Tuition fee breakdown not configured for this program_type, level, and faculty')
 
         # If an installment_plan_id is supplied, compute the installment amount
         # as percentage of the total using the percentage stored in installment_plans
         if installment_plan_id:
-            ip = Database.execute_query(
-                'SELECT percentage FROM installment_plans WHERE id = %s LIMIT 1',
-                (installment_plan_id,)
-            )
-            if not ip:
-                raise ValueError(f'Installment plan id {installment_plan_id} not found')
             try:
-                pct = float(ip[0].get('percentage') or 0)
-            except Exception:
-                pct = 0.0
+                pct = matrix.installments[int(installment_plan_id)]
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f'Installment plan id {installment_plan_id} not found')
             if pct <= 0:
                 raise ValueError('Invalid installment percentage for selected plan')
             installment_amount = round((total * pct) / 100.0, 2)
             return installment_amount
 
-        # Full Payment: compute as the total of what is left
-        plans = Database.execute_query('SELECT id, percentage FROM installment_plans')
-        if plans:
-            paid = Database.execute_query(
-                '''SELECT installment_plan_id 
-                   FROM payment_transactions 
-                   WHERE user_id = %s 
-                     AND tran_type = 'tuition' 
-                     AND tran_status = 'successful' 
-                     AND installment_plan_id IS NOT NULL''',
-                (user_id,)
-            )
-            paid_ids = {p['installment_plan_id'] for p in (paid or [])}
-            remaining_pct = sum(float(pl['percentage'] or 0) for pl in plans if pl['id'] not in paid_ids)
+        # Full Payment: compute as the total of what is left this session
+        if matrix.installments and matrix.active_session_id:
+            ledger = session_ledger.get(user_id, matrix.active_session_id)
+            paid_ids = set((ledger or {}).get('installments_paid') or [])
+            remaining_pct = sum(pct for plan_id, pct in matrix.installments.items() if plan_id not in paid_ids)
             if len(paid_ids) > 0:
                 return round((total * remaining_pct) / 100.0, 2)
 
@@ -498,6 +366,51 @@ def _get_processing_fee() -> float:
         return 300.0
 
 
+PAYMENT_INITIATIONS = metrics.counter(
+    'payment_initiations', 'initiate_payment calls by outcome (created, reused).', ('outcome',),
+)
+
+
+def _reusable_payment(cursor, user_id, payment_type, session_id, amount_kobo,
+                      installment_plan_id, fee_component_id, program_type_id, idempotency_key):
+    """
+    The transaction a repeat initiation should get back instead of a new one,
+    or None.  Call with the (user, fee type) advisory lock held.
+
+    With an Idempotency-Key: the row created under that key within
+    PAYMENT_IDEMPOTENCY_KEY_TTL_SECONDS, whatever its status.  Without one:
+    a still-pending row for exactly the same fee created within
+    PAYMENT_INITIATE_REUSE_SECONDS (double clicks, reloads of the payment page).
+    """
+    if idempotency_key:
+        cursor.execute(
+            '''SELECT reference_no, amount_in_kobo, tran_status, tran_type, installment_plan_id, academic_session_id
+               FROM payment_transactions
+               WHERE user_id = %s
+                 AND raw_request_payload->>'idempotency_key' = %s
+                 AND created_at >= NOW() - %s * INTERVAL '1 second'
+               ORDER BY created_at DESC LIMIT 1''',
+            (user_id, idempotency_key, Config.PAYMENT_IDEMPOTENCY_KEY_TTL_SECONDS)
+        )
+        return cursor.fetchone()
+
+    cursor.execute(
+        '''SELECT reference_no, amount_in_kobo, tran_status, tran_type, installment_plan_id, academic_session_id
+           FROM payment_transactions
+           WHERE user_id = %s AND tran_type = %s AND academic_session_id = %s
+             AND tran_status = 'pending'
+             AND created_at >= NOW() - %s * INTERVAL '1 second'
+             AND amount_in_kobo = %s
+             AND installment_plan_id IS NOT DISTINCT FROM %s
+             AND fee_component_id IS NOT DISTINCT FROM %s
+             AND COALESCE(raw_request_payload->>'program_type_id', '') = %s
+           ORDER BY created_at DESC LIMIT 1''',
+        (user_id, payment_type, session_id, Config.PAYMENT_INITIATE_REUSE_SECONDS, amount_kobo,
+         installment_plan_id, fee_component_id, '' if program_type_id is None else str(program_type_id))
+    )
+    return cursor.fetchone()
+
+
 @applicant_bp.route('/processing-fee', methods=['GET'])
 def get_processing_fee_endpoint():
     try:
@@ -593,11 +506,7 @@ def get_program_types():
         'SELECT id, name FROM program_types WHERE id BETWEEN 1 AND 7 ORDER BY id'
     )
     fee_mapping = {1: 42, 6: 43, 4: 40, 2: 37, 7: 38, 3: 39, 5: 41}
-    fee_ids  = list(fee_mapping.values())
-    fees_data = Database.execute_query(
-        'SELECT id, amount FROM program_fees WHERE id IN %s', (tuple(fee_ids),)
-    )
-    fee_lookup = {f['id']: float(f['amount']) for f in (fees_data or [])}
+    fee_lookup = get_fee_matrix().fee_amounts
     for t in (types or []):
         fee_id = fee_mapping.get(t['id'])
         if fee_id:
@@ -1512,6 +1421,10 @@ def initiate_payment(payload):
         amount_naira = _resolve_fee_amount(payment_type, user_id, program_type_id, installment_plan_id)
     except ValueError as e:
         return jsonify({'message': str(e)}), 400
+    except RuntimeError as e:
+        # Fee configuration could not be loaded at all (no snapshot to fall back on)
+        print(f"[initiate-payment] Fee lookup failed: {e}")
+        return jsonify({'message': 'Fee configuration temporarily unavailable, please retry'}), 503
 
     # ── Processing fee (fetched from system_settings) ─────────────────────────
     processing_fee = _get_processing_fee()
@@ -1522,6 +1435,10 @@ def initiate_payment(payload):
     receipt_no   = None
     amount_kobo  = round(amount_naira_with_fee * 100)
 
+    # Optional client-chosen key: retrying a request with the same key
+    # returns the transaction the first attempt created
+    idempotency_key = (request.headers.get('Idempotency-Key') or data.get('idempotency_key') or '').strip()[:128] or None
+
     # ── Validate Interswitch config ───────────────────────────────────────────
     missing = []
     if not Config.INTERSWITCH_MERCHANT_CODE: missing.append('INTERSWITCH_MERCHANT_CODE')
@@ -1615,49 +1532,73 @@ def initiate_payment(payload):
                     'application_status': app_stage,
                 }), 409
 
-    # ── Persist PENDING transaction ───────────────────────────────────────────
+    # ── Persist PENDING transaction (or hand back the one already in flight) ─
+    # Initiations for the same user and fee type are serialised by an
+    # advisory lock held until commit, so a double click or reload finds the
+    # first request's row instead of racing it to create a second one that
+    # the requery worker and webhook would then chase for 24 hours.  A
+    # request with an Idempotency-Key first locks the key itself: its lookup
+    # ignores the fee type, so retries of one key must serialise across types.
+    request_payload = {'payment_type': payment_type, 'program_type_id': program_type_id}
+    if idempotency_key:
+        request_payload['idempotency_key'] = idempotency_key
     try:
-        Database.execute_update(
-            '''INSERT INTO payment_transactions
-                   (user_id, fee_component_id, academic_session_id, semester_id, installment_plan_id,
-                    amount, amount_in_kobo, reference_no, receipt_no,
-                    tran_status, tran_type, currency,
-                    pay_item_id, product_id,
-                    raw_request_payload, created_at, updated_at)
-               VALUES (%s, %s, %s, %s, %s,
-                       %s, %s, %s, %s,
-                       %s, %s, %s,
-                       %s, %s,
-                       %s::jsonb, NOW(), NOW())''',
-            (
-                user_id, fee_component_id, current_session_id,
-                active_semester_id if payment_type == 'tuition' else None,
-                installment_plan_id,
-                amount_naira_with_fee, amount_kobo, reference_no, receipt_no,
-                'pending', payment_type, 'NGN',
-                InterswitchClient._pay_item_id(payment_type),
-                Config.INTERSWITCH_MERCHANT_CODE,
-                json.dumps({'payment_type': payment_type, 'program_type_id': program_type_id}),
+        with Database.transaction() as cursor:
+            if idempotency_key:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))',
+                               (user_id, f'initiate_payment:key:{idempotency_key}'))
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))',
+                           (user_id, f'initiate_payment:{payment_type}'))
+            existing = _reusable_payment(
+                cursor, user_id, payment_type, current_session_id, amount_kobo,
+                installment_plan_id, fee_component_id, program_type_id, idempotency_key,
             )
-        )
+            if existing is None:
+                cursor.execute(
+                    '''INSERT INTO payment_transactions
+                           (user_id, fee_component_id, academic_session_id, semester_id, installment_plan_id,
+                            amount, amount_in_kobo, reference_no, receipt_no,
+                            tran_status, tran_type, currency,
+                            pay_item_id, product_id,
+                            raw_request_payload, created_at, updated_at)
+                       VALUES (%s, %s, %s, %s, %s,
+                               %s, %s, %s, %s,
+                               %s, %s, %s,
+                               %s, %s,
+                               %s::jsonb, NOW(), NOW())''',
+                    (
+                        user_id, fee_component_id, current_session_id,
+                        active_semester_id if payment_type == 'tuition' else None,
+                        installment_plan_id,
+                        amount_naira_with_fee, amount_kobo, reference_no, receipt_no,
+                        'pending', payment_type, 'NGN',
+                        InterswitchClient._pay_item_id(payment_type),
+                        Config.INTERSWITCH_MERCHANT_CODE,
+                        json.dumps(request_payload),
+                    )
+                )
     except Exception as e:
         print(f"Failed to create pending transaction: {e}")
         return jsonify({'message': 'Failed to initialise transaction record'}), 500
 
+    tran_status = 'pending'
+    if existing is not None:
+        # A key only ever stands for one exact payment; anything else is a new
+        # payment and needs a new key
+        if (existing['tran_type'] != payment_type
+                or str(existing['installment_plan_id'] or '') != str(installment_plan_id or '')
+                or existing['amount_in_kobo'] != amount_kobo
+                or existing['academic_session_id'] != current_session_id):
+            return jsonify({'message': 'This Idempotency-Key was already used for a different payment'}), 409
+        reference_no = existing['reference_no']
+        tran_status  = existing['tran_status']
+        print(f"[initiate_payment] Reusing {reference_no} ({tran_status}) for user {user_id}")
+    PAYMENT_INITIATIONS.inc(outcome='created' if existing is None else 'reused')
+
     pay_item_id   = InterswitchClient._pay_item_id(payment_type)
     merchant_code = Config.INTERSWITCH_MERCHANT_CODE
     site_redirect_url = f"{request.host_url.rstrip('/')}/e-portal/api/applicant/payment/callback"
-    redirect_url = InterswitchClient.build_redirect_url(
-        pay_item_id,
-        reference_no,
-        amount_kobo,
-        customer_name,
-        customer_email,
-        site_redirect_url,
-        str(user_id),
-    )
-
-    return jsonify({
+    response = {
         'reference_no':   reference_no,
         'amount':         amount_naira,          # base fee (without processing fee)
         'amount_kobo':    amount_kobo,           # total including processing fee, in kobo
@@ -1666,8 +1607,22 @@ def initiate_payment(payload):
         'merchant_code':  merchant_code,
         'customer_name':  customer_name,
         'customer_email': customer_email,
-        'redirect_url':   redirect_url,
-    }), 200
+        'tran_status':    tran_status,
+        'reused':         existing is not None,
+    }
+    # A replayed key for a payment that is already settled or closed must not
+    # send the payer back to the gateway for the same reference
+    if tran_status == 'pending':
+        response['redirect_url'] = InterswitchClient.build_redirect_url(
+            pay_item_id,
+            reference_no,
+            amount_kobo,
+            customer_name,
+            customer_email,
+            site_redirect_url,
+            str(user_id),
+        )
+    return jsonify(response), 200
 
 
 def make_frontend_url(path):
@@ -1715,8 +1670,12 @@ def payment_callback():
        - Definitive FAIL → redirect /payment?failed=true
     
     This prevents the bug: "ISW settles after 4 min, but client timeout at 3 min marked FAILED"
+
+    With PAYMENT_CALLBACK_MODE=deferred, step 3 is handed to the background
+    executor (utils/payment_verifier.py) and the browser is redirected to
+    /verifying at once, which long-polls /payment/status/<ref>.
     """
-    from utils.payment_status import classify_response, build_update_sql_params, generate_receipt_no, atomic_settle_payment
+    from utils.payment_status import classify_response, build_update_sql_params, generate_receipt_no, atomic_settle_payment, SettlementFailed
     from utils.interswitch import InterswitchClient
     
     # Get transaction reference from Interswitch redirect
@@ -1767,18 +1726,20 @@ def payment_callback():
         redirect_url = make_frontend_url(f"/applicant/payment/callback?txnref={txnref}")
         return make_html_redirect(redirect_url)
     
+    # Deferred mode: don't hold the browser (or this worker) on Interswitch
+    if Config.PAYMENT_CALLBACK_MODE == 'deferred':
+        from utils.payment_verifier import submit_verification
+        submit_verification(txnref)
+        redirect_url = make_frontend_url(f"/applicant/payment/verifying?txnref={txnref}")
+        return make_html_redirect(redirect_url)
+
     # ✅ IMMEDIATE SERVER-SIDE REQUERY (this is the fix!)
     try:
         isw_resp = InterswitchClient.requery_transaction(txnref, amount_kobo)
     except Exception as e:
         print(f"[callback] Requery error for {txnref}: {e}")
         # Leave as pending, client will retry via /payment/status polling
-        Database.execute_update(
-            '''UPDATE payment_transactions 
-               SET tran_status = 'requery_error', requery_count = COALESCE(requery_count, 0) + 1
-               WHERE reference_no = %s''',
-            (txnref,)
-        )
+        mark_requery_error(txnref)
         redirect_url = make_frontend_url(f"/applicant/payment/callback?txnref={txnref}")
         return make_html_redirect(redirect_url)
     
@@ -1790,16 +1751,16 @@ def payment_callback():
     is_successful = (tran_status == 'successful')
     
     if is_successful:
-        lock_acquired = atomic_settle_payment(txnref, user_id, payment_type)
-        if lock_acquired:
-            receipt_no = generate_receipt_no(payment_type=payment_type, session_id=session_id)
-            sql, params = build_update_sql_params(
-                'successful', txnref, response_code, response_desc,
-                isw_resp, amount_kobo, receipt_no
-            )
-            Database.execute_update(sql, params)
-        else:
-            print(f"[callback] Already settled by another handler: {txnref}")
+        receipt_no = generate_receipt_no(payment_type=payment_type, session_id=session_id)
+        sql, params = build_update_sql_params(
+            'successful', txnref, response_code, response_desc,
+            isw_resp, amount_kobo, receipt_no
+        )
+        try:
+            if not atomic_settle_payment(txnref, user_id, payment_type, final_update=(sql, params)):
+                print(f"[callback] Already settled by another handler: {txnref}")
+        except SettlementFailed:
+            pass   # left as requery_error; the frontend keeps polling
         redirect_url = make_frontend_url(f"/applicant/payment/callback?txnref={txnref}")
         return make_html_redirect(redirect_url)
 
@@ -1824,112 +1785,56 @@ def payment_callback():
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Payment — verify (callback)
+# Payment — status long-poll (used by the /verifying page)
 # ─────────────────────────────────────────────────────────────────────────────
 
-def verify_transaction_by_reference(reference_no: str):
-    if not reference_no:
-        return None
-
-    txn_res = Database.execute_query(
-        '''SELECT id, amount_in_kobo, amount, tran_status, receipt_no,
-                  response_description,
-                  tran_type, COALESCE(requery_count, 0) AS requery_count, user_id
-           FROM payment_transactions
-           WHERE reference_no = %s
-           ORDER BY created_at DESC LIMIT 1''',
-        (reference_no,)
-    )
-    if not txn_res:
-        print(f"[callback verify] Transaction {reference_no} not found in database.")
-        return None
-
-    txn = txn_res[0]
-    user_id = txn['user_id']
-    payment_type = txn['tran_type']
-    requery_count = int(txn['requery_count'])
-
-    user_cancelled = (
-        txn['tran_status'] == 'cancelled'
-        and (txn.get('response_description') or '') == 'Cancelled by user'
-    )
-    if txn['tran_status'] in ('successful', 'failed') or user_cancelled:
-        return txn['tran_status']
-
-    amount_kobo = txn['amount_in_kobo'] or (round(float(txn['amount'] or 0) * 100))
-
-    latest_check = Database.execute_query(
-        '''SELECT tran_status, response_description FROM payment_transactions
-           WHERE reference_no = %s
-           ORDER BY created_at DESC LIMIT 1''',
-        (reference_no,)
-    )
-    if latest_check:
-        latest_status = latest_check[0].get('tran_status')
-        latest_user_cancelled = (
-            latest_status == 'cancelled'
-            and (latest_check[0].get('response_description') or '') == 'Cancelled by user'
-        )
-        if latest_status not in ('pending', 'requery_error', 'cancelled') or latest_user_cancelled:
-            return latest_status
-
+@applicant_bp.route('/payment/status/<path:reference_no>', methods=['GET'])
+@AuthHandler.token_required
+def payment_status(payload, reference_no):
+    """
+    Read-only status for the /verifying page.  Holds the request open for up
+    to ?wait= seconds (capped at PAYMENT_STATUS_MAX_WAIT_SECONDS) until the
+    transaction is final.  Never requeries inline; if the row is still
+    unresolved it may hand a (throttled) verification to the background
+    executor instead.
+
+    Under the sync gunicorn worker (GUNICORN_THREADS=1) a wait would hold
+    the whole worker process, so the status is returned at once and the
+    page short-polls instead.
+    """
+    from utils.payment_verifier import submit_verification, wait_for_status, FINAL_STATUSES
 
     try:
-        isw_resp = InterswitchClient.requery_transaction(reference_no, amount_kobo)
-    except Exception as e:
-        print(f"[callback verify] Interswitch requery error for {reference_no}: {e}")
-        Database.execute_update(
-            '''UPDATE payment_transactions
-               SET tran_status = 'requery_error',
-                   requery_count = COALESCE(requery_count, 0) + 1,
-                   updated_at = NOW()
-               WHERE reference_no = %s''',
-            (reference_no,)
-        )
-        return 'pending'
-
-    response_code = str(isw_resp.get('ResponseCode', '')).strip()
-    response_desc = isw_resp.get('ResponseDescription', '')
-
-    tran_status = classify_response(response_code, requery_count, response_desc)
-    is_successful = (tran_status == 'successful')
-
-    latest_after = Database.execute_query(
-        '''SELECT tran_status, response_description FROM payment_transactions
-           WHERE reference_no = %s
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = 0.0
+    wait = max(0.0, min(wait, Config.PAYMENT_STATUS_MAX_WAIT_SECONDS))
+    if Config.GUNICORN_THREADS <= 1:
+        wait = 0.0
+
+    # Only the owner's own references may trigger a requery
+    owned = Database.execute_query(
+        '''SELECT tran_status FROM payment_transactions
+           WHERE reference_no = %s AND user_id = %s
            ORDER BY created_at DESC LIMIT 1''',
-        (reference_no,)
-    )
-    if latest_after:
-        latest_status = latest_after[0].get('tran_status')
-        latest_user_cancelled = (
-            latest_status == 'cancelled'
-            and (latest_after[0].get('response_description') or '') == 'Cancelled by user'
-        )
-        if latest_status not in ('pending', 'requery_error', 'cancelled') or latest_user_cancelled:
-            return latest_status
-
-    receipt_no_val = txn.get('receipt_no') or (generate_receipt_no(payment_type=payment_type, session_id=session_id) if is_successful else '') or ''
-
-    if is_successful:
-        atomic_settle_payment(reference_no, user_id, payment_type)
-
-    # Update transaction record
-    sql, params = build_update_sql_params(
-        tran_status, reference_no, response_code, response_desc,
-        isw_resp, amount_kobo, receipt_no_val,
+        (reference_no, payload['user_id'])
     )
-    Database.execute_update(sql, params)
+    if not owned:
+        return jsonify({'message': 'Transaction not found'}), 404
 
-    print(f"[callback verify] Transaction {reference_no} verified and updated to: {tran_status}")
-    return tran_status
+    if owned[0]['tran_status'] not in FINAL_STATUSES:
+        submit_verification(reference_no)
+    status = wait_for_status(reference_no, payload['user_id'], wait)
+    if not status:
+        return jsonify({'message': 'Transaction not found'}), 404
+    return jsonify(status), 200
 
 
 @applicant_bp.route('/verify-payment', methods=['POST'])
 @AuthHandler.token_required
 def verify_payment(payload):
     
-    from utils.payment_status import classify_response, build_update_sql_params, generate_receipt_no, atomic_settle_payment, get_session_payment_summary
+    from utils.payment_status import classify_response, build_update_sql_params, generate_receipt_no, atomic_settle_payment, get_session_payment_summary, SettlementFailed
     from utils.interswitch import InterswitchClient
     from datetime import datetime, timedelta, timezone
     
@@ -2038,50 +1943,65 @@ def verify_payment(payload):
             (reference_no,)
         )
         
-        # Requery ISW
+        # Requery ISW.  Only the gateway call is treated as "could not reach
+        # ISW": an error after settlement must not flip a settled row back
         try:
             isw_resp = InterswitchClient.requery_transaction(reference_no, amount_kobo)
-            response_code = str(isw_resp.get('ResponseCode', '')).strip()
-            response_desc = isw_resp.get('ResponseDescription', '')
-            
-            # Classify using fixed logic
-            tran_status = classify_response(response_code, txn['requery_count'], response_desc)
-            is_successful = (tran_status == 'successful')
-            
-            print(f"[verify-payment] {reference_no} | requery code={response_code!r} → {tran_status}")
-            
-            receipt_no = generate_receipt_no(payment_type=payment_type, session_id=session_id) if is_successful else None
-            if is_successful:
-                atomic_settle_payment(reference_no, user_id, payment_type)
-
-            # Update transaction
-            sql, params = build_update_sql_params(
-                tran_status, reference_no, response_code, response_desc,
-                isw_resp, amount_kobo, receipt_no
-            )
-            Database.execute_update(sql, params)
-            
-            if is_successful:
-                return jsonify(build_response(
-                    'successful',
-                    True,
-                    receipt_no
-                )), 200
-            
-            # Return updated status
-            return jsonify(build_response(
-                tran_status,
-                False,
-                message=response_desc
-            )), 200
-            
         except Exception as e:
             print(f"[verify-payment] Requery error for {reference_no}: {e}")
+            mark_requery_error(reference_no)
+            message = (
+                'Payment gateway unavailable, will retry shortly'
+                if isinstance(e, GatewayUnavailable) else 'Could not reach ISW, retrying...'
+            )
             return jsonify(build_response(
                 'pending',
                 False,
-                message='Could not reach ISW, retrying...'
+                message=message
             )), 503
+
+        response_code = str(isw_resp.get('ResponseCode', '')).strip()
+        response_desc = isw_resp.get('ResponseDescription', '')
+
+        # Classify using fixed logic
+        tran_status = classify_response(response_code, txn['requery_count'], response_desc)
+        is_successful = (tran_status == 'successful')
+
+        print(f"[verify-payment] {reference_no} | requery code={response_code!r} → {tran_status}")
+
+        receipt_no = generate_receipt_no(payment_type=payment_type, session_id=session_id) if is_successful else None
+
+        # Update transaction (settled in the same DB transaction on success)
+        sql, params = build_update_sql_params(
+            tran_status, reference_no, response_code, response_desc,
+            isw_resp, amount_kobo, receipt_no
+        )
+        try:
+            settled = is_successful and atomic_settle_payment(reference_no, user_id, payment_type, final_update=(sql, params))
+        except SettlementFailed:
+            # Confirmed by ISW but the downstream work failed; atomic_settle_payment
+            # already left the row in requery_error for the background retry
+            return jsonify(build_response(
+                'pending',
+                False,
+                message='Payment received and still processing, retrying shortly'
+            )), 200
+        if not settled:
+            Database.execute_update(sql, params)
+
+        if is_successful:
+            return jsonify(build_response(
+                'successful',
+                True,
+                receipt_no
+            )), 200
+
+        # Return updated status
+        return jsonify(build_response(
+            tran_status,
+            False,
+            message=response_desc
+        )), 200
     
     return jsonify(build_response(
         current_status,
@@ -2133,7 +2053,11 @@ def cancel_payment(payload):
 
 @applicant_bp.route('/payment-webhook', methods=['POST'])
 def payment_webhook():
+    if (request.content_length or 0) > Config.WEBHOOK_MAX_BODY_BYTES:
+        return jsonify({'message': 'payload too large'}), 413
     data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'message': 'reference not found in payload'}), 400
 
     reference_no = (
         data.get('transactionReference')
@@ -2146,83 +2070,32 @@ def payment_webhook():
         print(f"[webhook] No reference in payload: {data}")
         return jsonify({'message': 'reference not found in payload'}), 400
 
-    # ── Look up the transaction (include requery_count) ───────────────────────
-    txn_res = Database.execute_query(
-        '''SELECT id, user_id, amount_in_kobo, amount, tran_status, receipt_no,
-                  response_description,
-                  tran_type, COALESCE(requery_count, 0) AS requery_count,
-                  updated_at
-           FROM payment_transactions
-           WHERE reference_no = %s
-           ORDER BY created_at DESC LIMIT 1''',
-        (reference_no,)
-    )
-    if not txn_res:
-        print(f"[webhook] Transaction not found: {reference_no}")
+    from webhook_inbox import enqueue_webhook, process_webhook, inbox_available
+
+    # Fast path: persist and acknowledge; the inbox workers do the requery.
+    # Only references we issued are stored — the endpoint is unauthenticated
+    if Config.WEBHOOK_INBOX_ENABLED and inbox_available():
+        known = Database.execute_query(
+            'SELECT 1 FROM payment_transactions WHERE reference_no = %s LIMIT 1',
+            (str(reference_no),)
+        )
+        if known is None:
+            return jsonify({'message': 'could not store webhook, please retry'}), 503
+        if not known:
+            print(f"[webhook] Transaction not found: {reference_no}")
+            return jsonify({'message': 'transaction not found'}), 404
+        if not enqueue_webhook(str(reference_no), data):
+            return jsonify({'message': 'could not store webhook, please retry'}), 503
+        return jsonify({'message': 'accepted'}), 200
+
+    outcome = process_webhook(reference_no)
+    if outcome == 'not_found':
         return jsonify({'message': 'transaction not found'}), 404
-
-    txn           = txn_res[0]
-    user_id       = txn['user_id']
-    payment_type  = txn['tran_type']
-    requery_count = int(txn['requery_count'])
-
-    WEBHOOK_RECOVERY_WINDOW_MINUTES = 30
-
-    if txn['tran_status'] in ('successful', 'cancelled'):
-        print(f"[webhook] Already finalised ({txn['tran_status']}): {reference_no}")
+    if outcome == 'already_processed':
         return jsonify({'message': 'already processed'}), 200
-
-    if txn['tran_status'] == 'failed':
-        updated_at = txn.get('updated_at')
-        if updated_at:
-            age_minutes = (datetime.now().replace(tzinfo=None) - updated_at).total_seconds() / 60
-            if age_minutes >= WEBHOOK_RECOVERY_WINDOW_MINUTES:
-                return jsonify({'message': 'already processed'}), 200
-        else:
-            return jsonify({'message': 'already processed'}), 200
-
-    amount_kobo = txn['amount_in_kobo'] or (round(float(txn['amount'] or 0) * 100))
-
-    # Re-query Interswitch 
-    try:
-        isw_resp = InterswitchClient.requery_transaction(reference_no, amount_kobo)
-    except Exception as e:
-        print(f"[webhook] Requery error for {reference_no}: {e}")
-        Database.execute_update(
-            '''UPDATE payment_transactions
-               SET tran_status    = 'requery_error',
-                   requery_count  = COALESCE(requery_count, 0) + 1,
-                   updated_at     = NOW()
-               WHERE reference_no = %s''',
-            (reference_no,)
-        )
+    if outcome == 'requery_error':
         return jsonify({'message': 'requery failed, will retry'}), 503
-
-    response_code = str(isw_resp.get('ResponseCode', '')).strip()
-    response_desc = isw_resp.get('ResponseDescription', '')
-
-    tran_status   = classify_response(response_code, requery_count, response_desc)
-    is_successful = (tran_status == 'successful')
-    is_cancelled  = (tran_status == 'cancelled')
-
-    log_msg = f"[webhook] {reference_no} | code={response_code!r} requery_count={requery_count} → {tran_status} (type={payment_type})"
-    if is_cancelled:
-        log_msg += f" (cancelled by user, response_desc='{response_desc}')"
-    print(log_msg)
-
-    # ── Update transaction record ─────────────────────────────────────────────
-    if is_successful:
-        atomic_settle_payment(reference_no, user_id, payment_type)
-
-    receipt_no: str = txn.get('receipt_no') or (generate_receipt_no(payment_type=payment_type) if is_successful else '') or ''
-    sql, params = build_update_sql_params(
-        tran_status, reference_no, response_code, response_desc,
-        isw_resp, amount_kobo, receipt_no,
-    )
-    Database.execute_update(sql, params)
-
-    # ── Downstream on success ─────────────────────────────────────────────────
-    return jsonify({'message': 'ok', 'tran_status': tran_status}), 200
+    return jsonify({'message': 'ok', 'tran_status': outcome}), 200
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -2422,37 +2295,12 @@ def get_tuition_fee_breakdown(payload):
     
     user_id = payload['user_id']
     try:
-        context = _get_applicant_fee_context(user_id)
-
-        # Get active session
-        session_res = Database.execute_query(
-            'SELECT id FROM academic_sessions WHERE is_active = TRUE ORDER BY id DESC LIMIT 1'
-        )
-        current_session_id = session_res[0]['id'] if session_res else None
-
-        fees = Database.execute_query(
-            '''SELECT fc.name AS fee_name, pf.amount
-            FROM program_fees pf
-            JOIN fee_components fc ON fc.id = pf.fee_component_id
-            WHERE pf.program_type = %s
-                AND pf.level = %s
-                AND pf.faculty_id = %s
-                AND pf.academic_session_id = (
-                    SELECT id FROM academic_sessions WHERE is_active = TRUE LIMIT 1
-                )
-                AND LOWER(fc.name) NOT LIKE '%%acceptance%%'
-            ORDER BY fc.name ASC''',
-            (str(context['program_type']), str(context['level']), str(context['faculty_id']))
-        )
-
-        components = []
-        total = 0.0
+        matrix  = get_fee_matrix()
+        context = _get_applicant_fee_context(user_id, matrix)
+        current_session_id = matrix.active_session_id
 
-        for fee in (fees or []):
-            name   = fee['fee_name'] or 'Other Fee'
-            amount = float(fee['amount'] or 0)
-            total += amount
-            components.append({'name': name, 'amount': amount})
+        components = matrix.tuition_components(context['program_type'], context['level'], context['faculty_id'])
+        total = sum(c['amount'] for c in components)
 
         processing_fee = _get_processing_fee()
         
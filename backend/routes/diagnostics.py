@@ -0,0 +1,73 @@
+"""routes/diagnostics.py — Worker memory diagnostics (Admin only).
+
+Each call is answered by whichever gunicorn worker picks it up; compare the
+"pid" in responses before reading a diff against a baseline.
+"""
+from flask import Blueprint, request, jsonify
+from utils.auth import AuthHandler
+from utils import memory
+
+diagnostics_bp = Blueprint('diagnostics', __name__)
+
+_KEY_TYPES = ('lineno', 'filename', 'traceback')
+
+
+def _snapshot_args():
+    key_type = request.args.get('group_by', 'lineno')
+    if key_type not in _KEY_TYPES:
+        key_type = 'lineno'
+    try:
+        limit = max(1, min(int(request.args.get('limit', 25)), 200))
+    except ValueError:
+        limit = 25
+    return key_type, limit
+
+
+@diagnostics_bp.route('/memory', methods=['GET'])
+@AuthHandler.token_required
+@AuthHandler.admin_required
+def get_memory(payload):
+    return jsonify(memory.memory_summary()), 200
+
+
+@diagnostics_bp.route('/memory/tracemalloc/start', methods=['POST'])
+@AuthHandler.token_required
+@AuthHandler.admin_required
+def start_tracemalloc(payload):
+    data = request.get_json(silent=True) or {}
+    try:
+        frames = int(data.get('frames', 1))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'frames must be an integer'}), 400
+    return jsonify(memory.start_tracing(frames)), 200
+
+
+@diagnostics_bp.route('/memory/tracemalloc/stop', methods=['POST'])
+@AuthHandler.token_required
+@AuthHandler.admin_required
+def stop_tracemalloc(payload):
+    return jsonify(memory.stop_tracing()), 200
+
+
+@diagnostics_bp.route('/memory/tracemalloc/snapshot', methods=['POST'])
+@AuthHandler.token_required
+@AuthHandler.admin_required
+def snapshot_tracemalloc(payload):
+    """Take a snapshot, store it as this worker's baseline and return the top allocations."""
+    key_type, limit = _snapshot_args()
+    try:
+        return jsonify(memory.take_snapshot(key_type, limit)), 200
+    except RuntimeError as e:
+        return jsonify({'message': str(e)}), 409
+
+
+@diagnostics_bp.route('/memory/tracemalloc/diff', methods=['GET'])
+@AuthHandler.token_required
+@AuthHandler.admin_required
+def diff_tracemalloc(payload):
+    """Allocation growth since the baseline snapshot, largest first."""
+    key_type, limit = _snapshot_args()
+    try:
+        return jsonify(memory.diff_snapshot(key_type, limit)), 200
+    except RuntimeError as e:
+        return jsonify({'message': str(e)}), 409
@@ -0,0 +1,398 @@
+"""routes/finance.py — Bursary: payment_transactions explorer, aggregates, CSV export
+and daily revenue / funnel reports.
+
+Listing uses keyset pagination over (created_at, id), newest first: the
+response carries next_cursor, which the client sends back as ?cursor= to get
+the following page.  Every page is one index range scan, however deep.
+
+Filters (all optional, shared by the three endpoints):
+    tran_type, tran_status     comma-separated lists
+    session_id                 academic_session_id
+    date_from, date_to         YYYY-MM-DD on created_at, both inclusive
+    response_code              exact
+    amount_mismatch            true / false
+    user_id, reference         exact (reference matches reference_no or receipt_no)
+
+Failed / cancelled rows moved to payment_transactions_archive (see
+utils/payment_archive.py) no longer appear in the listing or export; the
+daily report still counts them.
+
+/reports/daily reads only payment_daily_rollup (see utils/payment_rollup.py),
+never payment_transactions, so it costs the same over a day or a year.
+"""
+import base64
+import csv
+import io
+from datetime import datetime, timedelta
+
+from flask import Blueprint, request, jsonify, Response
+
+from database import Database, MissingTable
+from utils.auth import AuthHandler
+from utils import payment_rollup
+
+finance_bp = Blueprint('finance', __name__)
+
+FINANCE_ROLES = ('bursar', 'admin', 'ict_director')
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX     = 500
+EXPORT_BATCH_SIZE = 2000
+REPORT_DAYS_DEFAULT = 30
+REPORT_DAYS_MAX     = 366
+
+# Rollup statuses folded into the funnel's "pending" step
+_PENDING_STATUSES = ('pending', 'processing', 'requery_error')
+
+_SELECT = '''
+    SELECT pt.id, pt.reference_no, pt.receipt_no, pt.user_id,
+           NULLIF(TRIM(CONCAT_WS(' ', u.surname, u.firstname, u.middlename)), '') AS name,
+           u.email,
+           pt.tran_type, pt.tran_status, pt.amount, pt.amount_paid,
+           COALESCE(pt.is_amount_mismatch, FALSE) AS is_amount_mismatch,
+           pt.response_code, pt.response_description, pt.payment_method,
+           pt.academic_session_id, acs.name AS session,
+           pt.created_at, pt.payment_at
+    FROM payment_transactions pt
+    LEFT JOIN users u ON u.id = pt.user_id
+    LEFT JOIN academic_sessions acs ON acs.id = pt.academic_session_id
+'''
+
+EXPORT_COLUMNS = (
+    'id', 'reference_no', 'receipt_no', 'user_id', 'name', 'email', 'tran_type', 'tran_status',
+    'amount', 'amount_paid', 'is_amount_mismatch', 'response_code', 'response_description',
+    'payment_method', 'academic_session_id', 'session', 'created_at', 'payment_at',
+)
+
+
+class _BadRequest(ValueError):
+    pass
+
+
+def _csv_list(name):
+    return [v.strip() for v in (request.args.get(name) or '').split(',') if v.strip()]
+
+
+def _parse_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise _BadRequest(f'{name} must be YYYY-MM-DD')
+
+
+def _build_filters() -> tuple:
+    """(WHERE clause, params) from the query string."""
+    clauses, params = ['TRUE'], []
+
+    tran_types = _csv_list('tran_type')
+    if tran_types:
+        clauses.append('pt.tran_type = ANY(%s)'); params.append(tran_types)
+    statuses = _csv_list('tran_status')
+    if statuses:
+        clauses.append('pt.tran_status = ANY(%s)'); params.append(statuses)
+
+    for arg, column in (('session_id', 'pt.academic_session_id'), ('user_id', 'pt.user_id')):
+        value = request.args.get(arg)
+        if value:
+            if not value.isdigit():
+                raise _BadRequest(f'{arg} must be a number')
+            clauses.append(f'{column} = %s'); params.append(int(value))
+
+    date_from, date_to = _parse_date('date_from'), _parse_date('date_to')
+    if date_from:
+        clauses.append('pt.created_at >= %s'); params.append(date_from)
+    if date_to:
+        clauses.append('pt.created_at < %s'); params.append(date_to + timedelta(days=1))
+
+    response_code = request.args.get('response_code')
+    if response_code:
+        clauses.append('pt.response_code = %s'); params.append(response_code.strip())
+
+    mismatch = (request.args.get('amount_mismatch') or '').lower()
+    if mismatch in ('true', '1', 'yes'):
+        clauses.append('pt.is_amount_mismatch IS TRUE')
+    elif mismatch in ('false', '0', 'no'):
+        clauses.append('pt.is_amount_mismatch IS NOT TRUE')
+    elif mismatch:
+        raise _BadRequest('amount_mismatch must be true or false')
+
+    reference = (request.args.get('reference') or '').strip()
+    if reference:
+        clauses.append('(pt.reference_no = %s OR pt.receipt_no = %s)'); params += [reference, reference]
+
+    return ' AND '.join(clauses), params
+
+
+def _encode_cursor(row) -> str:
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(value) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise _BadRequest('Invalid cursor')
+
+
+def _serialize(t) -> dict:
+    return {
+        **t,
+        'amount':      float(t['amount']) if t['amount'] is not None else None,
+        'amount_paid': float(t['amount_paid']) if t['amount_paid'] is not None else None,
+        'created_at':  t['created_at'].isoformat() if t['created_at'] else None,
+        'payment_at':  t['payment_at'].isoformat() if t['payment_at'] else None,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Listing
+# ─────────────────────────────────────────────────────────────────────────────
+
+@finance_bp.route('/transactions', methods=['GET'])
+@AuthHandler.token_required
+@AuthHandler.roles_required(*FINANCE_ROLES)
+def list_transactions(payload):
+    try:
+        where, params = _build_filters()
+        limit = min(max(int(request.args.get('limit', PAGE_SIZE_DEFAULT)), 1), PAGE_SIZE_MAX)
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, row_id = _decode_cursor(cursor)
+            where += ' AND (pt.created_at, pt.id) < (%s, %s)'
+            params += [created_at, row_id]
+    except _BadRequest as e:
+        return jsonify({'message': str(e)}), 400
+    except ValueError:
+        return jsonify({'message': 'limit must be a number'}), 400
+
+    rows = Database.execute_query(
+        f'''{_SELECT}
+            WHERE {where}
+            ORDER BY pt.created_at DESC, pt.id DESC
+            LIMIT %s''',
+        (*params, limit + 1)
+    )
+    if rows is None:
+        return jsonify({'message': 'Could not load transactions'}), 500
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'transactions': [_serialize(r) for r in rows],
+        'next_cursor':  _encode_cursor(rows[-1]) if has_more else None,
+        'has_more':     has_more,
+    }), 200
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Aggregates
+# ─────────────────────────────────────────────────────────────────────────────
+
+@finance_bp.route('/transactions/summary', methods=['GET'])
+@AuthHandler.token_required
+@AuthHandler.roles_required(*FINANCE_ROLES)
+def transactions_summary(payload):
+    try:
+        where, params = _build_filters()
+    except _BadRequest as e:
+        return jsonify({'message': str(e)}), 400
+
+    rows = Database.execute_query(
+        f'''SELECT pt.tran_status, pt.tran_type,
+                   GROUPING(pt.tran_status) AS all_statuses,
+                   GROUPING(pt.tran_type)   AS all_types,
+                   COUNT(*) AS count,
+                   COALESCE(SUM(pt.amount), 0)      AS amount,
+                   COALESCE(SUM(pt.amount_paid), 0) AS amount_paid,
+                   COUNT(*) FILTER (WHERE pt.is_amount_mismatch) AS mismatches
+            FROM payment_transactions pt
+            WHERE {where}
+            GROUP BY GROUPING SETS ((pt.tran_status, pt.tran_type), (pt.tran_status), (pt.tran_type), ())''',
+        params
+    )
+    if rows is None:
+        return jsonify({'message': 'Could not load summary'}), 500
+
+    def totals(r):
+        return {
+            'count':       r['count'],
+            'amount':      float(r['amount']),
+            'amount_paid': float(r['amount_paid']),
+            'mismatches':  r['mismatches'],
+        }
+
+    summary = {
+        'total':     {'count': 0, 'amount': 0.0, 'amount_paid': 0.0, 'mismatches': 0},
+        'by_status': {},
+        'by_type':   {},
+        'by_status_and_type': [],
+    }
+    for r in rows:
+        if r['all_statuses'] and r['all_types']:
+            summary['total'] = totals(r)
+        elif r['all_types']:
+            summary['by_status'][r['tran_status']] = totals(r)
+        elif r['all_statuses']:
+            summary['by_type'][r['tran_type']] = totals(r)
+        else:
+            summary['by_status_and_type'].append(
+                {'tran_status': r['tran_status'], 'tran_type': r['tran_type'], **totals(r)}
+            )
+    return jsonify(summary), 200
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CSV export
+# ─────────────────────────────────────────────────────────────────────────────
+
+@finance_bp.route('/transactions/export', methods=['GET'])
+@AuthHandler.token_required
+@AuthHandler.roles_required(*FINANCE_ROLES)
+def export_transactions(payload):
+    """Every matching row as CSV, streamed from a server-side cursor."""
+    try:
+        where, params = _build_filters()
+    except _BadRequest as e:
+        return jsonify({'message': str(e)}), 400
+
+    rows = Database.iter_query(
+        f'''{_SELECT}
+            WHERE {where}
+            ORDER BY pt.created_at DESC, pt.id DESC''',
+        params,
+        batch_size=EXPORT_BATCH_SIZE,
+    )
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_COLUMNS)
+        try:
+            for i, row in enumerate(rows, 1):
+                writer.writerow([
+                    row[c].isoformat() if isinstance(row[c], datetime) else row[c]
+                    for c in EXPORT_COLUMNS
+                ])
+                if i % EXPORT_BATCH_SIZE == 0:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+        finally:
+            rows.close()
+
+    filename = f"transactions-{datetime.now().strftime('%Y%m%d-%H%M')}.csv"
+    return Response(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Daily revenue / funnel report
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _funnel() -> dict:
+    return {'initiated': 0, 'successful': 0, 'pending': 0, 'failed': 0, 'cancelled': 0,
+            'amount_initiated': 0.0, 'revenue': 0.0, 'mismatches': 0}
+
+
+def _add(funnel: dict, r) -> None:
+    status = r['tran_status']
+    step = 'pending' if status in _PENDING_STATUSES else status
+    funnel['initiated'] += r['txn_count']
+    funnel['amount_initiated'] += float(r['amount'])
+    if step in funnel:
+        funnel[step] += r['txn_count']
+    if status == 'successful':
+        funnel['revenue'] += float(r['amount_paid'])
+        funnel['mismatches'] += r['mismatches']
+
+
+def _finish(funnel: dict) -> dict:
+    funnel['conversion_rate'] = round(funnel['successful'] / funnel['initiated'], 4) if funnel['initiated'] else None
+    funnel['revenue'] = round(funnel['revenue'], 2)
+    funnel['amount_initiated'] = round(funnel['amount_initiated'], 2)
+    return funnel
+
+
+@finance_bp.route('/reports/daily', methods=['GET'])
+@AuthHandler.token_required
+@AuthHandler.roles_required(*FINANCE_ROLES)
+def daily_report(payload):
+    """
+    Revenue and initiated → successful conversion per day × fee type × program
+    type.  A day is the day payments were initiated, so a payment confirmed
+    the next morning still counts toward the day its funnel started.
+    """
+    try:
+        date_to   = _parse_date('date_to') or datetime.combine(datetime.now().date(), datetime.min.time())
+        date_from = _parse_date('date_from') or date_to - timedelta(days=REPORT_DAYS_DEFAULT - 1)
+        if date_from > date_to:
+            raise _BadRequest('date_from must not be after date_to')
+        if (date_to - date_from).days >= REPORT_DAYS_MAX:
+            raise _BadRequest(f'At most {REPORT_DAYS_MAX} days per report')
+        program_types = _csv_list('program_type')
+        if any(not v.isdigit() for v in program_types):
+            raise _BadRequest('program_type must be a list of numbers')
+    except _BadRequest as e:
+        return jsonify({'message': str(e)}), 400
+
+    clauses, params = ['r.day BETWEEN %s AND %s'], [date_from.date(), date_to.date()]
+    tran_types = _csv_list('tran_type')
+    if tran_types:
+        clauses.append('r.tran_type = ANY(%s)'); params.append(tran_types)
+    if program_types:
+        clauses.append('r.program_type = ANY(%s)'); params.append([int(v) for v in program_types])
+
+    try:
+        payment_rollup.ensure_table()
+    except MissingTable as e:
+        print(f"[finance] Daily report unavailable: {e}")
+        return jsonify({'message': 'Daily report is not set up yet'}), 503
+    rows = Database.execute_query(
+        f'''SELECT r.day, r.tran_type, r.program_type, prt.name AS program_name, r.tran_status,
+                   r.txn_count, r.amount, r.amount_paid, r.mismatches,
+                   r.median_settle_seconds, r.refreshed_at
+            FROM payment_daily_rollup r
+            LEFT JOIN program_types prt ON prt.id = r.program_type
+            WHERE {' AND '.join(clauses)}
+            ORDER BY r.day DESC, r.tran_type, r.program_type''',
+        params
+    )
+    if rows is None:
+        return jsonify({'message': 'Could not load report'}), 500
+
+    groups, days, total = {}, {}, _funnel()
+    refreshed_at = None
+    for r in rows:
+        key = (r['day'], r['tran_type'], r['program_type'])
+        if key not in groups:
+            groups[key] = {
+                'day': r['day'].isoformat(), 'tran_type': r['tran_type'],
+                'program_type': r['program_type'] or None,
+                'program_name': r['program_name'],
+                **_funnel(), 'median_settle_seconds': None,
+            }
+        _add(groups[key], r)
+        if r['tran_status'] == 'successful' and r['median_settle_seconds'] is not None:
+            groups[key]['median_settle_seconds'] = round(r['median_settle_seconds'], 1)
+        _add(days.setdefault(r['day'], _funnel()), r)
+        _add(total, r)
+        if refreshed_at is None or r['refreshed_at'] > refreshed_at:
+            refreshed_at = r['refreshed_at']
+
+    return jsonify({
+        'date_from':    date_from.date().isoformat(),
+        'date_to':      date_to.date().isoformat(),
+        'rows':         [_finish(g) for g in groups.values()],
+        'days':         [{'day': d.isoformat(), **_finish(f)} for d, f in days.items()],
+        'total':        _finish(total),
+        'refreshed_at': refreshed_at.isoformat() if refreshed_at else None,
+    }), 200
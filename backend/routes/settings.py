@@ -2,6 +2,9 @@
 from flask import Blueprint, request, jsonify
 from database import Database
 from utils.auth import AuthHandler
+from utils.interswitch import InterswitchClient
+from utils.fee_matrix import invalidate as invalidate_fee_matrix
+from background_requery import requery_leader_status
 
 settings_bp = Blueprint('settings', __name__)
 
@@ -50,6 +53,7 @@ def update_setting(payload):
             """UPDATE program_fees
                SET academic_session_id = (SELECT id FROM academic_sessions WHERE is_active = TRUE LIMIT 1)"""
         )
+        invalidate_fee_matrix()
 
     if key == 'current_semester':
         semester_name = value.replace(' Semester', '').replace(' semester', '').strip()
@@ -171,9 +175,25 @@ def list_semesters(payload):
 @AuthHandler.token_required
 @AuthHandler.admin_required
 def get_system_status(payload):
+    # Error counts come from the aggregated table (see utils/error_recorder.py);
+    # error_logs only holds a sample of individual errors now.
     error_logs = Database.execute_query('SELECT error_type, message, path, created_at FROM error_logs ORDER BY id DESC LIMIT 50')
-    errors_404 = [e for e in (error_logs or []) if e['error_type'] == '404']
-    errors_500 = [e for e in (error_logs or []) if e['error_type'] == '500']
+    error_totals = Database.execute_query(
+        """SELECT error_type, SUM(count) AS total
+           FROM error_log_counts
+           WHERE window_start >= NOW() - INTERVAL '24 hours'
+           GROUP BY error_type"""
+    )
+    top_errors = Database.execute_query(
+        """SELECT error_type, path_template, SUM(count) AS count,
+                  MAX(last_seen_at) AS last_seen_at
+           FROM error_log_counts
+           WHERE window_start >= NOW() - INTERVAL '24 hours'
+           GROUP BY error_type, path_template
+           ORDER BY count DESC
+           LIMIT 20"""
+    )
+    totals = {e['error_type']: int(e['total'] or 0) for e in (error_totals or [])}
 
     try:
         Database.execute_query('SELECT 1')
@@ -216,7 +236,12 @@ def get_system_status(payload):
         'db_status': db_status,
         'api_status': "Healthy",
         'mailing_status': "Active",
-        'counts': {'errors_404': len(errors_404), 'errors_500': len(errors_500)},
+        'counts': {'errors_404': totals.get('404', 0), 'errors_500': totals.get('500', 0)},
         'locks': locks,
-        'recent_errors': error_logs or []
+        'recent_errors': error_logs or [],
+        'top_errors': top_errors or [],
+        # Per-process: reflects the gunicorn worker that served this request
+        'interswitch_breaker': InterswitchClient.breaker_status(),
+        # Cluster-wide: read from the lease row
+        'requery_worker': requery_leader_status(),
     }), 200
@@ -146,7 +146,7 @@ def create_staff(payload):
     if not all(k in data for k in required):
         return jsonify({'message': f'Required fields: {required}'}), 400
 
-    allowed_roles = ('lecturer', 'deo', 'hod', 'dean', 'registrar', 'admin', 'admissionofficer')
+    allowed_roles = ('lecturer', 'deo', 'hod', 'dean', 'registrar', 'bursar', 'admin', 'admissionofficer')
     if data['role'] not in allowed_roles:
         return jsonify({'message': f'Role must be one of: {allowed_roles}'}), 400
 
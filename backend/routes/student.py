@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from database import Database
 from utils.auth import AuthHandler
+from utils import session_ledger
 import datetime
 import psycopg2
 
@@ -32,49 +33,17 @@ def _get_active_semester():
 def _verify_tuition_paid(user_id, session_id, semester_id):
     """
     Return True if the student has a confirmed successful tuition payment
-    for the given academic session + semester.
+    for the given academic session + semester, read from the student's
+    session ledger (utils/session_ledger.py).
 
     Falls back gracefully:
     - If no active semester is configured (semester_id is None), only checks
       that ANY successful tuition payment exists for the session.
+    - Grandfather clause: also True if the student has ANY ever-successful
+      tuition payment (students who paid before semester tracking was
+      introduced have transactions with NULL semester_id).
     """
-    if semester_id:
-        res = Database.execute_query(
-            """SELECT id FROM payment_transactions
-               WHERE user_id = %s
-                 AND tran_type = 'tuition'
-                 AND tran_status = 'successful'
-                 AND academic_session_id = %s
-                 AND semester_id = %s
-               LIMIT 1""",
-            (user_id, session_id, semester_id)
-        )
-    else:
-        res = Database.execute_query(
-            """SELECT id FROM payment_transactions
-               WHERE user_id = %s
-                 AND tran_type = 'tuition'
-                 AND tran_status = 'successful'
-                 AND academic_session_id = %s
-               LIMIT 1""",
-            (user_id, session_id)
-        )
-    return bool(res)
-
-
-def _has_any_tuition_paid(user_id):
-    """Grandfather clause: return True if the student has ANY ever-successful tuition
-    payment (used to avoid locking out students who paid before semester tracking
-    was introduced and whose transactions therefore have NULL semester_id)."""
-    res = Database.execute_query(
-        """SELECT id FROM payment_transactions
-           WHERE user_id = %s
-             AND tran_type = 'tuition'
-             AND tran_status = 'successful'
-           LIMIT 1""",
-        (user_id,)
-    )
-    return bool(res)
+    return session_ledger.has_paid_tuition(user_id, session_id, semester_id)
 
 
 @student_bp.route('/change-password', methods=['POST'])
@@ -294,10 +263,7 @@ def get_courses(payload):
             # ── Tuition payment guard ─────────────────────────────────────────
             active_sem = _get_active_semester()
             if active_sem:
-                paid = (
-                    _verify_tuition_paid(user_id, active_sem['session_id'], active_sem['id'])
-                    or _has_any_tuition_paid(user_id)
-                )
+                paid = _verify_tuition_paid(user_id, active_sem['session_id'], active_sem['id'])
                 if not paid:
                     return jsonify({
                         'message': (
@@ -478,10 +444,7 @@ def register_courses(payload):
     # ── Independent tuition payment check per session + semester ─────────────
     active_sem = _get_active_semester()
     if active_sem:
-        paid = (
-            _verify_tuition_paid(user_id, active_sem['session_id'], active_sem['id'])
-            or _has_any_tuition_paid(user_id)   # grandfather: pre-tracking payments
-        )
+        paid = _verify_tuition_paid(user_id, active_sem['session_id'], active_sem['id'])
         if not paid:
             return jsonify({
                 'message': (
@@ -729,6 +692,7 @@ def admin_update_student(payload):
                     (user_id, current_session_id)
                 )
                 print(f"[admin_update_student] Reset fully_paid_for_session for session {current_session_id}")
+                session_ledger.refresh(user_id, current_session_id, log_tag='admin_update_student')
 
         # Update applications table academic_session_id
         if session_id:
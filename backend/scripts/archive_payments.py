@@ -0,0 +1,102 @@
+"""
+Move old failed / cancelled payments to payment_transactions_archive and
+compact the raw_response_payload of the rows that stay.
+
+Run from the backend/ directory:
+    python scripts/archive_payments.py
+    python scripts/archive_payments.py --commit
+    python scripts/archive_payments.py --commit --after-days 30 --skip-compact
+
+Dry-run is the default.  The app's archive worker (utils/payment_archive.py)
+keeps moving rows from then on; this script is for the first, large run and
+for the one-off payload backfill.  Run VACUUM (or let autovacuum) afterwards
+so the freed space is reused; VACUUM FULL / pg_repack gives it back to the OS.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import Database
+from utils import payment_archive
+
+COMPACT_BATCH = 5000
+
+
+def report(after_days):
+    payment_archive.ensure_table()
+    archivable = Database.execute_query(
+        '''SELECT tran_status, COUNT(*) AS n FROM payment_transactions
+           WHERE tran_status = ANY(%s) AND updated_at < NOW() - %s * INTERVAL '1 day'
+           GROUP BY tran_status''',
+        (list(payment_archive.ARCHIVABLE_STATUSES), after_days)
+    ) or []
+    payloads = Database.execute_query(
+        f'''SELECT COUNT(*) AS n,
+                   COALESCE(SUM(pg_column_size(raw_response_payload)), 0) AS bytes,
+                   COALESCE(SUM(pg_column_size({payment_archive.compact_payload_sql('raw_response_payload')})), 0) AS compact_bytes
+            FROM payment_transactions
+            WHERE raw_response_payload IS NOT NULL'''
+    )[0]
+    print(f"\nRows older than {after_days:g} day(s) to archive:")
+    for r in archivable:
+        print(f"  {r['tran_status']:<12} {r['n']:>10}")
+    if not archivable:
+        print("  none")
+    print(f"\nraw_response_payload: {payloads['n']} row(s), "
+          f"{payloads['bytes'] / 1e6:.1f} MB now, {payloads['compact_bytes'] / 1e6:.1f} MB compacted")
+
+
+def compact_hot_payloads():
+    """Rewrite raw_response_payload in id ranges; one short transaction per range."""
+    bounds = Database.execute_query('SELECT MIN(id) AS lo, MAX(id) AS hi FROM payment_transactions')[0]
+    if bounds['lo'] is None:
+        return 0
+    compact = payment_archive.compact_payload_sql('raw_response_payload')
+    rewritten = 0
+    for start in range(bounds['lo'], bounds['hi'] + 1, COMPACT_BATCH):
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                f'''UPDATE payment_transactions
+                    SET raw_response_payload = {compact}
+                    WHERE id >= %s AND id < %s
+                      AND raw_response_payload IS NOT NULL
+                      AND raw_response_payload IS DISTINCT FROM {compact}''',
+                (start, start + COMPACT_BATCH)
+            )
+            rewritten += cursor.rowcount
+    return rewritten
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old failed / cancelled payments and compact payloads.")
+    parser.add_argument("--after-days", type=float, default=Config.PAYMENT_ARCHIVE_AFTER_DAYS,
+                        help="Archive rows unchanged for this many days (default: PAYMENT_ARCHIVE_AFTER_DAYS).")
+    parser.add_argument("--batch-size", type=int, default=Config.PAYMENT_ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--skip-compact", action="store_true", help="Only archive; leave hot payloads alone.")
+    parser.add_argument("--commit", action="store_true", help="Actually move and rewrite rows.")
+    args = parser.parse_args()
+
+    report(args.after_days)
+    if not args.commit:
+        print("\n*** DRY-RUN ONLY ***")
+        print("No changes were made to the database.")
+        print("To archive and compact, run this script with --commit:")
+        print("  python scripts/archive_payments.py --commit")
+        return
+
+    started = time.perf_counter()
+    summary = payment_archive.run_archive(after_days=args.after_days, batch_size=args.batch_size)
+    print(f"\nArchived {summary['archived']} row(s) in {summary['batches']} batch(es), "
+          f"{time.perf_counter() - started:.1f}s.")
+    if not args.skip_compact:
+        started = time.perf_counter()
+        print(f"Compacted {compact_hot_payloads()} payload(s) in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
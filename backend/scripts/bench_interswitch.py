@@ -0,0 +1,280 @@
+"""
+Benchmarks for the Interswitch integration, run against the local stub.
+Run from the backend/ directory:
+    python scripts/bench_interswitch.py engine                       # 300 txns, 150ms stub
+    python scripts/bench_interswitch.py engine --transactions 500 --concurrency 1,8,16 --rate 20
+    python scripts/bench_interswitch.py engine --base-url http://127.0.0.1:8099
+    python scripts/bench_interswitch.py engine --error-rate 0.1 --timeout-rate 0.02 --read-timeout 2
+    python scripts/bench_interswitch.py client                       # p50/p99, pooled vs fresh
+    python scripts/bench_interswitch.py client --base-url https://sandbox.interswitchng.com --requests 50
+    python scripts/bench_interswitch.py writeback --user-id 123      # 10k rows, DEVELOPMENT database only
+
+`engine` pushes synthetic pending transactions through the same
+requery_concurrently() engine the background worker uses, once per
+concurrency level, and prints wall time and requeries/sec.  No database is
+touched — write-back is replaced by a counter.  The stub's fault options
+(--error-rate, --timeout-rate, --reset-rate, --jitter-ms) turn it into a
+chaos run: errors are counted and, once enough fail, the circuit breaker
+defers the rest.
+
+`client` times sequential requery_transaction() calls twice: with the
+pooled keep-alive session ("pooled") and with a new session per call, the
+way the client used to work ("fresh").  Against the plain-HTTP stub the gap
+is only TCP setup; point --base-url at a TLS endpoint to see the handshake
+cost as well.
+
+`writeback` times the requery worker's database writes for a synthetic
+backlog of --rows transactions owned by --user-id, row-at-a-time (the old
+worker) against batched set-based (expire_stale_pending) and batched
+(RequeryWriteBatch), and prints rows/sec.  It inserts BENCHWB-* rows and
+deletes them afterwards; expire_stale_pending also expires any real stale
+rows, so only run it against a development database.
+"""
+
+import sys
+import os
+import time
+import argparse
+from collections import Counter
+
+# Allow imports from backend root
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from config import Config
+
+
+def _point_client_at(base_url):
+    from utils.interswitch import InterswitchClient
+    Config.INTERSWITCH_BASE_URL     = base_url
+    Config.INTERSWITCH_PASSPORT_URL = base_url
+    Config.INTERSWITCH_TOKEN_SHARED = False   # keep the bench off the database
+    InterswitchClient._token            = None
+    InterswitchClient._token_expires_at = 0.0
+    return InterswitchClient
+
+
+def cmd_engine(args):
+    from background_requery import requery_concurrently, _DEFERRED
+
+    stub, base_url = _start_stub_or_use(args)
+    client = _point_client_at(base_url)
+    client._get_token()
+
+    txns = [{'reference_no': f'BENCH{i:06d}', 'amount_kobo': 1_000_000} for i in range(args.transactions)]
+    print(f'{args.transactions} transactions against {base_url}'
+          f'{f" (stub latency {args.latency_ms}ms)" if stub else ""}, '
+          f'rate limit {args.rate or "none"}/s, deadline {args.deadline}s\n')
+    print(f'{"CONCURRENCY":>11} {"WALL s":>8} {"REQ/s":>8} {"DONE":>6} {"ERRORS":>7} {"DEFERRED":>9}  CODES')
+
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        codes, done, errors, deferred, last_ref = Counter(), 0, 0, 0, ''
+        started = time.perf_counter()
+        results = requery_concurrently(
+            txns, lambda t: client.requery_transaction(t['reference_no'], t['amount_kobo']),
+            concurrency=concurrency, rate_per_second=args.rate, deadline_seconds=args.deadline,
+        )
+        for txn, response, error in results:
+            # Write-back order must match input order
+            assert txn['reference_no'] > last_ref, 'results out of order'
+            last_ref = txn['reference_no']
+            if response is _DEFERRED:
+                deferred += 1
+            elif error is not None:
+                errors += 1
+            else:
+                done += 1
+                codes[response.get('ResponseCode')] += 1
+        wall = time.perf_counter() - started
+        print(f'{concurrency:>11} {wall:>8.2f} {done / wall:>8.1f} {done:>6} {errors:>7} {deferred:>9}  {dict(codes)}')
+
+    if stub:
+        stub.shutdown()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[idx]
+
+
+def _start_stub_or_use(args):
+    if args.read_timeout:
+        Config.INTERSWITCH_READ_TIMEOUT = args.read_timeout
+    if args.base_url:
+        return None, args.base_url
+    sys.path.insert(0, os.path.dirname(__file__))
+    from interswitch_stub import start_in_thread
+    stub = start_in_thread(
+        latency_ms=args.latency_ms, codes=args.codes or ['00'], jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate, reset_rate=args.reset_rate,
+        hang_seconds=Config.INTERSWITCH_READ_TIMEOUT + 1, seed=args.seed,
+    )
+    return stub, stub.base_url
+
+
+def cmd_client(args):
+    import requests
+
+    stub, base_url = _start_stub_or_use(args)
+    client = _point_client_at(base_url)
+    client._get_token()
+    pooled_http = client._http
+
+    print(f'{args.requests} sequential requeries per mode against {base_url}\n')
+    print(f'{"MODE":>7} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8} {"ERRORS":>7}')
+    for mode in ('fresh', 'pooled'):
+        if mode == 'fresh':
+            # One Session per call == the old bare requests.get() behaviour
+            client._http = classmethod(lambda cls: requests.Session())
+        else:
+            client._http = pooled_http
+        samples, errors = [], 0
+        for i in range(args.requests):
+            started = time.perf_counter()
+            try:
+                client.requery_transaction(f'BENCH{i:06d}', 1_000_000)
+                samples.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+        print(f'{mode:>7} {_percentile(samples, 50):>8.2f} {_percentile(samples, 90):>8.2f} '
+              f'{_percentile(samples, 99):>8.2f} {max(samples or [0]):>8.2f} {errors:>7}')
+    client._http = pooled_http
+
+    if stub:
+        stub.shutdown()
+
+
+def _insert_backlog(user_id, rows, stale):
+    from database import Database
+    from psycopg2.extras import execute_values
+    age = "NOW() - INTERVAL '2 days'" if stale else 'NOW()'
+    with Database.get_cursor() as cursor:
+        cursor.execute("DELETE FROM payment_transactions WHERE reference_no LIKE 'BENCHWB-%%'")
+        execute_values(
+            cursor,
+            '''INSERT INTO payment_transactions
+                   (user_id, reference_no, amount, amount_in_kobo, tran_type, tran_status,
+                    requery_count, next_requery_at, created_at, updated_at)
+               VALUES %s''',
+            [(user_id, f'BENCHWB-{i:06d}') for i in range(rows)],
+            template=f"(%s, %s, 10000, 1000000, 'tuition', 'pending', 0, NOW(), {age}, NOW())",
+            page_size=1000,
+        )
+        # Plan against the backlog, not the pre-insert row count
+        cursor.execute('ANALYZE payment_transactions')
+    return [f'BENCHWB-{i:06d}' for i in range(rows)]
+
+
+def _report(label, rows, wall):
+    print(f'{label:<34} {rows:>7} {wall:>8.2f} {rows / wall if wall else 0:>10.0f}')
+
+
+def cmd_writeback(args):
+    from database import Database
+    from utils.payment_status import (
+        build_update_sql_params, expire_stale_pending, mark_requery_error, RequeryWriteBatch,
+    )
+
+    print(f'{args.rows} synthetic transactions for user {args.user_id}\n')
+    print(f'{"WRITE PATH":<34} {"ROWS":>7} {"WALL s":>8} {"ROWS/s":>10}')
+
+    # ── Stale expiry ──────────────────────────────────────────────────────────
+    refs = _insert_backlog(args.user_id, args.rows, stale=True)
+    started = time.perf_counter()
+    for ref in refs:
+        Database.execute_update(
+            """UPDATE payment_transactions
+               SET tran_status = 'failed',
+                   response_description = 'Transaction expired (stale pending)',
+                   updated_at = NOW()
+               WHERE reference_no = %s""",
+            (ref,)
+        )
+    _report('expire: one UPDATE per row', len(refs), time.perf_counter() - started)
+
+    refs = _insert_backlog(args.user_id, args.rows, stale=True)
+    started = time.perf_counter()
+    expired = expire_stale_pending()
+    _report('expire: expire_stale_pending()', expired, time.perf_counter() - started)
+
+    # ── Result write-back: pending / failed / cancelled / requery error ──────
+    outcomes = [('pending', 'Z25'), ('failed', '51'), ('cancelled', 'Z6'), ('requery_error', None)]
+
+    def _outcome(i):
+        status, code = outcomes[i % len(outcomes)]
+        return status, code, {'ResponseCode': code, 'ResponseDescription': 'bench', 'Amount': 1_000_000}
+
+    refs = _insert_backlog(args.user_id, args.rows, stale=False)
+    started = time.perf_counter()
+    for i, ref in enumerate(refs):
+        status, code, resp = _outcome(i)
+        if code is None:
+            mark_requery_error(ref)
+        else:
+            Database.execute_update(*build_update_sql_params(status, ref, code, 'bench', resp, 1_000_000))
+    _report('write-back: one UPDATE per row', len(refs), time.perf_counter() - started)
+
+    refs = _insert_backlog(args.user_id, args.rows, stale=False)
+    started = time.perf_counter()
+    writer = RequeryWriteBatch(args.batch)
+    for i, ref in enumerate(refs):
+        status, code, resp = _outcome(i)
+        if code is None:
+            writer.add_error(ref)
+        else:
+            writer.add_result(status, ref, code, 'bench', resp, 1_000_000)
+    written = writer.flush()
+    _report(f'write-back: RequeryWriteBatch({args.batch})', written, time.perf_counter() - started)
+
+    Database.execute_update("DELETE FROM payment_transactions WHERE reference_no LIKE 'BENCHWB-%%'")
+
+
+def _add_stub_args(p, latency_ms):
+    p.add_argument('--latency-ms', type=float, default=latency_ms, help='Stub response latency.')
+    p.add_argument('--jitter-ms', type=float, default=0, help='Stub latency jitter (±).')
+    p.add_argument('--code', action='append', dest='codes',
+                   help='Stub response code or class, CODE[:WEIGHT] (repeatable).')
+    p.add_argument('--error-rate', type=float, default=0, help='Share of requeries answered with a 5xx.')
+    p.add_argument('--timeout-rate', type=float, default=0, help='Share of requeries held past the read timeout.')
+    p.add_argument('--reset-rate', type=float, default=0, help='Share of requeries dropped without an answer.')
+    p.add_argument('--read-timeout', type=float, help='Override INTERSWITCH_READ_TIMEOUT for the run.')
+    p.add_argument('--seed', type=int, help='Seed for the stub fault draws.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Interswitch integration against a local stub.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_engine = sub.add_parser('engine', help='Throughput of the concurrent requery engine.')
+    p_engine.add_argument('--transactions', type=int, default=300)
+    p_engine.add_argument('--concurrency', default='1,4,8,16',
+                          help='Comma-separated concurrency levels to compare.')
+    p_engine.add_argument('--rate', type=float, default=0, help='Global requests/sec limit (0 = none).')
+    p_engine.add_argument('--deadline', type=float, default=240, help='Per-run deadline in seconds.')
+    _add_stub_args(p_engine, latency_ms=150)
+    p_engine.add_argument('--base-url', help='Use an already running stub instead of starting one.')
+    p_engine.set_defaults(func=cmd_engine)
+
+    p_client = sub.add_parser('client', help='p50/p99 requery latency, pooled session vs fresh connections.')
+    p_client.add_argument('--requests', type=int, default=200)
+    _add_stub_args(p_client, latency_ms=20)
+    p_client.add_argument('--base-url', help='Use an already running stub (or real endpoint) instead.')
+    p_client.set_defaults(func=cmd_client)
+
+    p_write = sub.add_parser('writeback', help="Rows/sec of the worker's DB writes, per row vs batched.")
+    p_write.add_argument('--user-id', type=int, required=True, help='Throwaway user id to own the synthetic rows.')
+    p_write.add_argument('--rows', type=int, default=10_000)
+    p_write.add_argument('--batch', type=int, default=200, help='RequeryWriteBatch size.')
+    p_write.set_defaults(func=cmd_writeback)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
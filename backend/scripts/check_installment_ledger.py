@@ -0,0 +1,118 @@
+"""
+Check that settling a tuition installment shows up in the session ledger.
+Run from the backend/ directory against a DEVELOPMENT database, with a
+throwaway student account:
+    python scripts/check_installment_ledger.py --user-id 123 --session-id 4 --installment-plan-id 1
+    python scripts/check_installment_ledger.py --user-id 123 --session-id 4 --null-session
+
+It inserts a pending tuition transaction for the user and settles it through
+payment_status.atomic_settle_payment with the same final update a '00'
+requery writes, then reads the ledger back.  It checks that:
+
+  • the transaction is 'successful' with amount_paid set,
+  • the ledger row for the session counts the payment: paid equals the
+    session's successful tuition total, went up by at least the amount,
+    and the installment plan is listed,
+  • session_ledger.has_paid_tuition() is True for the session.
+
+--null-session inserts the payment without an academic_session_id, as
+payments from before session tracking were, and only checks the
+grandfather clause: has_paid_tuition() must still be True.
+
+Settling tuition also applies its downstream effect (the application is
+marked 'enrolled').  The rows it creates are left in place for inspection.
+"""
+
+import sys
+import os
+import time
+import argparse
+
+# Allow imports from backend root
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def _create_transaction(args):
+    from database import Database
+    reference_no = f"LEDGER-{int(time.time())}-{os.getpid()}"
+    Database.execute_update(
+        '''INSERT INTO payment_transactions
+               (user_id, academic_session_id, semester_id, installment_plan_id, amount, amount_in_kobo,
+                reference_no, tran_status, tran_type, currency, next_requery_at, created_at, updated_at)
+           VALUES (%s, %s, %s, %s, %s, %s, %s, 'pending', 'tuition', '566', NOW(), NOW(), NOW())''',
+        (args.user_id, None if args.null_session else args.session_id, args.semester_id,
+         args.installment_plan_id, args.amount, int(args.amount * 100), reference_no),
+    )
+    return reference_no
+
+
+def _ledger_paid(user_id, session_id):
+    from utils import session_ledger
+    row = session_ledger.get(user_id, session_id)
+    return (float(row['paid']), list(row['installments_paid'] or [])) if row else (0.0, [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Settle one tuition installment and check the session ledger.')
+    parser.add_argument('--user-id', type=int, required=True, help='Throwaway student user id.')
+    parser.add_argument('--session-id', type=int, required=True, help='academic_sessions.id to pay for.')
+    parser.add_argument('--installment-plan-id', type=int, default=None)
+    parser.add_argument('--semester-id', type=int, default=None)
+    parser.add_argument('--amount', type=float, default=50000)
+    parser.add_argument('--null-session', action='store_true',
+                        help='Store the payment without academic_session_id (pre-tracking payment).')
+    args = parser.parse_args()
+
+    from database import Database
+    from utils import session_ledger
+    from utils.payment_status import atomic_settle_payment, build_update_sql_params, generate_receipt_no
+
+    paid_before, _ = _ledger_paid(args.user_id, args.session_id)
+    reference_no = _create_transaction(args)
+    amount_kobo  = int(args.amount * 100)
+
+    isw_resp = {'ResponseCode': '00', 'ResponseDescription': 'Approved by Financial Institution',
+                'Amount': amount_kobo}
+    receipt_no = generate_receipt_no(payment_type='tuition', session_id=args.session_id)
+    final_update = build_update_sql_params(
+        'successful', reference_no, '00', isw_resp['ResponseDescription'], isw_resp, amount_kobo, receipt_no,
+    )
+    settled = atomic_settle_payment(reference_no, args.user_id, 'tuition', final_update=final_update)
+
+    txn = Database.execute_query(
+        'SELECT tran_status, amount_paid FROM payment_transactions WHERE reference_no = %s',
+        (reference_no,)
+    )[0]
+    paid_after, installments = _ledger_paid(args.user_id, args.session_id)
+    has_paid = session_ledger.has_paid_tuition(args.user_id, args.session_id, args.semester_id)
+    total = Database.execute_query(
+        '''SELECT COALESCE(SUM(amount_paid), 0) AS paid FROM payment_transactions
+           WHERE user_id = %s AND academic_session_id = %s
+             AND tran_type = 'tuition' AND tran_status = 'successful' ''',
+        (args.user_id, args.session_id)
+    )[0]
+
+    checks = [
+        ('settled by this run',        settled),
+        ('transaction successful',     txn['tran_status'] == 'successful' and txn['amount_paid'] is not None),
+        ('has_paid_tuition',           has_paid),
+    ]
+    if not args.null_session:
+        checks += [
+            ('ledger paid = payments', abs(paid_after - float(total['paid'])) < 0.005),
+            ('ledger paid +amount',    paid_after - paid_before >= args.amount - 0.005),
+            ('installment in ledger',  args.installment_plan_id is None or args.installment_plan_id in installments),
+        ]
+
+    print(f'Reference {reference_no}: status={txn["tran_status"]} amount_paid={txn["amount_paid"]}')
+    print(f'Ledger session {args.session_id}: paid {paid_before:.2f} -> {paid_after:.2f}, installments {installments}')
+    for name, ok in checks:
+        print(f'  {"ok  " if ok else "FAIL"} {name}')
+    sys.exit(0 if all(ok for _, ok in checks) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Leader-election check for the background requery worker.
+Run from the backend/ directory against a DEVELOPMENT database:
+    python scripts/check_leader_election.py
+    python scripts/check_leader_election.py --processes 6 --ttl 6
+
+Starts --processes separate processes, each holding a LeaderLease on a
+throwaway lease name (not 'payment-requery', so a running server is not
+affected), and samples every 100ms how many of them think they are leader.
+It then
+  1. kills the leader with SIGKILL (no release) and times the failover,
+  2. stops the new leader cleanly (release at exit) and times that handover,
+and checks that there was never more than one leader at a time.
+"""
+
+import sys
+import os
+import time
+import signal
+import argparse
+import multiprocessing as mp
+
+# Allow imports from backend root
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+LEASE_NAME = 'leader-election-check'
+
+
+def _member(index, ttl, flags, stop):
+    from utils.leader_lease import LeaderLease
+    lease = LeaderLease(LEASE_NAME, ttl_seconds=ttl)
+    lease.start()
+    while not stop.is_set():
+        flags[index] = 1 if lease.is_leader() else 0
+        time.sleep(0.02)
+    flags[index] = 0
+    lease.stop()
+
+
+def _leaders(flags, procs):
+    return [i for i, p in enumerate(procs) if p.is_alive() and flags[i]]
+
+
+def _wait_for_leader(flags, procs, timeout, max_seen):
+    """Seconds until exactly one live leader; tracks the most leaders seen at once."""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        leaders = _leaders(flags, procs)
+        max_seen[0] = max(max_seen[0], len(leaders))
+        if len(leaders) == 1:
+            return time.monotonic() - started, leaders[0]
+        time.sleep(0.1)
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that exactly one process holds the requery lease.')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--ttl', type=float, default=3.0, help='Lease TTL in seconds.')
+    args = parser.parse_args()
+
+    from database import Database
+    from utils.leader_lease import ensure_table
+    ensure_table()
+    Database.execute_update('DELETE FROM worker_leases WHERE name = %s', (LEASE_NAME,))
+
+    ctx   = mp.get_context('spawn')
+    flags = ctx.Array('i', args.processes)
+    stops = [ctx.Event() for _ in range(args.processes)]
+    procs = [ctx.Process(target=_member, args=(i, args.ttl, flags, stops[i]), daemon=True)
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+
+    max_seen = [0]
+    ok = True
+    limit = args.ttl * 2 + 5
+
+    elapsed, leader = _wait_for_leader(flags, procs, limit + 10, max_seen)
+    print(f'initial election     {elapsed if elapsed is not None else -1:6.2f}s  leader=#{leader}')
+    ok &= leader is not None
+
+    # Watch a few heartbeats for a second leader
+    watch_until = time.monotonic() + args.ttl * 2
+    while time.monotonic() < watch_until:
+        max_seen[0] = max(max_seen[0], len(_leaders(flags, procs)))
+        time.sleep(0.1)
+
+    if leader is not None:
+        os.kill(procs[leader].pid, signal.SIGKILL)
+        procs[leader].join()
+        elapsed, leader = _wait_for_leader(flags, procs, limit, max_seen)
+        print(f'failover (SIGKILL)   {elapsed if elapsed is not None else -1:6.2f}s  leader=#{leader}  '
+              f'(bound ~ ttl + ttl/3 = {args.ttl * 4 / 3:.1f}s)')
+        ok &= leader is not None
+
+    if leader is not None:
+        stops[leader].set()
+        procs[leader].join()
+        elapsed, leader = _wait_for_leader(flags, procs, limit, max_seen)
+        print(f'handover (release)   {elapsed if elapsed is not None else -1:6.2f}s  leader=#{leader}  '
+              f'(bound ~ ttl/3 = {args.ttl / 3:.1f}s)')
+        ok &= leader is not None
+
+    for i, p in enumerate(procs):
+        stops[i].set()
+    for p in procs:
+        p.join(timeout=5)
+    Database.execute_update('DELETE FROM worker_leases WHERE name = %s', (LEASE_NAME,))
+
+    print(f'\nmost leaders seen at once: {max_seen[0]}')
+    ok &= max_seen[0] <= 1
+    print('OK' if ok else 'FAIL')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Concurrency check for payment settlement.
+Run from the backend/ directory against a DEVELOPMENT database, with a
+throwaway applicant account:
+    python scripts/check_settlement_race.py --user-id 123 --session-id 4
+    python scripts/check_settlement_race.py --user-id 123 --session-id 4 --program-type-id 1 --runs 10
+
+For each run it inserts a fresh pending application-fee transaction for the
+user and then fires the three settlement paths at the same instant, all
+answered '00' by a local Interswitch stub:
+
+    callback  POST /applicant/payment/callback (inline mode)
+    webhook   webhook_inbox.process_webhook()
+    worker    background_requery.write_requery_result()
+
+It checks that exactly one path won the settlement, that the row ends up
+'successful' with a receipt, and that downstream effects were applied
+exactly once (one application row for the reference).  It also reports DB
+statements and connection-pool checkouts per run.
+
+The rows it creates are left in place for inspection.
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+
+# Allow imports from backend root
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from config import Config
+
+
+def _snapshot():
+    from utils import metrics
+    from utils.payment_status import SETTLEMENTS
+    return {
+        'statements':   metrics.DB_QUERY_SECONDS.total_count(),
+        'checkouts':    metrics.DB_POOL_WAIT_SECONDS.total_count(),
+        'won':          SETTLEMENTS.value(outcome='won'),
+        'lost':         SETTLEMENTS.value(outcome='lost'),
+        'failed':       SETTLEMENTS.value(outcome='failed'),
+    }
+
+
+def _create_transaction(args, run):
+    from database import Database
+    reference_no = f"RACE-{int(time.time())}-{run:03d}-{os.getpid()}"
+    Database.execute_update(
+        '''INSERT INTO payment_transactions
+               (user_id, academic_session_id, amount, amount_in_kobo, reference_no,
+                tran_status, tran_type, currency, raw_request_payload,
+                next_requery_at, created_at, updated_at)
+           VALUES (%s, %s, %s, %s, %s, 'pending', 'application_fee', '566', %s::jsonb,
+                   NOW(), NOW(), NOW())''',
+        (args.user_id, args.session_id, args.amount, int(args.amount * 100), reference_no,
+         json.dumps({'program_type_id': args.program_type_id})),
+    )
+    return reference_no
+
+
+def _fire(reference_no, client):
+    from database import Database
+    from webhook_inbox import process_webhook
+    from background_requery import write_requery_result
+    from utils.interswitch import InterswitchClient
+
+    barrier = threading.Barrier(3)
+    errors  = []
+
+    def callback():
+        barrier.wait()
+        client.post('/e-portal/api/applicant/payment/callback', data={'txnref': reference_no})
+
+    def webhook():
+        barrier.wait()
+        process_webhook(reference_no)
+
+    def worker():
+        txn = Database.execute_query(
+            '''SELECT id, reference_no, receipt_no, amount_in_kobo, amount, tran_type, user_id,
+                      COALESCE(requery_count, 0) AS requery_count
+               FROM payment_transactions WHERE reference_no = %s''',
+            (reference_no,)
+        )[0]
+        barrier.wait()
+        response = InterswitchClient.requery_transaction(reference_no, txn['amount_in_kobo'])
+        write_requery_result(txn, response, {'resolved_success': 0, 'resolved_failed': 0,
+                                             'still_pending': 0, 'errors': 0})
+
+    def guarded(fn):
+        def run():
+            try:
+                fn()
+            except Exception as exc:
+                errors.append(f'{fn.__name__}: {exc!r}')
+        return run
+
+    threads = [threading.Thread(target=guarded(fn)) for fn in (callback, webhook, worker)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def _verify(reference_no):
+    from database import Database
+    txn = Database.execute_query(
+        'SELECT tran_status, receipt_no FROM payment_transactions WHERE reference_no = %s',
+        (reference_no,)
+    )[0]
+    apps = Database.execute_query(
+        '''SELECT (SELECT COUNT(*) FROM applications   WHERE application_payment_reference = %s)
+                + (SELECT COUNT(*) FROM pg_application WHERE application_payment_reference = %s) AS n''',
+        (reference_no, reference_no)
+    )
+    return txn, int(apps[0]['n']) if apps else -1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fire concurrent settlements of one payment and check the outcome.')
+    parser.add_argument('--user-id', type=int, required=True, help='Throwaway applicant user id.')
+    parser.add_argument('--session-id', type=int, required=True, help='academic_sessions.id for the transaction.')
+    parser.add_argument('--program-type-id', type=int, default=1)
+    parser.add_argument('--amount', type=float, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    from interswitch_stub import start_in_thread
+    stub = start_in_thread(latency_ms=20, codes=['00'])
+    Config.INTERSWITCH_BASE_URL     = stub.base_url
+    Config.INTERSWITCH_PASSPORT_URL = stub.base_url
+    Config.INTERSWITCH_TOKEN_SHARED = False
+    Config.PAYMENT_CALLBACK_MODE    = 'inline'
+
+    # Only the applicant blueprint: create_app() would also start the
+    # background workers, which would settle real pending rows against the stub
+    from flask import Flask
+    from routes.applicant import applicant_bp
+    app = Flask(__name__)
+    app.register_blueprint(applicant_bp, url_prefix='/e-portal/api/applicant')
+    client = app.test_client()
+
+    print(f'{"RUN":>3} {"REFERENCE":<32} {"WON":>3} {"LOST":>4} {"FAIL":>4} {"STATUS":<11} {"APPS":>4} '
+          f'{"STMTS":>5} {"CHKOUT":>6}  RESULT')
+    ok_runs = 0
+    for run in range(1, args.runs + 1):
+        reference_no = _create_transaction(args, run)
+        before = _snapshot()
+        errors = _fire(reference_no, client)
+        after  = _snapshot()
+        txn, apps = _verify(reference_no)
+
+        delta = {k: after[k] - before[k] for k in after}
+        ok = (delta['won'] == 1 and delta['failed'] == 0 and not errors
+              and txn['tran_status'] == 'successful' and txn['receipt_no'] and apps == 1)
+        ok_runs += ok
+        print(f'{run:>3} {reference_no:<32} {delta["won"]:>3.0f} {delta["lost"]:>4.0f} {delta["failed"]:>4.0f} '
+              f'{txn["tran_status"]:<11} {apps:>4} {delta["statements"]:>5} {delta["checkouts"]:>6}  '
+              f'{"ok" if ok else "FAIL"}')
+        for err in errors:
+            print(f'      {err}')
+
+    stub.shutdown()
+    print(f'\n{ok_runs}/{args.runs} runs settled exactly once.')
+    sys.exit(0 if ok_runs == args.runs else 1)
+
+
+if __name__ == '__main__':
+    main()
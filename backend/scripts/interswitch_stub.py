@@ -0,0 +1,461 @@
+"""
+Local Interswitch stub for benchmarks, chaos runs and offline testing.
+Run from the backend/ directory:
+    python scripts/interswitch_stub.py                          # :8099, 150ms, always '00'
+    python scripts/interswitch_stub.py --latency-ms 400 --code 00 --code T0
+    python scripts/interswitch_stub.py --code success:80 --code pending:15 --code failed:5
+    python scripts/interswitch_stub.py --error-rate 0.05 --timeout-rate 0.02 --jitter-ms 100
+    python scripts/interswitch_stub.py --webhook-url http://127.0.0.1:5000/e-portal/api/applicant/payment-webhook
+
+Then point the app at it (the webpay redirect follows INTERSWITCH_BASE_URL):
+    INTERSWITCH_BASE_URL=http://127.0.0.1:8099
+    INTERSWITCH_PASSPORT_URL=http://127.0.0.1:8099
+
+Serves:
+    POST /passport/oauth/token                      → fake bearer token
+    GET  /collections/api/v1/gettransaction.json    → requery response
+    GET  /collections/w/pay                         → webpay page (pay / pending / decline / cancel)
+    POST /collections/w/pay/complete                → records the outcome, posts back to site_redirect_url
+    GET  /_stub/stats                               → request and fault counters
+    POST /_stub/script                              → change codes, sequences or faults at runtime
+    POST /_stub/reset                               → forget sequences, payments and counters
+
+Response codes.  --code takes a code or a class and an optional weight
+(CODE[:WEIGHT]).  The classes are success ('00') and pending, cancelled and
+failed, which draw from PENDING_CODES, CANCELLED_CODES and
+DEFINITIVE_FAILURE_CODES in utils/payment_status.py.  The code is picked per
+reference with a stable hash, so the same reference always gets the same
+answer.  --sequence REF=T0,T0,00 (or POST /_stub/script) makes successive
+requeries of REF walk the list and then repeat its last code.  A reference
+paid on the webpay page answers with the outcome chosen there.
+
+Faults (requery only unless noted), each drawn per request with --seed:
+    --error-rate    HTTP 500/502/503
+    --timeout-rate  hold the response for --hang-seconds (past the client's read timeout)
+    --reset-rate    close the connection without answering
+    --not-found-rate HTTP 404 (the client reads this as pending 'T0')
+    --token-error-rate HTTP 503 from passport
+"""
+
+import sys
+import os
+import json
+import time
+import zlib
+import html
+import random
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Allow imports from backend root
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+CODE_CLASSES = ('success', 'pending', 'cancelled', 'failed')
+
+FAULTS = ('error_rate', 'timeout_rate', 'reset_rate', 'not_found_rate', 'token_error_rate')
+
+# Buttons on the webpay page: label → response code
+WEBPAY_OUTCOMES = (
+    ('Pay',               '00'),
+    ('Leave pending',     'T0'),
+    ('Decline',           '51'),
+    ('Cancel',            'Z6'),
+)
+
+
+def _code_classes() -> dict:
+    from utils.payment_status import PENDING_CODES, CANCELLED_CODES, DEFINITIVE_FAILURE_CODES
+    return {
+        'success':   ['00'],
+        'pending':   sorted(PENDING_CODES),
+        'cancelled': sorted(CANCELLED_CODES),
+        'failed':    sorted(DEFINITIVE_FAILURE_CODES),
+    }
+
+
+def parse_codes(specs) -> list:
+    """['00:80', 'pending:20'] → weighted list of codes / class names."""
+    codes = []
+    for spec in specs or ['00']:
+        code, _, weight = str(spec).partition(':')
+        codes.extend([code.strip()] * max(1, int(weight or 1)))
+    return codes or ['00']
+
+
+def _description(code: str) -> str:
+    if code == '00':
+        return 'Approved by Financial Institution'
+    if code in ('Z0', 'Z6', 'Z9'):
+        return 'Transaction cancelled by user'
+    return f'Stub response {code}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, like the real gateway
+    disable_nagle_algorithm = True  # otherwise delayed ACKs add ~40ms per keep-alive response
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, payload: bytes, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, body):
+        self._send(status, json.dumps(body).encode(), 'application/json')
+
+    def _send_html(self, status, body):
+        self._send(status, body.encode(), 'text/html; charset=utf-8')
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _inject_fault(self, endpoint) -> bool:
+        """Apply a drawn fault. True if the request has been answered (or dropped)."""
+        fault = self.server.draw_fault(endpoint)
+        if fault is None:
+            return False
+        if fault == 'reset_rate':
+            self.close_connection = True
+        elif fault == 'timeout_rate':
+            time.sleep(self.server.hang_seconds)
+            self.close_connection = True
+        elif fault == 'not_found_rate':
+            self._send_json(404, {'error': 'transaction not found'})
+        else:
+            self._send_json(self.server.random_choice((500, 502, 503)), {'error': 'injected failure'})
+        return True
+
+    # ── Routing ───────────────────────────────────────────────────────────────
+    def do_POST(self):
+        body = self._read_body()
+        path = urllib.parse.urlparse(self.path).path
+        if path.startswith('/passport/oauth/token'):
+            self.server.count('token')
+            if self._inject_fault('token'):
+                return
+            self._send_json(200, {'access_token': 'stub-token', 'token_type': 'bearer', 'expires_in': 3600})
+        elif path == '/collections/w/pay/complete':
+            self._webpay_complete(urllib.parse.parse_qs(body.decode()))
+        elif path == '/_stub/script':
+            try:
+                self._send_json(200, self.server.apply_script(json.loads(body or b'{}')))
+            except (ValueError, TypeError) as exc:
+                self._send_json(400, {'error': str(exc)})
+        elif path == '/_stub/reset':
+            self.server.reset()
+            self._send_json(200, {'ok': True})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path == '/collections/api/v1/gettransaction.json':
+            self._requery(urllib.parse.parse_qs(url.query))
+        elif url.path == '/collections/w/pay':
+            self._webpay_page(urllib.parse.parse_qs(url.query))
+        elif url.path == '/_stub/stats':
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    # ── gettransaction.json ───────────────────────────────────────────────────
+    def _requery(self, query):
+        self.server.count('requery')
+        self.server.sleep_latency()
+        if self._inject_fault('requery'):
+            return
+        ref    = (query.get('transactionreference') or [''])[0]
+        amount = int((query.get('amount') or ['0'])[0] or 0)
+        code, paid_amount = self.server.next_code(ref)
+        self.server.count(f'code:{code}')
+        self._send_json(200, {
+            'ResponseCode':        code,
+            'ResponseDescription': _description(code),
+            'Amount':              paid_amount if paid_amount is not None else amount,
+            'MerchantReference':   ref,
+            'PaymentReference':    f'STUB|{ref}',
+            'TransactionDate':     time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+
+    # ── Webpay ────────────────────────────────────────────────────────────────
+    def _webpay_page(self, query):
+        self.server.count('webpay')
+        params = {k: v[0] for k, v in query.items()}
+        missing = [k for k in ('txn_ref', 'amount', 'site_redirect_url') if not params.get(k)]
+        if missing:
+            self._send_html(400, f'<p>Missing {", ".join(missing)}</p>')
+            return
+
+        if self.server.webpay_auto:
+            # Load tests: skip the buttons and settle with the scripted outcome
+            code = self.server.webpay_auto
+            if code == 'script':
+                code, _ = self.server.next_code(params['txn_ref'], advance=False)
+            else:
+                code = self.server.resolve(code, params['txn_ref'])
+            self._webpay_complete({k: [v] for k, v in {**params, 'resp': code}.items()})
+            return
+
+        hidden = ''.join(
+            f'<input type="hidden" name="{html.escape(k)}" value="{html.escape(v)}">'
+            for k, v in params.items()
+        )
+        buttons = ''.join(
+            f'<button name="resp" value="{code}">{label} ({code})</button> '
+            for label, code in WEBPAY_OUTCOMES
+        )
+        naira = int(params['amount']) / 100
+        self._send_html(200, f'''<!doctype html>
+<html><head><title>Interswitch stub — pay</title></head>
+<body style="font-family: sans-serif; max-width: 32em; margin: 3em auto">
+  <h2>Interswitch stub</h2>
+  <p>Reference <b>{html.escape(params['txn_ref'])}</b><br>
+     Amount <b>&#8358;{naira:,.2f}</b><br>
+     Customer {html.escape(params.get('cust_name', ''))} &lt;{html.escape(params.get('cust_email', ''))}&gt;</p>
+  <form method="post" action="/collections/w/pay/complete">{hidden}{buttons}</form>
+</body></html>''')
+
+    def _webpay_complete(self, form):
+        params = {k: v[0] for k, v in form.items()}
+        ref, code = params.get('txn_ref', ''), params.get('resp', '00')
+        amount = int(params.get('amount') or 0)
+        self.server.record_payment(ref, code, amount)
+        self.server.count('webpay_complete')
+
+        fields = {'txnref': ref, 'amount': str(amount), 'resp': code, 'desc': _description(code)}
+        if 'application/json' in (self.headers.get('Accept') or ''):
+            # Scripted clients cannot run the auto-submit form; give them what it would post
+            self._send_json(200, {'site_redirect_url': params.get('site_redirect_url'), 'form': fields})
+            return
+        inputs = ''.join(
+            f'<input type="hidden" name="{k}" value="{html.escape(v)}">' for k, v in fields.items()
+        )
+        self._send_html(200, f'''<!doctype html>
+<html><body onload="document.forms[0].submit()">
+  <form method="post" action="{html.escape(params.get('site_redirect_url', ''))}">{inputs}
+    <noscript><button>Continue</button></noscript>
+  </form>
+</body></html>''')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=150, codes=('00',), verbose=False, jitter_ms=0,
+                 hang_seconds=35.0, sequences=None, webhook_url=None, webhook_delay_ms=500,
+                 webpay_auto=None, seed=None, **faults):
+        super().__init__(address, StubHandler)
+        unknown = set(faults) - set(FAULTS)
+        if unknown:
+            raise TypeError(f'Unknown stub options: {", ".join(sorted(unknown))}')
+        self.latency          = latency_ms / 1000.0
+        self.jitter           = jitter_ms / 1000.0
+        self.codes            = parse_codes(codes)
+        self.verbose          = verbose
+        self.hang_seconds     = hang_seconds
+        self.webhook_url      = webhook_url
+        self.webhook_delay    = webhook_delay_ms / 1000.0
+        self.webpay_auto      = webpay_auto
+        self.faults           = {name: float(faults.get(name) or 0) for name in FAULTS}
+        self._classes         = None
+        self._random          = random.Random(seed)
+        self._lock            = threading.Lock()
+        self._sequences       = {ref: list(seq) for ref, seq in (sequences or {}).items()}
+        self._sequence_pos    = Counter()
+        self._payments        = {}     # reference → (code, amount_kobo)
+        self.requests         = Counter({'token': 0, 'requery': 0})
+
+    # ── Counters ──────────────────────────────────────────────────────────────
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests':  {k: v for k, v in self.requests.items() if not k.startswith(('fault:', 'code:'))},
+                'codes':     {k[5:]: v for k, v in self.requests.items() if k.startswith('code:')},
+                'faults':    {k[6:]: v for k, v in self.requests.items() if k.startswith('fault:')},
+                'payments':  len(self._payments),
+                'sequences': len(self._sequences),
+                'config':    {'codes': self.codes, 'latency_ms': self.latency * 1000,
+                              'jitter_ms': self.jitter * 1000, **self.faults},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._sequences.clear()
+            self._sequence_pos.clear()
+            self._payments.clear()
+            self.requests = Counter({'token': 0, 'requery': 0})
+
+    # ── Behaviour ─────────────────────────────────────────────────────────────
+    def random_choice(self, options):
+        with self._lock:
+            return self._random.choice(options)
+
+    def sleep_latency(self):
+        delay = self.latency
+        if self.jitter:
+            with self._lock:
+                delay += self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def draw_fault(self, endpoint):
+        names = ('token_error_rate',) if endpoint == 'token' else (
+            'reset_rate', 'error_rate', 'timeout_rate', 'not_found_rate')
+        with self._lock:
+            roll = self._random.random()
+            for name in names:
+                roll -= self.faults[name]
+                if roll < 0:
+                    self.requests[f'fault:{name[:-5]}'] += 1
+                    return name
+        return None
+
+    def resolve(self, code, ref):
+        """A class name → one of its codes, stable per reference; codes pass through."""
+        if code not in CODE_CLASSES:
+            return code
+        if self._classes is None:
+            self._classes = _code_classes()
+        options = self._classes[code]
+        return options[zlib.crc32(ref.encode()) % len(options)]
+
+    def next_code(self, ref, advance=True) -> tuple:
+        """(response code, paid amount or None) for the next requery of ref."""
+        with self._lock:
+            sequence = self._sequences.get(ref)
+            if sequence:
+                pos = self._sequence_pos[ref]
+                if advance:
+                    self._sequence_pos[ref] += 1
+                return self.resolve(sequence[min(pos, len(sequence) - 1)], ref), None
+            if ref in self._payments:
+                return self._payments[ref]
+            return self.resolve(self.codes[zlib.crc32(ref.encode()) % len(self.codes)], ref), None
+
+    def record_payment(self, ref, code, amount_kobo):
+        with self._lock:
+            self._payments[ref] = (code, amount_kobo)
+            # A later webpay outcome replaces any scripted sequence for the reference
+            self._sequences.pop(ref, None)
+        if self.webhook_url:
+            threading.Thread(target=self._send_webhook, args=(ref, code, amount_kobo), daemon=True).start()
+
+    def _send_webhook(self, ref, code, amount_kobo):
+        time.sleep(self.webhook_delay)
+        payload = json.dumps({
+            'event':                'TRANSACTION.COMPLETED',
+            'transactionReference': ref,
+            'responseCode':         code,
+            'amount':               amount_kobo,
+        }).encode()
+        req = urllib.request.Request(self.webhook_url, data=payload, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                self.count(f'webhook_{resp.status}')
+        except Exception as exc:
+            self.count('webhook_error')
+            if self.verbose:
+                print(f'[interswitch_stub] webhook for {ref} failed: {exc}')
+
+    def apply_script(self, body: dict) -> dict:
+        """
+        Runtime changes, all keys optional:
+            {"codes": ["00:90", "pending:10"],
+             "sequences": {"REF1": ["T0", "T0", "00"]},
+             "faults": {"error_rate": 0.1},
+             "latency_ms": 50, "jitter_ms": 10}
+        """
+        if not isinstance(body, dict):
+            raise TypeError('expected a JSON object')
+        unknown = set(body.get('faults') or {}) - set(FAULTS)
+        if unknown:
+            raise ValueError(f'unknown faults: {", ".join(sorted(unknown))}')
+        with self._lock:
+            if 'codes' in body:
+                self.codes = parse_codes(body['codes'])
+            for ref, seq in (body.get('sequences') or {}).items():
+                self._sequences[ref] = list(seq)
+                self._sequence_pos.pop(ref, None)
+            for name, rate in (body.get('faults') or {}).items():
+                self.faults[name] = float(rate)
+            if 'latency_ms' in body:
+                self.latency = float(body['latency_ms']) / 1000.0
+            if 'jitter_ms' in body:
+                self.jitter = float(body['jitter_ms']) / 1000.0
+        return self.stats()['config']
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_in_thread(latency_ms=150, codes=('00',), port=0, **options) -> StubServer:
+    """Start a stub on 127.0.0.1 (random port by default) in a daemon thread."""
+    server = StubServer(('127.0.0.1', port), latency_ms=latency_ms, codes=codes, **options)
+    threading.Thread(target=server.serve_forever, name='interswitch-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local Interswitch stub.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=150)
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Uniform ± jitter on the latency.')
+    parser.add_argument('--code', action='append', dest='codes',
+                        help='CODE or class (success/pending/cancelled/failed), optionally :WEIGHT. '
+                             'Repeatable. Default: 00')
+    parser.add_argument('--sequence', action='append', default=[], metavar='REF=CODE,CODE,...',
+                        help='Codes returned to successive requeries of REF (repeatable).')
+    for fault in FAULTS:
+        parser.add_argument(f'--{fault.replace("_", "-")}', type=float, default=0, dest=fault)
+    parser.add_argument('--hang-seconds', type=float, default=35, help='How long a timeout fault holds the response.')
+    parser.add_argument('--webhook-url', help='POST a webhook here after each webpay outcome.')
+    parser.add_argument('--webhook-delay-ms', type=float, default=500)
+    parser.add_argument('--webpay-auto', metavar='CODE',
+                        help="Skip the webpay buttons and complete with CODE ('script' = the --code mix).")
+    parser.add_argument('--seed', type=int, help='Seed for fault and jitter draws.')
+    parser.add_argument('--verbose', action='store_true', help='Log every request.')
+    args = parser.parse_args()
+
+    sequences = {}
+    for item in args.sequence:
+        ref, _, codes = item.partition('=')
+        if not ref or not codes:
+            parser.error(f'--sequence expects REF=CODE,CODE,... (got {item!r})')
+        sequences[ref] = [c.strip() for c in codes.split(',') if c.strip()]
+
+    server = StubServer(
+        (args.host, args.port), latency_ms=args.latency_ms, codes=args.codes, verbose=args.verbose,
+        jitter_ms=args.jitter_ms, hang_seconds=args.hang_seconds, sequences=sequences,
+        webhook_url=args.webhook_url, webhook_delay_ms=args.webhook_delay_ms,
+        webpay_auto=args.webpay_auto, seed=args.seed,
+        **{fault: getattr(args, fault) for fault in FAULTS},
+    )
+    faults = {k: v for k, v in server.faults.items() if v}
+    print(f'Interswitch stub on {server.base_url} (latency {args.latency_ms}ms, codes {server.codes}'
+          f'{f", faults {faults}" if faults else ""})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+-- ============================================================================
+-- Migration: Add document_counters
+-- Purpose: One row per receipt / form-number prefix, incremented with
+--          UPDATE ... RETURNING by utils/counters.py instead of counting
+--          existing rows.  Seed it from existing data afterwards:
+--              python scripts/seed_document_counters.py --commit
+--          utils/counters.py expects this table (MissingTable until it
+--          exists) and seeds any counter it has not seen from existing numbers.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS document_counters (
+    name       VARCHAR(100) PRIMARY KEY,     -- e.g. receipt:PCU/ACC/2025-26, form:PCU/2026/UTME
+    value      BIGINT       NOT NULL,        -- last number handed out
+    updated_at TIMESTAMP    NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,22 @@
+-- ============================================================================
+-- Migration: Add error_log_counts aggregate table
+-- Purpose: 404/500 errors are buffered in memory and flushed as hourly counts
+--          per (error_type, path_template); error_logs keeps only a sample.
+--          utils/error_recorder.py expects this table; until it exists the
+--          flushes are dropped with a warning naming this file.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS error_log_counts (
+    id             SERIAL PRIMARY KEY,
+    error_type     VARCHAR(10)  NOT NULL,
+    path_template  TEXT         NOT NULL,
+    window_start   TIMESTAMP    NOT NULL,
+    count          INTEGER      NOT NULL DEFAULT 0,
+    last_message   TEXT,
+    last_path      TEXT,
+    last_seen_at   TIMESTAMP,
+    UNIQUE (error_type, path_template, window_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_error_log_counts_window
+    ON error_log_counts (window_start);
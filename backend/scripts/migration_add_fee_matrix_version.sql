@@ -0,0 +1,39 @@
+-- ============================================================================
+-- Migration: Add fee_matrix_version and its invalidation triggers
+-- Purpose: utils/fee_matrix.py caches the fee configuration per process and
+--          reloads it when this version moves.  Every statement that changes
+--          one of the source tables bumps it.
+--          Until this has run, utils/fee_matrix.py reloads the matrix every
+--          FEE_MATRIX_FALLBACK_TTL seconds instead.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS fee_matrix_version (
+    id         SMALLINT    PRIMARY KEY CHECK (id = 1),   -- single row
+    version    BIGINT      NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO fee_matrix_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_fee_matrix_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE fee_matrix_version SET version = version + 1, updated_at = NOW() WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['program_fees', 'fee_components', 'installment_plans',
+                             'academic_sessions', 'program_types', 'program_setup', 'pg_program_setup']
+    LOOP
+        IF to_regclass(t) IS NOT NULL THEN
+            EXECUTE format('DROP TRIGGER IF EXISTS trg_fee_matrix_version ON %I', t);
+            EXECUTE format('CREATE TRIGGER trg_fee_matrix_version
+                            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+                            FOR EACH STATEMENT EXECUTE FUNCTION bump_fee_matrix_version()', t);
+        END IF;
+    END LOOP;
+END $$;
@@ -0,0 +1,18 @@
+-- ============================================================================
+-- Migration: Add interswitch_requery_cache
+-- Purpose: Optional cross-worker cache of the last Interswitch requery
+--          response per reference (INTERSWITCH_REQUERY_CACHE_SHARED=true).
+--          Rows are only trusted for INTERSWITCH_REQUERY_CACHE_TTL seconds.
+--          utils/interswitch.py expects this table when the shared cache is
+--          on; until it exists requeries skip the cache and log this file.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS interswitch_requery_cache (
+    reference_no VARCHAR(100) PRIMARY KEY,
+    amount_kobo  BIGINT      NOT NULL,
+    response     JSONB       NOT NULL,
+    fetched_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Old rows are useless after a few seconds; prune occasionally, e.g.
+-- DELETE FROM interswitch_requery_cache WHERE fetched_at < NOW() - INTERVAL '1 day';
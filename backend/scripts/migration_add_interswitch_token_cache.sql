@@ -0,0 +1,15 @@
+-- ============================================================================
+-- Migration: Add interswitch_token_cache
+-- Purpose: One shared Interswitch OAuth token for all gunicorn workers.
+--          The worker that finds it stale claims the refresh through
+--          refresh_claimed_until (see
+--          migration_add_interswitch_token_refresh_claim.sql); the rest read it.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS interswitch_token_cache (
+    id           SMALLINT PRIMARY KEY CHECK (id = 1),
+    access_token TEXT,
+    expires_at   TIMESTAMPTZ,
+    fetched_by   TEXT,
+    updated_at   TIMESTAMPTZ DEFAULT NOW()
+);
@@ -0,0 +1,10 @@
+-- ============================================================================
+-- Migration: Add refresh_claimed_until to interswitch_token_cache
+-- Purpose: The worker refreshing the shared Interswitch token marks the row
+--          as claimed until this time and commits.  The passport call then
+--          runs without a row lock or a pooled connection held.  The other
+--          workers poll the row.  A crashed refresher's claim simply expires.
+-- ============================================================================
+
+ALTER TABLE interswitch_token_cache
+    ADD COLUMN IF NOT EXISTS refresh_claimed_until TIMESTAMPTZ;
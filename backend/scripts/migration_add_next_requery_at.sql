@@ -0,0 +1,15 @@
+-- ============================================================================
+-- Migration: Add next_requery_at to payment_transactions
+-- Purpose: Per-transaction requery scheduling with exponential backoff.
+--          The background worker selects only rows whose next_requery_at is
+--          due, through a partial index over unresolved transactions.
+--          The requery worker only checks for the column and skips its runs
+--          until this has been applied.
+-- ============================================================================
+
+ALTER TABLE payment_transactions
+    ADD COLUMN IF NOT EXISTS next_requery_at TIMESTAMP DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_payment_transactions_due
+    ON payment_transactions (next_requery_at)
+    WHERE tran_status IN ('pending', 'requery_error');
@@ -0,0 +1,30 @@
+-- ============================================================================
+-- Migration: Add payment_daily_rollup and payment_rollup_dirty
+-- Purpose: Daily revenue / funnel rollups per (initiation day, tran_type,
+--          program type, status) for GET /e-portal/api/finance/reports/daily,
+--          kept fresh by utils/payment_rollup.py (settlements mark their day
+--          dirty; a leader-elected worker recomputes dirty and recent days).
+--          Backfill it afterwards:
+--              python scripts/rebuild_payment_rollup.py --commit
+--          utils/payment_rollup.py expects these tables: until they exist
+--          the worker is not started and the report answers 503.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS payment_daily_rollup (
+    day                   DATE          NOT NULL,     -- payment_transactions.created_at::date
+    tran_type             VARCHAR(40)   NOT NULL,
+    program_type          INTEGER       NOT NULL,     -- program_types.id, 0 = unknown
+    tran_status           VARCHAR(20)   NOT NULL,
+    txn_count             INTEGER       NOT NULL,
+    amount                NUMERIC(16,2) NOT NULL,
+    amount_paid           NUMERIC(16,2) NOT NULL,
+    mismatches            INTEGER       NOT NULL,
+    median_settle_seconds DOUBLE PRECISION,           -- confirmed_at - created_at
+    refreshed_at          TIMESTAMP     NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (day, tran_type, program_type, tran_status)
+);
+
+CREATE TABLE IF NOT EXISTS payment_rollup_dirty (
+    day       DATE      PRIMARY KEY,
+    marked_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
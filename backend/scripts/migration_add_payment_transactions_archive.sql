@@ -0,0 +1,49 @@
+-- ============================================================================
+-- Migration: Add payment_transactions_archive
+-- Purpose: Failed / cancelled payments unchanged for PAYMENT_ARCHIVE_AFTER_DAYS
+--          are moved here by utils/payment_archive.py; successful rows never
+--          leave payment_transactions.  The partial index lets the mover find
+--          candidates without scanning the hot table.  First run and payload
+--          backfill:
+--              python scripts/archive_payments.py --commit
+--          utils/payment_archive.py only reads this schema: it will not
+--          archive until the table exists and has every payment_transactions
+--          column.  Re-run this file after adding a column there.
+--          The last index is built CONCURRENTLY; run it on its own, outside
+--          a transaction block.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS payment_transactions_archive (LIKE payment_transactions);
+
+ALTER TABLE payment_transactions_archive
+    ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT NOW();
+
+-- Columns payment_transactions has gained since the archive was created
+DO $$
+DECLARE
+    c RECORD;
+BEGIN
+    FOR c IN
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod) AS type
+        FROM pg_attribute a
+        WHERE a.attrelid = 'payment_transactions'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+          AND NOT EXISTS (SELECT 1 FROM pg_attribute b
+                          WHERE b.attrelid = 'payment_transactions_archive'::regclass
+                            AND b.attname = a.attname AND NOT b.attisdropped)
+    LOOP
+        EXECUTE format('ALTER TABLE payment_transactions_archive ADD COLUMN %I %s', c.attname, c.type);
+    END LOOP;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payment_transactions_archive_reference
+    ON payment_transactions_archive (reference_no);
+
+CREATE INDEX IF NOT EXISTS idx_payment_transactions_archive_created
+    ON payment_transactions_archive (created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_payment_transactions_archive_user
+    ON payment_transactions_archive (user_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payment_transactions_archivable
+    ON payment_transactions (updated_at)
+    WHERE tran_status IN ('failed', 'cancelled');
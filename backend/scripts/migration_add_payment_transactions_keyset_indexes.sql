@@ -0,0 +1,15 @@
+-- ============================================================================
+-- Migration: Add keyset-pagination indexes to payment_transactions
+-- Purpose: The finance transaction explorer (routes/finance.py) pages newest
+--          first over (created_at, id).  These let each page, and the
+--          per-session view, read one index range instead of sorting the
+--          table.
+--          CONCURRENTLY avoids blocking payments while the index builds; run
+--          each statement on its own, outside a transaction block.
+-- ============================================================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payment_transactions_created
+    ON payment_transactions (created_at, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payment_transactions_session_created
+    ON payment_transactions (academic_session_id, created_at, id);
@@ -0,0 +1,34 @@
+-- ============================================================================
+-- Migration: Add payment_webhook_inbox
+-- Purpose: Interswitch webhooks are persisted here and acknowledged at once;
+--          webhook_inbox.py workers drain the table with SKIP LOCKED.
+--          At most one queued ('received') row per reference_no.
+--          webhook_inbox.py only checks that the table exists; until this
+--          has run the endpoint processes webhooks synchronously.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS payment_webhook_inbox (
+    id               BIGSERIAL PRIMARY KEY,
+    reference_no     VARCHAR(100) NOT NULL,
+    payload          JSONB,
+    status           VARCHAR(20)  NOT NULL DEFAULT 'received',  -- received | processing | done | failed
+    receive_count    INTEGER      NOT NULL DEFAULT 1,
+    attempts         INTEGER      NOT NULL DEFAULT 0,
+    outcome          VARCHAR(30),
+    last_error       TEXT,
+    received_at      TIMESTAMP    NOT NULL DEFAULT NOW(),
+    last_received_at TIMESTAMP    NOT NULL DEFAULT NOW(),
+    started_at       TIMESTAMP,
+    processed_at     TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_payment_webhook_inbox_received
+    ON payment_webhook_inbox (reference_no) WHERE status = 'received';
+
+CREATE INDEX IF NOT EXISTS idx_payment_webhook_inbox_open
+    ON payment_webhook_inbox (id) WHERE status IN ('received', 'processing');
+
+-- Retention: webhook_inbox.purge_done deletes 'done' rows older than
+-- WEBHOOK_INBOX_RETENTION_DAYS (safe to re-run this file to add it)
+CREATE INDEX IF NOT EXISTS idx_payment_webhook_inbox_done
+    ON payment_webhook_inbox (processed_at) WHERE status = 'done';
@@ -0,0 +1,26 @@
+-- ============================================================================
+-- Migration: Add student_session_ledger
+-- Purpose: One row per (student, academic session) with what is owed and
+--          paid for tuition, refreshed by utils/session_ledger.py whenever a
+--          tuition payment settles.  Backfill it afterwards:
+--              python scripts/rebuild_session_ledger.py --commit
+--          utils/session_ledger.py expects this table (MissingTable until it
+--          exists) and builds a student's rows the first time they are read.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS student_session_ledger (
+    user_id             INTEGER       NOT NULL,
+    academic_session_id INTEGER       NOT NULL,
+    program_type        VARCHAR(20),                        -- fee key the row was priced with
+    level_id            VARCHAR(20),
+    faculty_id          VARCHAR(20),
+    expected            NUMERIC(14,2) NOT NULL DEFAULT 0,    -- tuition for the session (excl. acceptance)
+    paid                NUMERIC(14,2) NOT NULL DEFAULT 0,    -- SUM(amount_paid) of successful tuition
+    remaining           NUMERIC(14,2) NOT NULL DEFAULT 0,
+    payments_count      INTEGER       NOT NULL DEFAULT 0,
+    installments_paid   INTEGER[]     NOT NULL DEFAULT '{}', -- installment_plans.id
+    semesters_paid      INTEGER[]     NOT NULL DEFAULT '{}', -- semesters.id
+    fully_paid          BOOLEAN       NOT NULL DEFAULT FALSE,
+    updated_at          TIMESTAMP     NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, academic_session_id)
+);
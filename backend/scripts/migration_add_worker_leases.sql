@@ -0,0 +1,19 @@
+-- ============================================================================
+-- Migration: Add worker_leases
+-- Purpose: Leader election for background jobs that must run in exactly one
+--          process across the cluster (the payment requery worker).  The
+--          holder of a row is the leader until expires_at; it renews the row
+--          every ttl/3 seconds and expires it on shutdown.
+--          utils/leader_lease.py expects this table; until it exists the
+--          requery worker runs in every process and logs this file.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS worker_leases (
+    name             VARCHAR(100) PRIMARY KEY,              -- e.g. 'payment-requery'
+    holder           VARCHAR(200) NOT NULL,                 -- host:pid:nonce
+    acquired_at      TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+    heartbeat_at     TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+    expires_at       TIMESTAMPTZ  NOT NULL,
+    last_run_at      TIMESTAMPTZ,
+    last_run_summary JSONB
+);
@@ -0,0 +1,101 @@
+"""
+Size of payment_transactions (and its archive) and the latency of the
+queries that run against it all day.  Run before and after archiving /
+compacting to see what changed:
+
+    python scripts/payment_table_stats.py
+    python scripts/payment_table_stats.py --runs 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+TABLES = ('payment_transactions', 'payment_transactions_archive')
+
+# name → (sql, params); params are filled from a sample row at run time
+HOT_QUERIES = {
+    'requery due (worker)': (
+        '''SELECT reference_no, user_id, tran_type, amount_in_kobo
+           FROM payment_transactions
+           WHERE tran_status IN ('pending', 'requery_error')
+             AND next_requery_at <= NOW()
+             AND created_at >= NOW() - INTERVAL '24 hours'
+           ORDER BY next_requery_at ASC LIMIT 200''',
+        lambda s: (),
+    ),
+    'by reference (callback)': (
+        'SELECT * FROM payment_transactions WHERE reference_no = %s',
+        lambda s: (s['reference_no'],),
+    ),
+    "user's payments": (
+        '''SELECT id, tran_status FROM payment_transactions
+           WHERE user_id = %s AND tran_type = %s ORDER BY created_at DESC''',
+        lambda s: (s['user_id'], s['tran_type']),
+    ),
+    'explorer first page': (
+        '''SELECT * FROM payment_transactions
+           ORDER BY created_at DESC, id DESC LIMIT 50''',
+        lambda s: (),
+    ),
+    "today's funnel": (
+        '''SELECT tran_status, COUNT(*) FROM payment_transactions
+           WHERE created_at >= CURRENT_DATE GROUP BY tran_status''',
+        lambda s: (),
+    ),
+}
+
+
+def sizes():
+    print(f"\n{'TABLE':<30} {'ROWS':>10} {'HEAP MB':>9} {'TOAST MB':>9} {'INDEX MB':>9} {'TOTAL MB':>9} {'PAYLOAD B':>10}")
+    for table in TABLES:
+        exists = Database.execute_query('SELECT to_regclass(%s) AS r', (table,))
+        if not exists or not exists[0]['r']:
+            continue
+        r = Database.execute_query(
+            f'''SELECT (SELECT COUNT(*) FROM {table}) AS rows,
+                       pg_relation_size(%(t)s::regclass) AS heap,
+                       COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0) AS toast,
+                       pg_indexes_size(%(t)s::regclass) AS idx,
+                       pg_total_relation_size(%(t)s::regclass) AS total,
+                       (SELECT AVG(pg_column_size(raw_response_payload)) FROM {table}) AS payload
+                FROM pg_class c WHERE c.oid = %(t)s::regclass''',
+            {'t': table}
+        )[0]
+        mb = lambda b: f"{b / 1e6:9.1f}"
+        payload = f"{r['payload']:10.0f}" if r['payload'] is not None else f"{'-':>10}"
+        print(f"{table:<30} {r['rows']:>10} {mb(r['heap'])} {mb(r['toast'])} {mb(r['idx'])} {mb(r['total'])} {payload}")
+
+
+def latencies(runs):
+    samples = Database.execute_query(
+        '''SELECT reference_no, user_id, tran_type FROM payment_transactions
+           ORDER BY random() LIMIT %s''',
+        (runs,)
+    ) or []
+    if not samples:
+        print("\npayment_transactions is empty; no latencies to measure.")
+        return
+    print(f"\n{'HOT QUERY':<26} {'p50 ms':>8} {'p95 ms':>8}   ({runs} runs)")
+    for name, (sql, params) in HOT_QUERIES.items():
+        timings = []
+        for i in range(runs):
+            started = time.perf_counter()
+            Database.execute_query(sql, params(samples[i % len(samples)]))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{name:<26} {statistics.median(timings):8.2f} {timings[int(len(timings) * 0.95) - 1]:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="payment_transactions size and hot-query latency.")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per query (default 20).")
+    args = parser.parse_args()
+    sizes()
+    latencies(max(1, args.runs))
@@ -0,0 +1,124 @@
+"""
+Inspect request profiles written by utils/profiler.py.
+Run from the backend/ directory:
+    python scripts/profiles.py list                 # newest first
+    python scripts/profiles.py list --route applications
+    python scripts/profiles.py show <id|latest>     # metadata, hot frames, queries
+    python scripts/profiles.py open <id|latest>     # open flamegraph in speedscope
+
+To capture a profile, call any endpoint with an admin token plus
+`X-Profile: 1` (or `?__profile=1`); the id comes back in X-Profile-Id.
+"""
+
+import sys
+import os
+import json
+import shutil
+import argparse
+import subprocess
+from collections import Counter
+
+# Allow imports from backend root
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from config import Config
+
+
+def _load_all():
+    if not os.path.isdir(Config.PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(Config.PROFILE_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(Config.PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda p: p.get('id', ''), reverse=True)
+    return profiles
+
+
+def _resolve(profile_id):
+    profiles = _load_all()
+    if not profiles:
+        sys.exit(f'No profiles in {Config.PROFILE_DIR}')
+    if profile_id == 'latest':
+        return profiles[0]
+    matches = [p for p in profiles if p['id'].startswith(profile_id)]
+    if len(matches) != 1:
+        sys.exit(f'{len(matches)} profile(s) match "{profile_id}"')
+    return matches[0]
+
+
+def cmd_list(args):
+    profiles = [p for p in _load_all() if not args.route or args.route in p.get('route', '')]
+    if not profiles:
+        print(f'No profiles in {Config.PROFILE_DIR}')
+        return
+    print(f'{"ID":<70} {"STATUS":>6} {"TOTAL ms":>9} {"DB ms":>8} {"QUERIES":>7}')
+    for p in profiles[:args.limit]:
+        print(f'{p["id"]:<70} {p.get("status", ""):>6} {p.get("duration_ms") or 0:>9.1f} '
+              f'{p.get("db_ms") or 0:>8.1f} {p.get("query_count", 0):>7}')
+
+
+def cmd_show(args):
+    p = _resolve(args.id)
+    print(f'{p["method"]} {p["path"]}  ({p["route"]})')
+    print(f'  status {p["status"]}, total {p["duration_ms"]} ms, db {p["db_ms"]} ms, '
+          f'{p["samples"]} samples @ {p["interval_ms"]} ms, {p["query_count"]} queries')
+
+    # Self time: the leaf frame of every folded stack
+    self_time, total = Counter(), 0
+    with open(os.path.join(Config.PROFILE_DIR, p['id'] + '.collapsed')) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            self_time[stack.rsplit(';', 1)[-1]] += int(count)
+            total += int(count)
+    if total:
+        print(f'\nTop {args.top} frames by self time:')
+        for frame, count in self_time.most_common(args.top):
+            print(f'  {count / total * 100:5.1f}%  {frame}')
+
+    if p['queries']:
+        print(f'\nSlowest {args.top} queries:')
+        for q in sorted(p['queries'], key=lambda q: q['ms'], reverse=True)[:args.top]:
+            print(f'  {q["ms"]:8.2f} ms  @{q["offset_ms"]:>8} ms  [{q["kind"]}] {q["sql"][:120]}')
+
+
+def cmd_open(args):
+    p = _resolve(args.id)
+    path = os.path.join(Config.PROFILE_DIR, p['id'] + '.collapsed')
+    speedscope = shutil.which('speedscope')
+    if speedscope:
+        subprocess.run([speedscope, path])
+    else:
+        print('speedscope CLI not found (npm install -g speedscope).')
+        print(f'Drag this file into https://www.speedscope.app/ instead:\n  {path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List and inspect saved request profiles.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_list = sub.add_parser('list', help='List recent profiles.')
+    p_list.add_argument('--limit', type=int, default=20)
+    p_list.add_argument('--route', help='Only profiles whose route contains this text.')
+    p_list.set_defaults(func=cmd_list)
+
+    p_show = sub.add_parser('show', help='Summarise one profile.')
+    p_show.add_argument('id', help='Profile id (prefix) or "latest".')
+    p_show.add_argument('--top', type=int, default=15)
+    p_show.set_defaults(func=cmd_show)
+
+    p_open = sub.add_parser('open', help='Open a profile flamegraph in speedscope.')
+    p_open.add_argument('id', help='Profile id (prefix) or "latest".')
+    p_open.set_defaults(func=cmd_open)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
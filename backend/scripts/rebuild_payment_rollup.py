@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import argparse
+from datetime import date, timedelta
+
+# Add parent directory to sys.path so we can import database helper
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from utils import payment_rollup
+
+
+def days_with_payments(since=None, until=None):
+    """Every initiation day in range that has at least one payment_transactions row."""
+    where, params = ['created_at IS NOT NULL'], []
+    if since:
+        where.append('created_at >= %s'); params.append(since)
+    if until:
+        where.append('created_at < %s'); params.append(until + timedelta(days=1))
+    rows = Database.execute_query(
+        f'''SELECT created_at::date AS day, COUNT(*) AS payments
+            FROM payment_transactions
+            WHERE {' AND '.join(where)}
+            GROUP BY 1 ORDER BY 1''',
+        params
+    ) or []
+    return {r['day']: int(r['payments']) for r in rows}
+
+
+def rebuild(since=None, until=None, commit=False):
+    print("Counting payments per day...")
+    targets = days_with_payments(since, until)
+
+    payment_rollup.ensure_table()
+    where, params = ['TRUE'], []
+    if since:
+        where.append('day >= %s'); params.append(since)
+    if until:
+        where.append('day <= %s'); params.append(until)
+    current = {
+        r['day']: int(r['payments'])
+        for r in (Database.execute_query(
+            f'''SELECT day, SUM(txn_count) AS payments FROM payment_daily_rollup
+                WHERE {' AND '.join(where)} GROUP BY day''',
+            params
+        ) or [])
+    }
+
+    missing = [d for d in targets if d not in current]
+    stale   = [d for d in targets if d in current and current[d] != targets[d]]
+    orphans = [d for d in current if d not in targets]
+
+    print(f"\n{'':<28} {'DAYS':>8}")
+    print(f"{'days with payments':<28} {len(targets):>8}")
+    print(f"{'rolled-up days':<28} {len(current):>8}")
+    print(f"{'missing':<28} {len(missing):>8}")
+    print(f"{'count differs':<28} {len(stale):>8}")
+    print(f"{'no longer has payments':<28} {len(orphans):>8}")
+    for day in sorted(stale + orphans)[:20]:
+        print(f"  {day}: rollup {current.get(day, 0)}, transactions {targets.get(day, 0)}")
+
+    if not commit:
+        print("\n*** DRY-RUN ONLY ***")
+        print("No changes were made to the database.")
+        print("To rebuild the rollups, run this script with --commit:")
+        print("  python scripts/rebuild_payment_rollup.py --commit")
+        return
+
+    # Every day is recomputed, not just the differing ones, so amounts,
+    # statuses and program types that changed without the count moving follow
+    days = sorted(set(targets) | set(current))
+    started = time.perf_counter()
+    for i in range(0, len(days), 30):
+        chunk = days[i:i + 30]
+        while payment_rollup.refresh_days(chunk, source='rebuild') is None:
+            print("  Another refresh is running, waiting...")
+            time.sleep(2)
+        print(f"  {min(i + 30, len(days))}/{len(days)} days...")
+    print(f"\nRebuilt {len(days)} day(s) in {time.perf_counter() - started:.1f}s.")
+
+
+def _date(value):
+    return date.fromisoformat(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild payment_daily_rollup from payment_transactions.")
+    parser.add_argument("--since", type=_date, help="First day to rebuild (YYYY-MM-DD).")
+    parser.add_argument("--until", type=_date, help="Last day to rebuild (YYYY-MM-DD).")
+    parser.add_argument("--commit", action="store_true", help="Actually write the rollup rows to the database.")
+    args = parser.parse_args()
+
+    rebuild(since=args.since, until=args.until, commit=args.commit)
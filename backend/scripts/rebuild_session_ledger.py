@@ -0,0 +1,88 @@
+import os
+import sys
+import argparse
+
+# Add parent directory to sys.path so we can import database helper
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from utils import session_ledger
+
+
+def collect(user_id=None):
+    """(user_id, session_id) → (paid, payments) from successful tuition transactions."""
+    where, params = '', ()
+    if user_id:
+        where, params = 'AND user_id = %s', (user_id,)
+    rows = Database.execute_query(
+        f'''SELECT user_id, academic_session_id,
+                   COALESCE(SUM(amount_paid), 0) AS paid, COUNT(*) AS payments
+            FROM payment_transactions
+            WHERE tran_type = 'tuition' AND tran_status = 'successful'
+              AND academic_session_id IS NOT NULL {where}
+            GROUP BY user_id, academic_session_id''',
+        params
+    ) or []
+    return {(r['user_id'], r['academic_session_id']): (float(r['paid']), int(r['payments'])) for r in rows}
+
+
+def rebuild(user_id=None, commit=False):
+    print("Summing successful tuition payments...")
+    targets = collect(user_id)
+
+    session_ledger.ensure_table()
+    where, params = '', ()
+    if user_id:
+        where, params = 'WHERE user_id = %s', (user_id,)
+    current = {
+        (r['user_id'], r['academic_session_id']): (float(r['paid']), int(r['payments_count']))
+        for r in (Database.execute_query(
+            f'SELECT user_id, academic_session_id, paid, payments_count FROM student_session_ledger {where}',
+            params
+        ) or [])
+    }
+
+    missing = [k for k in targets if k not in current]
+    stale   = [k for k in targets if k in current and current[k] != targets[k]]
+    orphans = [k for k in current if k not in targets and current[k][1] > 0]
+
+    print(f"\n{'':<28} {'ROWS':>8}")
+    print(f"{'(user, session) with tuition':<28} {len(targets):>8}")
+    print(f"{'ledger rows':<28} {len(current):>8}")
+    print(f"{'missing':<28} {len(missing):>8}")
+    print(f"{'paid total differs':<28} {len(stale):>8}")
+    print(f"{'no longer paid':<28} {len(orphans):>8}")
+    for key in (stale + orphans)[:20]:
+        have = current.get(key, (0, 0))
+        want = targets.get(key, (0, 0))
+        print(f"  user {key[0]}, session {key[1]}: ledger ₦{have[0]:,.2f} ({have[1]}), transactions ₦{want[0]:,.2f} ({want[1]})")
+
+    if not commit:
+        print("\n*** DRY-RUN ONLY ***")
+        print("No changes were made to the database.")
+        print("To rebuild the ledger, run this script with --commit:")
+        print("  python scripts/rebuild_session_ledger.py --commit")
+        return
+
+    # Every row for a user is refreshed, not just the differing ones, so the
+    # fee key and expected amount also follow level / course changes
+    users = sorted({k[0] for k in targets} | {k[0] for k in current})
+    written = 0
+    for i, uid in enumerate(users, 1):
+        sessions = {k[1] for k in targets if k[0] == uid} | {k[1] for k in current if k[0] == uid}
+        context = session_ledger.fee_context(uid)
+        for session_id in sorted(sessions):
+            if session_ledger.refresh(uid, session_id, context=context) is not None:
+                written += 1
+        if i % 500 == 0:
+            print(f"  {i}/{len(users)} users...")
+    print(f"\nRebuilt {written} ledger row(s) for {len(users)} user(s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild student_session_ledger from payment_transactions.")
+    parser.add_argument("--user-id", type=int, help="Only rebuild this user's rows.")
+    parser.add_argument("--commit", action="store_true", help="Actually write the ledger rows to the database.")
+    args = parser.parse_args()
+
+    rebuild(user_id=args.user_id, commit=args.commit)
@@ -0,0 +1,356 @@
+"""
+Reconcile an Interswitch settlement export against payment_transactions.
+
+Run from the backend/ directory:
+    python scripts/reconcile_settlement.py settlement.xlsx
+    python scripts/reconcile_settlement.py settlement.csv --session 12 --report recon.csv
+    python scripts/reconcile_settlement.py settlement.csv --since 2026-09-01 --until 2026-10-01 --apply
+
+Dry-run is the default.  The export and the matching slice of
+payment_transactions are loaded into DataFrames and joined on the reference,
+and every reference is classified:
+
+    matched                  settled, successful locally, amounts agree
+    amount_mismatch          settled amount differs from what we charged
+    settled_but_pending      settled, but not successful locally
+    amount_unreadable        the export's amount for the reference could not
+                             be parsed; never fixed automatically
+    missing_locally          settled reference we have no row for
+    duplicate_settlement     reference appears more than once in the export
+    missing_from_settlement  successful locally, not in the export
+                             (only with --session / --since / --until, which
+                             widen the slice beyond the file's references)
+
+--apply makes the fixes that need no judgement:
+  • settle   settled_but_pending rows still open for settlement (pending,
+             requery_error, gateway-cancelled).  The export is the proof of
+             payment, so no requery is done.  Each row goes through
+             atomic_settle_payment so downstream effects (application rows,
+             student records, session ledger) run exactly once.
+  • annotate successful rows whose amount_paid / is_amount_mismatch
+             disagree with the export are corrected in one UPDATE.
+Everything else is only reported.
+
+Column names are matched loosely (case, spaces and punctuation ignored);
+use --ref-column / --amount-column when the export uses other names.
+Amounts are read as naira unless --amount-unit kobo.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import Database
+from psycopg2.extras import execute_values
+from utils import payment_rollup
+from utils.payment_status import (
+    SettlementFailed,
+    atomic_settle_payment,
+    build_update_sql_params,
+    generate_receipt_no,
+)
+
+# Normalised header → our column, first match wins
+COLUMN_ALIASES = {
+    "reference_no": (
+        "merchantreference", "transactionreference", "merchanttransactionreference",
+        "txnref", "txnreference", "transactionref", "referenceno", "reference",
+    ),
+    "amount": ("transactionamount", "amount", "amountpaid"),
+    "response_code": ("responsecode", "respcode"),
+    "payment_reference": ("paymentreference", "retrievalreferencenumber", "rrn"),
+    "transaction_date": ("transactiondate", "paymentdate", "date"),
+}
+
+# Statuses atomic_settle_payment will still claim
+SETTLEABLE_STATUSES = ("pending", "requery_error")
+
+CLASSES = (
+    "matched", "amount_mismatch", "settled_but_pending", "amount_unreadable",
+    "missing_locally", "duplicate_settlement", "missing_from_settlement",
+)
+
+
+def _normalise(name) -> str:
+    return "".join(ch for ch in str(name).lower() if ch.isalnum())
+
+
+def load_settlement(path: str, ref_column=None, amount_column=None, amount_unit="naira") -> tuple:
+    """
+    Settlement export → (DataFrame with one row per reference, rows ignored
+    as not approved).  Columns: reference_no, settled_kobo, settlement_rows,
+    payment_reference, transaction_date.
+    """
+    if path.lower().endswith((".xlsx", ".xls")):
+        raw = pd.read_excel(path, dtype=str)
+    else:
+        raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+
+    headers = {_normalise(c): c for c in raw.columns}
+    overrides = {"reference_no": ref_column, "amount": amount_column}
+    columns = {}
+    for ours, aliases in COLUMN_ALIASES.items():
+        if overrides.get(ours):
+            columns[ours] = overrides[ours]
+            continue
+        found = next((headers[a] for a in aliases if a in headers), None)
+        if found:
+            columns[ours] = found
+    missing = [c for c in ("reference_no", "amount") if c not in columns]
+    if missing:
+        raise SystemExit(
+            f"Could not find {', '.join(missing)} in {path}; columns are {list(raw.columns)}. "
+            f"Use --ref-column / --amount-column."
+        )
+
+    df = pd.DataFrame({ours: raw[theirs] for ours, theirs in columns.items()})
+    df["reference_no"] = df["reference_no"].astype(str).str.strip()
+    df = df[df["reference_no"].ne("") & df["reference_no"].ne("nan")]
+
+    ignored = 0
+    if "response_code" in df:
+        approved = df["response_code"].fillna("").astype(str).str.strip().isin(("00", "0", ""))
+        ignored = int((~approved).sum())
+        df = df[approved]
+
+    amount = pd.to_numeric(
+        df["amount"].astype(str).str.replace(r"[^0-9.\-]", "", regex=True), errors="coerce"
+    )
+    scale = 1 if amount_unit == "kobo" else 100
+    df = df.assign(settled_kobo=(amount * scale).round().astype("Int64"))
+
+    for optional in ("payment_reference", "transaction_date"):
+        if optional not in df:
+            df[optional] = None
+
+    grouped = df.groupby("reference_no", sort=False).agg(
+        settled_kobo=("settled_kobo", "sum"),
+        unreadable=("settled_kobo", lambda s: s.isna().any()),
+        settlement_rows=("reference_no", "size"),
+        payment_reference=("payment_reference", "first"),
+        transaction_date=("transaction_date", "first"),
+    ).reset_index()
+    # sum() skips NA; a reference with any unparseable amount has no known total
+    grouped["settled_kobo"] = grouped["settled_kobo"].mask(grouped.pop("unreadable").astype(bool))
+    return grouped, ignored
+
+
+def load_local(references, session_id=None, since=None, until=None) -> pd.DataFrame:
+    """
+    payment_transactions rows for the export's references, plus the rows in
+    the session / date window if given, streamed out with COPY.
+    """
+    window, params = [], []
+    if session_id is not None:
+        window.append("academic_session_id = %s")
+        params.append(session_id)
+    if since:
+        window.append("created_at >= %s")
+        params.append(since)
+    if until:
+        window.append("created_at < %s")
+        params.append(until)
+    where = "reference_no = ANY(%s)"
+    if window:
+        where += f" OR ({' AND '.join(window)})"
+
+    query = f"""SELECT id, reference_no, user_id, tran_type, tran_status, response_description,
+                       COALESCE(amount_in_kobo, ROUND(amount * 100))::BIGINT AS expected_kobo,
+                       amount_paid_in_kobo, is_amount_mismatch, receipt_no,
+                       academic_session_id, created_at
+                FROM payment_transactions
+                WHERE {where}"""
+
+    buf = io.StringIO()
+    with Database.get_cursor() as cursor:
+        copy_sql = cursor.mogrify(query, [list(references), *params]).decode()
+        cursor.copy_expert(f"COPY ({copy_sql}) TO STDOUT WITH CSV HEADER", buf)
+    buf.seek(0)
+    return pd.read_csv(
+        buf,
+        dtype={"reference_no": str, "tran_type": str, "tran_status": str, "response_description": str,
+               "receipt_no": str, "expected_kobo": "Int64", "amount_paid_in_kobo": "Int64",
+               "user_id": "Int64", "academic_session_id": "Int64"},
+        true_values=["t"], false_values=["f"],
+    )
+
+
+def classify(settled: pd.DataFrame, local: pd.DataFrame, windowed: bool) -> pd.DataFrame:
+    """Outer-join the two frames and add `class` and `fix` columns."""
+    merged = settled.merge(local, on="reference_no", how="outer", indicator=True)
+    in_file = merged["_merge"].ne("right_only")
+    in_db = merged["_merge"].ne("left_only")
+    status = merged["tran_status"].fillna("")
+    successful = status.eq("successful")
+    amount_known = merged["settled_kobo"].notna()
+    amount_ok = merged["settled_kobo"].eq(merged["expected_kobo"]).fillna(False).astype(bool)
+
+    merged["class"] = np.select(
+        [
+            in_file & ~in_db,
+            in_file & merged["settlement_rows"].gt(1).fillna(False).astype(bool),
+            in_file & ~amount_known,
+            in_file & ~amount_ok,
+            in_file & successful,
+            in_file,
+            windowed & in_db & successful,
+        ],
+        ["missing_locally", "duplicate_settlement", "amount_unreadable", "amount_mismatch",
+         "matched", "settled_but_pending", "missing_from_settlement"],
+        default="",
+    )
+
+    settleable = status.isin(SETTLEABLE_STATUSES) | (
+        status.eq("cancelled") & merged["response_description"].fillna("").ne("Cancelled by user")
+    )
+    paid_differs = merged["amount_paid_in_kobo"].ne(merged["settled_kobo"]).fillna(True).astype(bool)
+    flag_differs = merged["is_amount_mismatch"].fillna(False).astype(bool).ne(~amount_ok)
+    cls = merged["class"]
+    merged["fix"] = np.select(
+        [
+            cls.eq("settled_but_pending") & settleable,
+            cls.isin(("matched", "amount_mismatch")) & successful & amount_known & (paid_differs | flag_differs),
+        ],
+        ["settle", "annotate"],
+        default="",
+    )
+    return merged[cls.ne("")].drop(columns="_merge")
+
+
+def apply_annotations(rows: pd.DataFrame) -> int:
+    """One UPDATE … FROM (VALUES …) for every row whose recorded amount disagrees with the export."""
+    if rows.empty:
+        return 0
+    values = [
+        (ref, int(kobo), int(kobo) != int(expected))
+        for ref, kobo, expected in rows[
+            ["reference_no", "settled_kobo", "expected_kobo"]
+        ].itertuples(index=False, name=None)
+    ]
+    with Database.get_cursor() as cursor:
+        execute_values(
+            cursor,
+            """UPDATE payment_transactions AS pt
+               SET amount_paid_in_kobo = v.kobo,
+                   amount_paid         = v.kobo / 100.0,
+                   is_amount_mismatch  = v.mismatch,
+                   updated_at          = NOW()
+               FROM (VALUES %s) AS v (reference_no, kobo, mismatch)
+               WHERE pt.reference_no = v.reference_no
+                 AND pt.tran_status = 'successful'""",
+            values,
+            template="(%s, %s::bigint, %s::boolean)",
+            page_size=len(values),
+        )
+        annotated = cursor.rowcount
+    payment_rollup.mark_dirty([v[0] for v in values])
+    return annotated
+
+
+def apply_settlements(rows: pd.DataFrame, source: str) -> dict:
+    """Settle each settled_but_pending row through atomic_settle_payment."""
+    counts = {"settled": 0, "already_settled": 0, "failed": 0}
+    for row in rows.itertuples(index=False):
+        ref, kobo = row.reference_no, int(row.settled_kobo)
+        isw_resp = {
+            "ResponseCode": "00",
+            "ResponseDescription": "Settled per Interswitch settlement report",
+            "Amount": kobo,
+            "PaymentReference": row.payment_reference if isinstance(row.payment_reference, str) else None,
+            "TransactionDate": row.transaction_date if isinstance(row.transaction_date, str) else None,
+            "Source": source,
+        }
+        receipt_no = row.receipt_no if isinstance(row.receipt_no, str) else generate_receipt_no(payment_type=row.tran_type)
+        sql, params = build_update_sql_params(
+            "successful", ref, "00", isw_resp["ResponseDescription"], isw_resp, kobo, receipt_no,
+        )
+        try:
+            won = atomic_settle_payment(ref, int(row.user_id), row.tran_type, final_update=(sql, params))
+        except SettlementFailed as exc:
+            counts["failed"] += 1
+            print(f"{ref}: settlement failed, left as requery_error: {exc}")
+            continue
+        counts["settled" if won else "already_settled"] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile an Interswitch settlement export.")
+    parser.add_argument("file", help="Settlement export (.csv or .xlsx).")
+    parser.add_argument("--session", type=int, help="Also check this academic session's local rows.")
+    parser.add_argument("--since", help="Also check local rows created on/after this date (YYYY-MM-DD).")
+    parser.add_argument("--until", help="... and before this date.")
+    parser.add_argument("--ref-column", help="Export column holding our reference_no.")
+    parser.add_argument("--amount-column", help="Export column holding the transaction amount.")
+    parser.add_argument("--amount-unit", choices=("naira", "kobo"), default="naira")
+    parser.add_argument("--report", help="Write every non-matched row to this CSV.")
+    parser.add_argument("--apply", action="store_true", help="Apply the settle / annotate fixes.")
+    args = parser.parse_args()
+
+    if not args.apply:
+        print("=== DRY RUN: no database changes will be made ===")
+
+    timings = {}
+    started = time.perf_counter()
+    settled, ignored = load_settlement(args.file, args.ref_column, args.amount_column, args.amount_unit)
+    timings["load export"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    local = load_local(settled["reference_no"], args.session, args.since, args.until)
+    timings["load local"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    windowed = bool(args.session is not None or args.since or args.until)
+    result = classify(settled, local, windowed)
+    timings["classify"] = time.perf_counter() - started
+
+    print(f"\nExport: {len(settled)} reference(s)"
+          f"{f', {ignored} row(s) ignored as not approved' if ignored else ''}; local rows: {len(local)}\n")
+    summary = (
+        result.groupby("class")
+        .agg(rows=("reference_no", "size"),
+             settled_naira=("settled_kobo", lambda s: s.sum() / 100),
+             expected_naira=("expected_kobo", lambda s: s.sum() / 100),
+             to_fix=("fix", lambda s: s.ne("").sum()))
+        .reindex(CLASSES).dropna(how="all").fillna(0)
+    )
+    print(f"{'CLASS':<24} {'ROWS':>7} {'SETTLED ₦':>16} {'EXPECTED ₦':>16} {'FIXABLE':>8}")
+    for cls, row in summary.iterrows():
+        print(f"{cls:<24} {int(row['rows']):>7} {row['settled_naira']:>16,.2f} "
+              f"{row['expected_naira']:>16,.2f} {int(row['to_fix']):>8}")
+
+    unreadable = result.loc[result["class"].eq("amount_unreadable"), "reference_no"].tolist()
+    if unreadable:
+        print(f"\n{len(unreadable)} reference(s) with an unreadable amount in the export, not fixed: "
+              f"{', '.join(unreadable[:20])}{' …' if len(unreadable) > 20 else ''}")
+
+    if args.report:
+        columns = ["reference_no", "class", "fix", "tran_status", "tran_type", "user_id",
+                   "academic_session_id", "expected_kobo", "settled_kobo", "amount_paid_in_kobo",
+                   "payment_reference", "transaction_date", "created_at"]
+        result[result["class"].ne("matched") | result["fix"].ne("")][columns].to_csv(args.report, index=False)
+        print(f"\nReport written to {args.report}")
+
+    if args.apply:
+        started = time.perf_counter()
+        annotated = apply_annotations(result[result["fix"].eq("annotate")])
+        settle_counts = apply_settlements(result[result["fix"].eq("settle")], os.path.basename(args.file))
+        timings["apply"] = time.perf_counter() - started
+        print(f"\nAnnotated {annotated} row(s); settlements: {settle_counts}")
+
+    print("\n" + "  ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import re
+import argparse
+
+# Add parent directory to sys.path so we can import database helper
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from utils.counters import ensure_table, set_at_least
+
+# PCU/ACC/2025-26/000247  → prefix PCU/ACC/2025-26, sequence 247
+RECEIPT_RE = re.compile(r'^(PCU/[A-Z]+/[^/]+)/(\d+)$')
+# PCU/2026/UTME0042       → prefix PCU/2026/UTME, sequence 42
+FORM_RE    = re.compile(r'^(PCU/\d{4}/[A-Z]+?)(\d+)$')
+
+
+def collect_receipts():
+    rows = Database.execute_query(
+        "SELECT receipt_no FROM payment_transactions WHERE receipt_no LIKE 'PCU/%%'"
+    ) or []
+    max_sequence = {}
+    for row in rows:
+        match = RECEIPT_RE.match(row['receipt_no'] or '')
+        if match:
+            name = f"receipt:{match.group(1)}"
+            max_sequence[name] = max(max_sequence.get(name, 0), int(match.group(2)))
+    return max_sequence
+
+
+def collect_forms():
+    rows = Database.execute_query(
+        """SELECT form_no FROM applications   WHERE form_no LIKE 'PCU/%%'
+           UNION ALL
+           SELECT form_no FROM pg_application WHERE form_no LIKE 'PCU/%%'"""
+    ) or []
+    max_sequence = {}
+    for row in rows:
+        # Older form numbers have random alphanumeric suffixes; only the
+        # all-digit ones can collide with the counter, so only those count
+        match = FORM_RE.match(row['form_no'] or '')
+        if match:
+            name = f"form:{match.group(1)}"
+            max_sequence[name] = max(max_sequence.get(name, 0), int(match.group(2)))
+    return max_sequence
+
+
+def seed(commit=False):
+    print("Scanning existing receipt and form numbers...")
+    targets = {**collect_receipts(), **collect_forms()}
+
+    if not targets:
+        print("No numbered receipts or forms found; counters will start at 1.")
+        return
+
+    ensure_table()
+    current = {
+        r['name']: int(r['value'])
+        for r in (Database.execute_query('SELECT name, value FROM document_counters') or [])
+    }
+
+    print(f"\n{'COUNTER':<40} {'IN USE':>8} {'CURRENT':>8}  ACTION")
+    changes = []
+    for name in sorted(targets):
+        have = current.get(name)
+        action = 'ok'
+        if have is None or have < targets[name]:
+            action = f"set to {targets[name]}"
+            changes.append(name)
+        print(f"{name:<40} {targets[name]:>8} {have if have is not None else '-':>8}  {action}")
+
+    if not changes:
+        print("\nAll counters are already at or above the numbers in use.")
+        return
+
+    if not commit:
+        print("\n*** DRY-RUN ONLY ***")
+        print("No changes were made to the database.")
+        print("To apply these changes, run this script with --commit:")
+        print("  python scripts/seed_document_counters.py --commit")
+        return
+
+    # GREATEST() keeps any counter that moved on while this script ran
+    for name in changes:
+        set_at_least(name, targets[name])
+    print(f"\nSeeded {len(changes)} counter(s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed document_counters from existing receipt and form numbers.")
+    parser.add_argument("--commit", action="store_true", help="Actually write the counters to the database.")
+    args = parser.parse_args()
+
+    seed(commit=args.commit)
@@ -199,6 +199,7 @@ class AuthHandler:
     verify_password             = staticmethod(verify_password)
     maybe_upgrade_hash          = staticmethod(maybe_upgrade_hash)
     generate_token              = staticmethod(generate_token)
+    verify_token                = staticmethod(verify_token)
     token_required              = staticmethod(token_required)
     admin_required              = staticmethod(admin_required)
     admissions_officer_required = staticmethod(admissions_officer_required)
@@ -0,0 +1,159 @@
+"""
+utils/circuit_breaker.py — Thread-safe circuit breaker.
+
+Wrapped around Interswitch requeries (utils/interswitch.py) so that when the
+gateway degrades, callers fail fast instead of each holding a worker thread
+for the full read timeout.
+
+  closed     calls go through; outcomes are kept for a rolling window.  The
+             breaker opens once at least min_calls were seen in the window and
+             either the failure rate or the slow-call rate reaches its threshold.
+  open       calls are rejected immediately with CircuitOpenError until
+             open_seconds have passed.
+  half_open  up to half_open_calls probe calls are let through; one failure
+             re-opens the breaker, that many successes close it.  If the
+             probes have not all reported back within open_seconds (a caller
+             never recorded an outcome), a fresh set of probes is allowed.
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED    = 'closed'
+OPEN      = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f'{name} circuit is open; retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_seconds: float = 10.0,
+                 slow_call_rate: float = 0.8, min_calls: int = 10, window_seconds: float = 60.0,
+                 open_seconds: float = 30.0, half_open_calls: int = 3, on_state_change=None):
+        self.name              = name
+        self.failure_rate      = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate    = slow_call_rate
+        self.min_calls         = min_calls
+        self.window_seconds    = window_seconds
+        self.open_seconds      = open_seconds
+        self.half_open_calls   = max(1, half_open_calls)
+        self.on_state_change   = on_state_change
+
+        self._lock       = threading.Lock()
+        self._calls      = deque()      # (monotonic time, failed, slow)
+        self._state      = CLOSED
+        self._opened_at  = 0.0
+        self._probed_at  = 0.0          # start of the current set of probes
+        self._probes     = 0            # probes let through in this half-open period
+        self._probe_ok   = 0
+        self._last_error = None
+        self._rejected   = 0
+
+    # ── Call gate ─────────────────────────────────────────────────────────────
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not be made right now."""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                now = time.monotonic()
+                if self._probes >= self.half_open_calls:
+                    if now - self._probed_at < self.open_seconds:
+                        self._rejected += 1
+                        raise CircuitOpenError(self.name, 1.0)
+                    # Outcomes never came back; don't stay wedged on lost probes
+                    self._probes = self._probe_ok = 0
+                if self._probes == 0:
+                    self._probed_at = now
+                self._probes += 1
+
+    def record_success(self, elapsed: float):
+        self._record(failed=False, slow=elapsed >= self.slow_call_seconds)
+
+    def record_failure(self, error=None):
+        self._record(failed=True, slow=False, error=error)
+
+    def _record(self, failed: bool, slow: bool, error=None):
+        now = time.monotonic()
+        with self._lock:
+            if error is not None:
+                self._last_error = str(error)[:300]
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self._probe_ok += 1
+                    if self._probe_ok >= self.half_open_calls:
+                        self._calls.clear()
+                        self._set_state(CLOSED)
+                return
+            if self._state == OPEN:
+                return  # a call that started before the breaker opened
+
+            self._calls.append((now, failed, slow))
+            self._prune(now)
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slows    = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= self.failure_rate or slows / total >= self.slow_call_rate:
+                self._trip(now)
+
+    # ── Internals (lock held) ─────────────────────────────────────────────────
+    def _prune(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _trip(self, now: float):
+        self._opened_at = now
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+        previous     = self._state
+        self._state  = state
+        self._probes = self._probe_ok = 0
+        if self.on_state_change:
+            try:
+                self.on_state_change(self.name, previous, state)
+            except Exception:
+                pass
+
+    # ── Introspection ─────────────────────────────────────────────────────────
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            total    = len(self._calls)
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slows    = sum(1 for _, _, s in self._calls if s)
+            retry_in = max(0.0, self._opened_at + self.open_seconds - now) if self._state == OPEN else 0.0
+            return {
+                'name':           self.name,
+                'state':          self._state,
+                'window_calls':   total,
+                'failure_rate':   round(failures / total, 3) if total else 0.0,
+                'slow_call_rate': round(slows / total, 3) if total else 0.0,
+                'retry_in_seconds': round(retry_in, 1),
+                'rejected_calls': self._rejected,
+                'last_error':     self._last_error,
+            }
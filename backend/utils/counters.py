@@ -0,0 +1,81 @@
+"""
+utils/counters.py — Atomic named counters for human-readable document numbers.
+
+Receipt numbers (PCU/ACC/2025-26/000247) and form numbers (PCU/2026/UTME0042)
+each take their sequence from one row of document_counters, keyed by the
+number's prefix.  allocate() hands out the next value with a single
+UPDATE … RETURNING, so two concurrent payments can never get the same number
+and allocation does not scan payment_transactions / applications.
+
+A counter that does not exist yet is created from seed(), the highest
+sequence already in use for that prefix, so numbers carry on from existing
+data.  scripts/seed_document_counters.py does the same for every prefix up
+front.  The table itself comes from scripts/migration_add_document_counters.sql;
+until it exists allocate() raises database.MissingTable.
+"""
+
+import threading
+
+from database import Database
+
+_table_ready = False
+_table_lock  = threading.Lock()
+
+
+def ensure_table():
+    """Raise database.MissingTable until migration_add_document_counters.sql has run."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        Database.require_tables('migration_add_document_counters.sql', 'document_counters')
+        _table_ready = True
+
+
+def allocate(name: str, seed=None) -> int:
+    """
+    Return the next value of counter `name`.
+
+    seed: optional callable returning the highest value already used, only
+    called the first time `name` is seen.  Raises on database errors; callers
+    decide on a fallback.
+    """
+    ensure_table()
+    with Database.get_cursor() as cursor:
+        cursor.execute(
+            '''UPDATE document_counters SET value = value + 1, updated_at = NOW()
+               WHERE name = %s RETURNING value''',
+            (name,)
+        )
+        row = cursor.fetchone()
+    if row:
+        return int(row['value'])
+
+    # First use: start after the highest existing number.  If another worker
+    # creates the row meanwhile, ON CONFLICT turns this into an increment.
+    start = int(seed() or 0) if seed else 0
+    with Database.get_cursor() as cursor:
+        cursor.execute(
+            '''INSERT INTO document_counters (name, value) VALUES (%s, %s)
+               ON CONFLICT (name) DO UPDATE
+               SET value = document_counters.value + 1, updated_at = NOW()
+               RETURNING value''',
+            (name, start + 1)
+        )
+        return int(cursor.fetchone()['value'])
+
+
+def set_at_least(name: str, value: int) -> int:
+    """Raise counter `name` to `value` if it is lower (used by the backfill). Returns the new value."""
+    ensure_table()
+    with Database.get_cursor() as cursor:
+        cursor.execute(
+            '''INSERT INTO document_counters (name, value) VALUES (%s, %s)
+               ON CONFLICT (name) DO UPDATE
+               SET value = GREATEST(document_counters.value, EXCLUDED.value), updated_at = NOW()
+               RETURNING value''',
+            (name, value)
+        )
+        return int(cursor.fetchone()['value'])
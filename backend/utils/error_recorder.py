@@ -0,0 +1,172 @@
+"""
+utils/error_recorder.py — Buffered, sampled recording of 404 / 500 errors.
+
+The error handlers in app.py used to INSERT into error_logs for every error,
+so a bot scanning random paths turned into one DB write per request.  Errors
+are now aggregated in memory by (error_type, path_template) and flushed as
+batched counts into error_log_counts every ERROR_LOG_FLUSH_SECONDS.  Only a
+sample of individual errors (plus the first of each key per flush window) is
+still written in full to error_logs, which keeps the "recent errors" list in
+settings.get_system_status meaningful.
+"""
+
+import atexit
+import os
+import random
+import re
+import threading
+import time
+import logging
+
+from config import Config
+from utils import metrics
+
+logger = logging.getLogger('error_recorder')
+
+MAX_KEYS        = 1000   # distinct (type, template) pairs buffered per window
+MAX_SAMPLES     = 200    # full error_logs rows buffered per window
+MAX_PATH_DEPTH  = 4      # segments kept when templating unmatched paths
+OVERFLOW_PATH   = '<other>'
+
+ERRORS_RECORDED = metrics.counter('errors_recorded', 'Errors seen by the error handlers.', ('error_type',))
+ERROR_FLUSHES   = metrics.counter('error_log_flushes', 'Error buffer flushes by outcome.', ('outcome',))
+
+_ID_SEGMENT = re.compile(
+    r'^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,}|[A-Za-z0-9_\-]{24,})$',
+    re.IGNORECASE,
+)
+
+
+def path_template(path: str, rule: str | None = None) -> str:
+    """
+    Collapse a request path into a low-cardinality template.
+
+    Matched routes use their URL rule as-is.  Unmatched paths (404s) have
+    id-like segments replaced by ':id' and are cut to MAX_PATH_DEPTH segments,
+    so /wp-admin/a/b/c/d and /wp-admin/a/b/c/e count as the same key.
+    """
+    if rule:
+        return rule
+    segments = [s for s in (path or '/').split('/') if s]
+    templated = [':id' if _ID_SEGMENT.match(s) else s.lower()[:40] for s in segments[:MAX_PATH_DEPTH]]
+    suffix = '/*' if len(segments) > MAX_PATH_DEPTH else ''
+    return '/' + '/'.join(templated) + suffix
+
+
+class ErrorRecorder:
+    def __init__(self, flush_seconds: float, sample_rates: dict):
+        self.flush_seconds = flush_seconds
+        self.sample_rates  = sample_rates
+        self._lock         = threading.Lock()
+        self._counts       = {}
+        self._samples      = []
+        self._thread_pid   = None
+        self._table_ready  = False
+
+    # ── Recording (request path — memory only) ────────────────────────────────
+    def record(self, error_type: str, path: str, message: str, rule: str | None = None) -> None:
+        ERRORS_RECORDED.inc(error_type=error_type)
+        template = path_template(path, rule)
+        now      = time.time()
+        message  = (message or '')[:500]
+
+        with self._lock:
+            key = (error_type, template)
+            if key not in self._counts and len(self._counts) >= MAX_KEYS:
+                key = (error_type, OVERFLOW_PATH)
+            entry = self._counts.get(key)
+            first_in_window = entry is None
+            if first_in_window:
+                entry = self._counts[key] = {'count': 0, 'last_message': '', 'last_path': '', 'last_seen': now}
+            entry['count']        += 1
+            entry['last_message']  = message
+            entry['last_path']     = (path or '')[:500]
+            entry['last_seen']     = now
+
+            sampled = first_in_window or random.random() < self.sample_rates.get(error_type, 0.0)
+            if sampled and len(self._samples) < MAX_SAMPLES:
+                self._samples.append((error_type, message, (path or '')[:500]))
+
+        self._ensure_thread()
+
+    # ── Flushing (background thread) ──────────────────────────────────────────
+    def flush(self) -> int:
+        """Write buffered counts and samples in two statements. Returns keys flushed."""
+        with self._lock:
+            counts, self._counts   = self._counts, {}
+            samples, self._samples = self._samples, []
+        if not counts and not samples:
+            return 0
+
+        from database import Database
+        from psycopg2.extras import execute_values
+        try:
+            self._ensure_table()
+            with Database.get_cursor() as cursor:
+                if counts:
+                    execute_values(
+                        cursor,
+                        '''INSERT INTO error_log_counts
+                               (error_type, path_template, window_start, count,
+                                last_message, last_path, last_seen_at)
+                           VALUES %s
+                           ON CONFLICT (error_type, path_template, window_start) DO UPDATE
+                           SET count        = error_log_counts.count + EXCLUDED.count,
+                               last_message = EXCLUDED.last_message,
+                               last_path    = EXCLUDED.last_path,
+                               last_seen_at = EXCLUDED.last_seen_at''',
+                        [
+                            (etype, template, e['count'], e['last_message'], e['last_path'], e['last_seen'])
+                            for (etype, template), e in counts.items()
+                        ],
+                        template="(%s, %s, date_trunc('hour', NOW()), %s, %s, %s, to_timestamp(%s)::timestamp)",
+                    )
+                if samples:
+                    execute_values(
+                        cursor,
+                        'INSERT INTO error_logs (error_type, message, path) VALUES %s',
+                        samples,
+                    )
+            ERROR_FLUSHES.inc(outcome='ok')
+            return len(counts)
+        except Exception as exc:
+            # Never let error bookkeeping hurt real traffic — drop this window.
+            ERROR_FLUSHES.inc(outcome='error')
+            logger.warning(f'[error_recorder] Flush failed, dropped {len(counts)} key(s): {exc}')
+            return 0
+
+    def _ensure_table(self):
+        if self._table_ready:
+            return
+        from database import Database
+        Database.require_tables('migration_add_error_log_counts.sql', 'error_log_counts')
+        self._table_ready = True
+
+    def _ensure_thread(self):
+        # Keyed on pid so a worker forked from a preloaded master starts its own
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            threading.Thread(target=self._flush_loop, name='error-recorder', daemon=True).start()
+            self._thread_pid = os.getpid()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+
+recorder = ErrorRecorder(
+    flush_seconds=Config.ERROR_LOG_FLUSH_SECONDS,
+    sample_rates={
+        '404': Config.ERROR_LOG_SAMPLE_RATE_404,
+        '500': Config.ERROR_LOG_SAMPLE_RATE_500,
+    },
+)
+
+
+def record_error(error_type: str, path: str, message: str, rule: str | None = None) -> None:
+    recorder.record(error_type, path, message, rule)
@@ -0,0 +1,195 @@
+"""
+utils/fee_matrix.py — In-process cache of the fee configuration.
+
+Fee quotes (_resolve_fee_amount, /tuition-fee-breakdown) used to re-read
+program_fees, fee_components, installment_plans, the active session and the
+course → faculty mapping on every call.  All of that is small and changes a
+few times a year, so it is loaded once per process into a FeeMatrix keyed by
+(program_type, level, faculty_id, session_id); a fee quote is then a
+dictionary lookup plus the one user-specific query.
+
+Invalidation: statement triggers on the source tables bump the single row in
+fee_matrix_version (both installed by scripts/migration_add_fee_matrix_version.sql).
+get_fee_matrix() compares that version at most every FEE_MATRIX_CHECK_SECONDS
+and reloads when it moved, so an edit made anywhere (admin route, psql,
+another worker) is picked up within seconds.  Until the migration has run the
+matrix is simply reloaded every FEE_MATRIX_FALLBACK_TTL seconds.
+
+A reload that fails is logged and the previous snapshot keeps being served;
+it is retried at the next check.
+"""
+
+import threading
+import time
+import logging
+
+from config import Config
+from database import Database
+from utils import metrics
+
+logger = logging.getLogger('fee_matrix')
+
+# Tables whose changes invalidate the matrix
+SOURCE_TABLES = (
+    'program_fees', 'fee_components', 'installment_plans',
+    'academic_sessions', 'program_types', 'program_setup', 'pg_program_setup',
+)
+
+FEE_MATRIX_LOADS = metrics.counter('fee_matrix_loads', 'Fee matrix (re)loads by reason.', ('reason',))
+
+_lock           = threading.Lock()
+_matrix         = None
+_version        = None
+_checked_at     = 0.0
+_loaded_at      = 0.0
+_stale          = False     # invalidate() was called; reload at the next call
+_version_table  = None      # None = not checked yet, False = migration not run
+
+
+class FeeMatrix:
+    """Immutable snapshot of the fee configuration."""
+
+    def __init__(self):
+        self.active_session_id = None
+        self.fee_amounts       = {}   # program_fees.id → amount
+        self.tuition           = {}   # (program_type, level, faculty_id, session_id) → [(name, amount)]
+        self.acceptance        = {}   # (program_type, session_id) → amount
+        self.any_acceptance    = {}   # session_id → amount
+        self.installments      = {}   # installment_plans.id → percentage
+        self.program_levels    = {}   # program_types.id → level_id
+        self.faculty_by_course = {}   # ('ug' | 'pg', lower(course name)) → faculty_id
+        self.course_names      = {}   # ('ug' | 'pg', program_setup id) → name
+
+    # ── Lookups ───────────────────────────────────────────────────────────────
+    def tuition_components(self, program_type, level, faculty_id, session_id=None) -> list:
+        """[{'name', 'amount'}] sorted by name, acceptance fees excluded."""
+        key = (str(program_type), str(level), str(faculty_id),
+               session_id if session_id is not None else self.active_session_id)
+        return [{'name': name, 'amount': amount} for name, amount in self.tuition.get(key, ())]
+
+    def tuition_total(self, program_type, level, faculty_id, session_id=None) -> float:
+        return sum(c['amount'] for c in self.tuition_components(program_type, level, faculty_id, session_id))
+
+    def acceptance_fee(self, program_type, session_id=None):
+        session_id = session_id if session_id is not None else self.active_session_id
+        amount = self.acceptance.get((str(program_type), session_id))
+        return amount if amount is not None else self.any_acceptance.get(session_id)
+
+    def faculty_for_course(self, course_name: str, postgraduate: bool = False):
+        return self.faculty_by_course.get(('pg' if postgraduate else 'ug', (course_name or '').strip().lower()))
+
+    def course_name(self, program_setup_id, postgraduate: bool = False):
+        return self.course_names.get(('pg' if postgraduate else 'ug', str(program_setup_id)))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Loading
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _load() -> FeeMatrix:
+    m = FeeMatrix()
+
+    session = Database.execute_query(
+        'SELECT id FROM academic_sessions WHERE is_active = TRUE ORDER BY id DESC LIMIT 1'
+    )
+    m.active_session_id = session[0]['id'] if session else None
+
+    rows = Database.execute_query(
+        '''SELECT pf.id, pf.amount, pf.program_type, pf.level, pf.faculty_id,
+                  pf.academic_session_id, fc.name AS fee_name
+           FROM program_fees pf
+           JOIN fee_components fc ON fc.id = pf.fee_component_id
+           ORDER BY fc.name ASC, pf.id ASC'''
+    )
+    if rows is None:
+        raise RuntimeError('Could not load program_fees')
+    for r in rows:
+        amount = float(r['amount'] or 0)
+        m.fee_amounts[r['id']] = amount
+        session_id = r['academic_session_id']
+        if 'acceptance' in (r['fee_name'] or '').lower():
+            m.acceptance.setdefault((str(r['program_type']), session_id), amount)
+            m.any_acceptance.setdefault(session_id, amount)
+            continue
+        key = (str(r['program_type']), str(r['level']), str(r['faculty_id']), session_id)
+        m.tuition.setdefault(key, []).append((r['fee_name'] or 'Other Fee', amount))
+
+    for r in Database.execute_query('SELECT id, percentage FROM installment_plans') or []:
+        try:
+            m.installments[r['id']] = float(r['percentage'] or 0)
+        except (TypeError, ValueError):
+            m.installments[r['id']] = 0.0
+
+    for r in Database.execute_query('SELECT id, level_id FROM program_types') or []:
+        m.program_levels[r['id']] = r['level_id']
+
+    for source, table in (('ug', 'program_setup'), ('pg', 'pg_program_setup')):
+        for r in Database.execute_query(f'SELECT id, name, faculty_id FROM {table} ORDER BY id') or []:
+            m.course_names[(source, str(r['id']))] = r['name']
+            if r['name'] and r['faculty_id'] is not None:
+                m.faculty_by_course.setdefault((source, r['name'].strip().lower()), r['faculty_id'])
+    return m
+
+
+def _has_version_table() -> bool:
+    """Whether fee_matrix_version exists (checked once per process)."""
+    global _version_table
+    if _version_table is None:
+        try:
+            Database.require_tables('migration_add_fee_matrix_version.sql', 'fee_matrix_version')
+            _version_table = True
+        except Exception as exc:
+            logger.warning(f'[fee_matrix] {exc}; reloading every {Config.FEE_MATRIX_FALLBACK_TTL:.0f}s instead')
+            _version_table = False
+    return _version_table
+
+
+def _current_version():
+    rows = Database.execute_query('SELECT version FROM fee_matrix_version WHERE id = 1')
+    return rows[0]['version'] if rows else None
+
+
+def get_fee_matrix() -> FeeMatrix:
+    """The current fee matrix, reloading it if the fee tables changed."""
+    global _matrix, _version, _checked_at, _loaded_at, _stale
+    now = time.monotonic()
+    if _matrix is not None and now - _checked_at < Config.FEE_MATRIX_CHECK_SECONDS:
+        return _matrix
+
+    with _lock:
+        now = time.monotonic()
+        if _matrix is not None and now - _checked_at < Config.FEE_MATRIX_CHECK_SECONDS:
+            return _matrix
+
+        if _has_version_table():
+            version = _current_version()
+            due     = 'changed' if version != _version else None
+        else:
+            version = None
+            due     = 'ttl' if now - _loaded_at >= Config.FEE_MATRIX_FALLBACK_TTL else None
+        reason = 'initial' if _matrix is None else ('invalidated' if _stale else due)
+
+        if reason:
+            try:
+                matrix = _load()
+            except Exception as exc:
+                if _matrix is None:
+                    raise
+                logger.error(f'[fee_matrix] Reload ({reason}) failed, serving the previous snapshot: {exc}')
+                FEE_MATRIX_LOADS.inc(reason='failed')
+            else:
+                _matrix    = matrix
+                _version   = version
+                _loaded_at = now
+                _stale     = False
+                FEE_MATRIX_LOADS.inc(reason=reason)
+        _checked_at = now
+        return _matrix
+
+
+def invalidate():
+    """Force a reload on next use (this process only; other workers follow via the version row)."""
+    global _stale, _checked_at
+    with _lock:
+        _stale      = True
+        _checked_at = 0.0
@@ -1,29 +1,166 @@
 import base64
 import hashlib
 import hmac
+import json
+import os
+import socket
 import time
 import uuid
+import threading
 import urllib.parse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Config
+from utils import metrics
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+TOKEN_FETCHES = metrics.counter(
+    "interswitch_token_fetches", "OAuth tokens obtained, from passport or the shared DB row.", ("source",),
+)
+REQUERY_CACHE = metrics.counter(
+    "interswitch_requery_cache", "requery_transaction lookups by result (hit, shared_hit, coalesced, miss).",
+    ("result",),
+)
+
+BREAKER_STATE = metrics.gauge(
+    "interswitch_breaker_state", "Requery circuit breaker state (0 closed, 1 half-open, 2 open).",
+)
+BREAKER_REJECTED = metrics.counter(
+    "interswitch_breaker_rejected", "Requeries rejected without calling Interswitch because the breaker was open.",
+)
+
+REQUERY_CACHE_MAX_ENTRIES = 5000
+_BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class GatewayUnavailable(requests.ConnectionError):
+    """
+    Interswitch is treated as down (circuit open); the request was not sent.
+    A ConnectionError subclass, so every requery caller already records it
+    as 'requery_error' and the row is retried on its backoff schedule.
+    """
+
+
+def _on_breaker_change(name, previous, state):
+    BREAKER_STATE.set(_BREAKER_STATE_VALUES.get(state, 0))
+    print(f"[interswitch] {name} circuit breaker {previous} → {state}")
+
+
+class _Flight:
+    """One in-progress upstream requery that other callers can wait on."""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done   = threading.Event()
+        self.result = None
+        self.error  = None
 
 
 class InterswitchClient:
     # ── OAuth token cache ─────────────────────────────────────────────────────
     _token: str | None = None
     _token_expires_at: float = 0.0
+    _token_error: Exception | None = None
+    _token_refreshing = False
+    _token_cond = threading.Condition()
+    _token_table_ready = False
+    _refresher_pid: int | None = None
+
+    # ── Requery single-flight + short-lived result cache ──────────────────────
+    _requery_cache: dict = {}       # (reference_no, amount_kobo) → (monotonic time, body)
+    _requery_inflight: dict = {}    # (reference_no, amount_kobo) → _Flight
+    _requery_lock = threading.Lock()
+    _requery_table_ready = False
+
+    # ── Circuit breaker (per process) ─────────────────────────────────────────
+    _breaker: CircuitBreaker | None = None
+
+    # ── Shared HTTP session (keep-alive connection pool) ──────────────────────
+    _session: requests.Session | None = None
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def _http(cls) -> requests.Session:
+        """
+        One pooled Session per process, shared by every thread.  Retries only
+        connection failures (the request never reached Interswitch), never
+        reads or HTTP statuses, so a requery is not silently sent twice.
+        """
+        if cls._session is not None:
+            return cls._session
+        with cls._session_lock:
+            if cls._session is None:
+                retry = Retry(
+                    total=Config.INTERSWITCH_CONNECT_RETRIES,
+                    connect=Config.INTERSWITCH_CONNECT_RETRIES,
+                    read=0, status=0, other=0, redirect=0,
+                    allowed_methods=None,
+                    backoff_factor=0.3,
+                    raise_on_status=False,
+                )
+                pool_size = max(Config.INTERSWITCH_POOL_SIZE, Config.REQUERY_CONCURRENCY)
+                adapter   = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+                session   = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._session = session
+        return cls._session
+
+    @classmethod
+    def _timeout(cls) -> tuple:
+        return (Config.INTERSWITCH_CONNECT_TIMEOUT, Config.INTERSWITCH_READ_TIMEOUT)
 
     @classmethod
     def _requery_base(cls) -> str:
         return Config.INTERSWITCH_BASE_URL
 
     # ── OAuth token ───────────────────────────────────────────────────────────
+    #
+    # Single-flight: when the cached token is stale exactly one thread fetches
+    # it; the others wait on _token_cond and reuse the result.  With
+    # INTERSWITCH_TOKEN_SHARED the fetch first looks at the
+    # interswitch_token_cache row, and only the worker that claimed the
+    # refresh calls passport, so all gunicorn workers share one token.  A daemon
+    # thread refreshes INTERSWITCH_TOKEN_REFRESH_AHEAD seconds before expiry so
+    # request threads normally never wait for passport at all.
     @classmethod
-    def _get_token(cls) -> str:
-        now = time.time()
-        if cls._token and now < cls._token_expires_at - 30:
+    def _get_token(cls, min_ttl: float = 30) -> str:
+        if cls._token and time.time() < cls._token_expires_at - min_ttl:
             return cls._token
 
+        with cls._token_cond:
+            if cls._token and time.time() < cls._token_expires_at - min_ttl:
+                return cls._token
+            if cls._token_refreshing:
+                waited = cls._token_cond.wait_for(
+                    lambda: not cls._token_refreshing,
+                    timeout=Config.INTERSWITCH_CONNECT_TIMEOUT + Config.INTERSWITCH_READ_TIMEOUT,
+                )
+                if cls._token and time.time() < cls._token_expires_at:
+                    return cls._token
+                if not waited:
+                    raise requests.Timeout("Timed out waiting for Interswitch token refresh")
+                raise requests.ConnectionError(f"Interswitch token refresh failed: {cls._token_error}")
+            cls._token_refreshing = True
+
+        try:
+            token, expires_at = cls._shared_token(min_ttl) if Config.INTERSWITCH_TOKEN_SHARED else cls._fetch_token()
+            cls._token, cls._token_expires_at, cls._token_error = token, expires_at, None
+        except Exception as exc:
+            cls._token_error = exc
+            raise
+        finally:
+            with cls._token_cond:
+                cls._token_refreshing = False
+                cls._token_cond.notify_all()
+
+        cls._ensure_token_refresher()
+        return token
+
+    @classmethod
+    def _fetch_token(cls) -> tuple:
+        """Call passport. Returns (access_token, expires_at epoch seconds)."""
         client_id     = Config.INTERSWITCH_CLIENT_ID
         client_secret = Config.INTERSWITCH_CLIENT_SECRET
 
@@ -32,25 +169,130 @@ class InterswitchClient:
         ).decode()
 
         # OAuth token lives on passport.interswitchng.com regardless of the
-        # collections API base URL.
-        resp = requests.post(
-            "https://passport.interswitchng.com/passport/oauth/token",
-            headers={
-                "Authorization": f"Basic {credentials}",
-                "Content-Type":  "application/x-www-form-urlencoded",
-            },
-            data={"grant_type": "client_credentials", "scope": "profile"},
-            timeout=30,
+        # collections API base URL (overridable so a local stub can serve it).
+        now     = time.time()
+        started = time.perf_counter()
+        try:
+            resp = cls._http().post(
+                f"{Config.INTERSWITCH_PASSPORT_URL.rstrip('/')}/passport/oauth/token",
+                headers={
+                    "Authorization": f"Basic {credentials}",
+                    "Content-Type":  "application/x-www-form-urlencoded",
+                },
+                data={"grant_type": "client_credentials", "scope": "profile"},
+                timeout=cls._timeout(),
+            )
+        except requests.RequestException:
+            metrics.INTERSWITCH_SECONDS.observe(time.perf_counter() - started, operation="token", response_code="error")
+            raise
+        metrics.INTERSWITCH_SECONDS.observe(
+            time.perf_counter() - started, operation="token", response_code=f"http_{resp.status_code}",
         )
         resp.raise_for_status()
         body = resp.json()
+        TOKEN_FETCHES.inc(source="passport")
+        return body["access_token"], now + int(body.get("expires_in", 3600))
 
-        token                 = body["access_token"]
-   
-   
-        cls._token            = token
-        cls._token_expires_at = now + int(body.get("expires_in", 3600))
-        return token
+    @classmethod
+    def _shared_token(cls, min_ttl: float) -> tuple:
+        """
+        Token from the interswitch_token_cache row.  When it is stale one
+        worker claims the refresh with a short-lived marker (committed at
+        once), calls passport outside any transaction and writes the result;
+        the others poll the row meanwhile.  No row lock or pooled connection
+        is held across the HTTP call.  Falls back to a direct fetch if the DB
+        is unavailable.
+        """
+        from database import Database
+        select_sql = """SELECT access_token, EXTRACT(EPOCH FROM expires_at) AS expires_at
+                        FROM interswitch_token_cache WHERE id = 1"""
+        claim_seconds = Config.INTERSWITCH_CONNECT_TIMEOUT + Config.INTERSWITCH_READ_TIMEOUT + 5
+
+        def fresh(row):
+            return row and row["access_token"] and time.time() < float(row["expires_at"]) - min_ttl
+
+        try:
+            cls._ensure_token_table()
+            rows = Database.execute_query(select_sql)
+            if rows and fresh(rows[0]):
+                TOKEN_FETCHES.inc(source="shared")
+                return rows[0]["access_token"], float(rows[0]["expires_at"])
+
+            with Database.get_cursor() as cursor:
+                cursor.execute(
+                    """INSERT INTO interswitch_token_cache AS c (id, refresh_claimed_until)
+                       VALUES (1, NOW() + %(claim)s * INTERVAL '1 second')
+                       ON CONFLICT (id) DO UPDATE
+                       SET refresh_claimed_until = EXCLUDED.refresh_claimed_until
+                       WHERE (c.refresh_claimed_until IS NULL OR c.refresh_claimed_until < NOW())
+                         AND (c.access_token IS NULL
+                              OR c.expires_at < NOW() + %(min_ttl)s * INTERVAL '1 second')
+                       RETURNING id""",
+                    {"claim": claim_seconds, "min_ttl": min_ttl},
+                )
+                claimed = cursor.fetchone() is not None
+        except Exception as exc:
+            print(f"[interswitch] Shared token cache unavailable, fetching directly: {exc}")
+            return cls._fetch_token()
+
+        if not claimed:
+            # Another worker is refreshing (or just did): wait for its token
+            deadline = time.time() + claim_seconds
+            while time.time() < deadline:
+                rows = Database.execute_query(select_sql)
+                if rows and fresh(rows[0]):
+                    TOKEN_FETCHES.inc(source="shared")
+                    return rows[0]["access_token"], float(rows[0]["expires_at"])
+                time.sleep(0.2)
+            print("[interswitch] Shared token refresh did not finish in time, fetching directly")
+            return cls._fetch_token()
+
+        try:
+            token, expires_at = cls._fetch_token()
+        except Exception:
+            Database.execute_update("UPDATE interswitch_token_cache SET refresh_claimed_until = NULL WHERE id = 1")
+            raise
+        Database.execute_update(
+            """UPDATE interswitch_token_cache
+               SET access_token = %s, expires_at = to_timestamp(%s),
+                   fetched_by = %s, refresh_claimed_until = NULL, updated_at = NOW()
+               WHERE id = 1""",
+            (token, expires_at, f"{socket.gethostname()}:{os.getpid()}"),
+        )
+        return token, expires_at
+
+    @classmethod
+    def _ensure_token_table(cls):
+        if cls._token_table_ready:
+            return
+        from database import Database
+        Database.require_tables("migration_add_interswitch_token_cache.sql", "interswitch_token_cache")
+        cls._token_table_ready = True
+
+    @classmethod
+    def _ensure_token_refresher(cls):
+        # Keyed on pid so a forked gunicorn worker starts its own thread
+        if cls._refresher_pid == os.getpid() or Config.INTERSWITCH_TOKEN_REFRESH_AHEAD <= 0:
+            return
+        with cls._token_cond:
+            if cls._refresher_pid == os.getpid():
+                return
+            cls._refresher_pid = os.getpid()
+        threading.Thread(target=cls._refresh_loop, name="interswitch-token", daemon=True).start()
+
+    @classmethod
+    def _refresh_loop(cls):
+        # Never aim for more than half the token lifetime, or short-lived
+        # tokens would be refreshed in a tight loop
+        lifetime = max(60.0, cls._token_expires_at - time.time())
+        ahead    = min(Config.INTERSWITCH_TOKEN_REFRESH_AHEAD, lifetime / 2)
+        while True:
+            time.sleep(max(5.0, cls._token_expires_at - ahead - time.time()))
+            try:
+                cls._get_token(min_ttl=ahead)
+            except Exception as exc:
+                print(f"[interswitch] Proactive token refresh failed, retrying in 30s: {exc}")
+                time.sleep(30)
 
     @classmethod
     def _sign(cls, nonce: str, timestamp: str) -> str:
@@ -140,8 +382,179 @@ class InterswitchClient:
         return pay_item
 
     # ── Server-side transaction verification ──────────────────────────────────
+    #
+    # The callback, verify_payment polling, the webhook inbox and the
+    # background worker often ask about the same reference within seconds.
+    # Concurrent calls for one (reference, amount) share a single upstream
+    # request, and the response is reused for INTERSWITCH_REQUERY_CACHE_TTL
+    # seconds.  With INTERSWITCH_REQUERY_CACHE_SHARED the response is also
+    # written to interswitch_requery_cache so other gunicorn workers reuse it.
+    # Errors are never cached (waiting callers do see the leader's error).
+    @classmethod
+    def requery_transaction(cls, reference_no: str, amount_kobo: int, max_age: float | None = None) -> dict:
+        """
+        Interswitch gettransaction response for a reference.  max_age overrides
+        the cache TTL for this call (0 = always ask upstream, still coalesced).
+        """
+        ttl = Config.INTERSWITCH_REQUERY_CACHE_TTL if max_age is None else max_age
+        key = (reference_no, int(amount_kobo))
+
+        if ttl > 0:
+            cached = cls._requery_cache.get(key)
+            if cached and time.monotonic() - cached[0] <= ttl:
+                REQUERY_CACHE.inc(result="hit")
+                return dict(cached[1])
+
+        with cls._requery_lock:
+            flight = cls._requery_inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = cls._requery_inflight[key] = _Flight()
+
+        if not leader:
+            REQUERY_CACHE.inc(result="coalesced")
+            if not flight.done.wait(Config.INTERSWITCH_CONNECT_TIMEOUT + Config.INTERSWITCH_READ_TIMEOUT + 5):
+                raise requests.Timeout(f"Timed out waiting for in-flight requery of {reference_no}")
+            if flight.error is not None:
+                raise flight.error
+            return dict(flight.result)
+
+        try:
+            body = cls._shared_requery_lookup(key, ttl) if ttl > 0 and Config.INTERSWITCH_REQUERY_CACHE_SHARED else None
+            if body is not None:
+                REQUERY_CACHE.inc(result="shared_hit")
+            else:
+                REQUERY_CACHE.inc(result="miss")
+                body = cls._requery_upstream(reference_no, amount_kobo)
+                if Config.INTERSWITCH_REQUERY_CACHE_SHARED:
+                    cls._shared_requery_store(key, body)
+            cls._remember_requery(key, body)
+            flight.result = body
+            return dict(body)
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with cls._requery_lock:
+                cls._requery_inflight.pop(key, None)
+            flight.done.set()
+
     @classmethod
-    def requery_transaction(cls, reference_no: str, amount_kobo: int) -> dict:
+    def _remember_requery(cls, key: tuple, body: dict):
+        if Config.INTERSWITCH_REQUERY_CACHE_TTL <= 0:
+            return
+        with cls._requery_lock:
+            if len(cls._requery_cache) >= REQUERY_CACHE_MAX_ENTRIES:
+                cutoff = time.monotonic() - Config.INTERSWITCH_REQUERY_CACHE_TTL
+                cls._requery_cache = {k: v for k, v in cls._requery_cache.items() if v[0] >= cutoff}
+                if len(cls._requery_cache) >= REQUERY_CACHE_MAX_ENTRIES:
+                    cls._requery_cache = {}
+            cls._requery_cache[key] = (time.monotonic(), body)
+
+    @classmethod
+    def _shared_requery_lookup(cls, key: tuple, ttl: float) -> dict | None:
+        from database import Database
+        try:
+            cls._ensure_requery_table()
+            rows = Database.execute_query(
+                """SELECT response FROM interswitch_requery_cache
+                   WHERE reference_no = %s AND amount_kobo = %s
+                     AND fetched_at > NOW() - make_interval(secs => %s)""",
+                (key[0], key[1], ttl),
+            )
+        except Exception as exc:
+            print(f"[interswitch] Shared requery cache unavailable: {exc}")
+            return None
+        return rows[0]["response"] if rows else None
+
+    @classmethod
+    def _shared_requery_store(cls, key: tuple, body: dict):
+        from database import Database
+        if not cls._requery_table_ready:
+            return   # the lookup found no table (or never ran); nothing to write to
+        try:
+            Database.execute_update(
+                """INSERT INTO interswitch_requery_cache (reference_no, amount_kobo, response, fetched_at)
+                   VALUES (%s, %s, %s::jsonb, NOW())
+                   ON CONFLICT (reference_no) DO UPDATE
+                   SET amount_kobo = EXCLUDED.amount_kobo, response = EXCLUDED.response,
+                       fetched_at  = EXCLUDED.fetched_at""",
+                (key[0], key[1], json.dumps(body, default=str)),
+            )
+        except Exception as exc:
+            print(f"[interswitch] Could not store shared requery result: {exc}")
+
+    @classmethod
+    def _ensure_requery_table(cls):
+        if cls._requery_table_ready:
+            return
+        from database import Database
+        Database.require_tables("migration_add_interswitch_requery_cache.sql", "interswitch_requery_cache")
+        cls._requery_table_ready = True
+
+    @classmethod
+    def breaker(cls) -> CircuitBreaker | None:
+        if not Config.INTERSWITCH_BREAKER_ENABLED:
+            return None
+        if cls._breaker is None:
+            with cls._requery_lock:
+                if cls._breaker is None:
+                    cls._breaker = CircuitBreaker(
+                        "requery",
+                        failure_rate=Config.INTERSWITCH_BREAKER_FAILURE_RATE,
+                        slow_call_seconds=Config.INTERSWITCH_BREAKER_SLOW_SECONDS,
+                        slow_call_rate=Config.INTERSWITCH_BREAKER_SLOW_RATE,
+                        min_calls=Config.INTERSWITCH_BREAKER_MIN_CALLS,
+                        window_seconds=Config.INTERSWITCH_BREAKER_WINDOW_SECONDS,
+                        open_seconds=Config.INTERSWITCH_BREAKER_OPEN_SECONDS,
+                        half_open_calls=Config.INTERSWITCH_BREAKER_PROBES,
+                        on_state_change=_on_breaker_change,
+                    )
+        return cls._breaker
+
+    @classmethod
+    def breaker_status(cls) -> dict:
+        breaker = cls.breaker()
+        if breaker is None:
+            return {"name": "requery", "state": "disabled"}
+        return {**breaker.snapshot(), "pid": os.getpid()}
+
+    @classmethod
+    def _requery_upstream(cls, reference_no: str, amount_kobo: int) -> dict:
+        """
+        One gettransaction call behind the circuit breaker.  Network errors,
+        timeouts, 5xx and any other exception count as failures, calls slower
+        than INTERSWITCH_BREAKER_SLOW_SECONDS as slow; 4xx are our own problem.
+        """
+        breaker = cls.breaker()
+        if breaker is None:
+            return cls._requery_call(reference_no, amount_kobo)
+        try:
+            breaker.before_call()
+        except CircuitOpenError as exc:
+            BREAKER_REJECTED.inc()
+            raise GatewayUnavailable(f"Interswitch unavailable, will retry: {exc}") from exc
+
+        started = time.perf_counter()
+        try:
+            body = cls._requery_call(reference_no, amount_kobo)
+        except requests.HTTPError as exc:
+            status = exc.response.status_code if exc.response is not None else 500
+            if status >= 500:
+                breaker.record_failure(exc)
+            else:
+                breaker.record_success(time.perf_counter() - started)
+            raise
+        except Exception as exc:
+            # Anything else (bad JSON, a bug) is a failure too: every call let
+            # through must record an outcome or a half-open probe slot leaks
+            breaker.record_failure(exc)
+            raise
+        breaker.record_success(time.perf_counter() - started)
+        return body
+
+    @classmethod
+    def _requery_call(cls, reference_no: str, amount_kobo: int) -> dict:
         base_url      = cls._requery_base()
         merchant_code = Config.INTERSWITCH_MERCHANT_CODE
         full_url = (
@@ -154,19 +567,32 @@ class InterswitchClient:
         nonce     = uuid.uuid4().hex
         timestamp = str(int(time.time()))
 
-        resp = requests.get(full_url, headers={
-            "Authorization": f"Bearer {token}",
-            "Content-Type":  "application/json",
-            "Nonce":         nonce,
-            "Timestamp":     timestamp,
-            "Signature":     cls._sign(nonce, timestamp),
-        }, timeout=30)
+        started = time.perf_counter()
+        try:
+            resp = cls._http().get(full_url, headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type":  "application/json",
+                "Nonce":         nonce,
+                "Timestamp":     timestamp,
+                "Signature":     cls._sign(nonce, timestamp),
+            }, timeout=cls._timeout())
+        except requests.RequestException:
+            metrics.INTERSWITCH_SECONDS.observe(time.perf_counter() - started, operation="requery", response_code="error")
+            raise
+        elapsed = time.perf_counter() - started
 
         if resp.status_code == 404:
+            metrics.INTERSWITCH_SECONDS.observe(elapsed, operation="requery", response_code="http_404")
             return {
                 "ResponseCode":        "T0",
                 "ResponseDescription": "Transaction not found or still pending",
             }
 
+        if not resp.ok:
+            metrics.INTERSWITCH_SECONDS.observe(elapsed, operation="requery", response_code=f"http_{resp.status_code}")
         resp.raise_for_status()
-        return resp.json()
\ No newline at end of file
+        body = resp.json()
+        metrics.INTERSWITCH_SECONDS.observe(
+            elapsed, operation="requery", response_code=str(body.get("ResponseCode", "")).strip() or "none",
+        )
+        return body
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+utils/leader_lease.py — Cluster-wide leader election through a lease row.
+
+Every gunicorn worker on every node calls create_app(), so every process
+starts the background requery loop.  A LeaderLease lets exactly one of them
+do the work: the holder of row `name` in worker_leases is the leader for as
+long as it keeps renewing the row before expires_at.
+
+  • A heartbeat thread renews the lease every ttl/3 seconds.  Followers
+    try to take it on the same schedule, which only succeeds once the row
+    has expired, so a dead leader is replaced within ttl + ttl/3 seconds.
+  • A leader that cannot renew (database unreachable) stops considering
+    itself leader once its own copy of the lease runs out, even before
+    anyone else can take over.
+  • release() (registered with atexit, so it runs when gunicorn recycles the
+    worker) expires the row at once, and the next follower heartbeat takes
+    over without waiting for the TTL.
+
+worker_leases comes from scripts/migration_add_worker_leases.sql; until it
+exists nobody becomes leader and each heartbeat logs the file to run.
+
+A lease row is used rather than a session-level advisory lock because the
+lock would need one pooled connection pinned for the life of the process and
+does not survive a transaction-mode connection pooler.
+"""
+
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+
+from database import Database
+from utils import metrics
+
+logger = logging.getLogger('leader_lease')
+
+LEASE_IS_LEADER = metrics.gauge('leader_lease_is_leader', '1 while this process holds the lease.', ('name',))
+LEASE_CHANGES   = metrics.counter('leader_lease_changes', 'Times this process gained or lost a lease.', ('name', 'event'))
+
+_table_ready = False
+_table_lock  = threading.Lock()
+
+
+def ensure_table():
+    """Raise database.MissingTable until migration_add_worker_leases.sql has run."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        Database.require_tables('migration_add_worker_leases.sql', 'worker_leases')
+        _table_ready = True
+
+
+class LeaderLease:
+    def __init__(self, name: str, ttl_seconds: float = 30.0):
+        self.name        = name
+        self.ttl_seconds = max(3.0, float(ttl_seconds))
+        self.holder      = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+        self._lock         = threading.Lock()
+        self._valid_until  = 0.0      # monotonic; our own view of the lease
+        self._stop         = threading.Event()
+        self._thread       = None
+
+    # ── Acquire / renew / release ─────────────────────────────────────────────
+    def try_acquire(self) -> bool:
+        """Take the lease if it is free or expired, or renew it if we hold it."""
+        sent_at = time.monotonic()
+        try:
+            ensure_table()
+            with Database.get_cursor() as cursor:
+                cursor.execute(
+                    '''INSERT INTO worker_leases (name, holder, acquired_at, heartbeat_at, expires_at)
+                       VALUES (%s, %s, NOW(), NOW(), NOW() + %s * INTERVAL '1 second')
+                       ON CONFLICT (name) DO UPDATE
+                       SET holder       = EXCLUDED.holder,
+                           acquired_at  = CASE WHEN worker_leases.holder = EXCLUDED.holder
+                                               THEN worker_leases.acquired_at ELSE NOW() END,
+                           heartbeat_at = NOW(),
+                           expires_at   = EXCLUDED.expires_at
+                       WHERE worker_leases.holder = EXCLUDED.holder
+                          OR worker_leases.expires_at < NOW()
+                       RETURNING holder''',
+                    (self.name, self.holder, self.ttl_seconds)
+                )
+                won = cursor.fetchone() is not None
+        except Exception as exc:
+            logger.warning(f'[leader_lease] {self.name}: could not reach the lease row: {exc}')
+            won = False
+
+        with self._lock:
+            was_leader = self._is_leader_locked()
+            if won:
+                # Measured from when the renewal was sent, so a slow round
+                # trip shortens our view of the lease rather than extending it
+                self._valid_until = sent_at + self.ttl_seconds
+            is_leader = self._is_leader_locked()
+        self._report(was_leader, is_leader)
+        return is_leader
+
+    def release(self):
+        """Give the lease up now so another process can take over without waiting for the TTL."""
+        with self._lock:
+            was_leader = self._is_leader_locked()
+            self._valid_until = 0.0
+        if not was_leader:
+            return
+        try:
+            Database.execute_update(
+                'UPDATE worker_leases SET expires_at = NOW() WHERE name = %s AND holder = %s',
+                (self.name, self.holder)
+            )
+        except Exception:
+            pass
+        self._report(True, False)
+
+    def is_leader(self) -> bool:
+        with self._lock:
+            is_leader = self._is_leader_locked()
+        if not is_leader:
+            LEASE_IS_LEADER.set(0, name=self.name)
+        return is_leader
+
+    def _is_leader_locked(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    def _report(self, was_leader: bool, is_leader: bool):
+        LEASE_IS_LEADER.set(1 if is_leader else 0, name=self.name)
+        if is_leader and not was_leader:
+            LEASE_CHANGES.inc(name=self.name, event='acquired')
+            logger.info(f'[leader_lease] {self.name}: {self.holder} is now the leader')
+        elif was_leader and not is_leader:
+            LEASE_CHANGES.inc(name=self.name, event='lost')
+            logger.warning(f'[leader_lease] {self.name}: {self.holder} is no longer the leader')
+
+    # ── Heartbeat ─────────────────────────────────────────────────────────────
+    def start(self):
+        """Start the heartbeat thread (idempotent) and release the lease at exit."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._heartbeat, name=f'lease-{self.name}', daemon=True)
+        self._thread.start()
+        atexit.register(self.release)
+
+    def stop(self):
+        self._stop.set()
+        self.release()
+
+    def _heartbeat(self):
+        interval = self.ttl_seconds / 3
+        while not self._stop.is_set():
+            self.try_acquire()
+            self._stop.wait(interval)
+
+    # ── Status ────────────────────────────────────────────────────────────────
+    def record_run(self, summary: dict):
+        """Store the leader's last run on the lease row for the status readout."""
+        Database.execute_update(
+            '''UPDATE worker_leases SET last_run_at = NOW(), last_run_summary = %s::jsonb
+               WHERE name = %s AND holder = %s''',
+            (json.dumps(summary, default=str), self.name, self.holder)
+        )
+
+    def status(self) -> dict:
+        """Cluster-wide view of the lease, plus whether this process holds it."""
+        row = None
+        try:
+            ensure_table()
+            rows = Database.execute_query(
+                '''SELECT holder, acquired_at, heartbeat_at, expires_at, last_run_at, last_run_summary,
+                          expires_at > NOW() AS active
+                   FROM worker_leases WHERE name = %s''',
+                (self.name,)
+            )
+            row = rows[0] if rows else None
+        except Exception:
+            pass
+        return {
+            'name':             self.name,
+            'leader':           row['holder'] if row and row['active'] else None,
+            'state':            ('active' if row['active'] else 'expired') if row else 'unclaimed',
+            'acquired_at':      row['acquired_at'].isoformat() if row else None,
+            'heartbeat_at':     row['heartbeat_at'].isoformat() if row else None,
+            'expires_at':       row['expires_at'].isoformat() if row else None,
+            'last_run_at':      row['last_run_at'].isoformat() if row and row['last_run_at'] else None,
+            'last_run_summary': row['last_run_summary'] if row else None,
+            'this_process':     self.holder,
+            'is_leader':        self.is_leader(),
+            'ttl_seconds':      self.ttl_seconds,
+        }
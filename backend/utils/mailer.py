@@ -1,11 +1,14 @@
 import smtplib
 import ssl
 import os
+import time
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 
+from utils import metrics
+
 logger = logging.getLogger(__name__)
 
 SENDER_PROFILES = {
@@ -121,6 +124,7 @@ def send_email(
         part["Content-Disposition"] = f'attachment; filename="{filename}"'
         msg.attach(part)
 
+    started = time.perf_counter()
     try:
         context = ssl.create_default_context()
         if use_ssl:
@@ -134,6 +138,8 @@ def send_email(
             server.login(sender, password)
             server.sendmail(sender, to, msg.as_string())
             logger.info(f"Email sent via {profile} profile to {to}: {subject}")
+        metrics.SMTP_SEND_SECONDS.observe(time.perf_counter() - started, profile=profile, outcome="ok")
     except Exception as e:
+        metrics.SMTP_SEND_SECONDS.observe(time.perf_counter() - started, profile=profile, outcome="error")
         logger.error(f"Failed to send email to {to}: {e}")
         raise
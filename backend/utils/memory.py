@@ -0,0 +1,201 @@
+"""
+utils/memory.py — Worker memory diagnostics.
+
+  • current_rss_bytes() / peak_rss_bytes()  — cheap process RSS readings
+    (/proc/self/statm and getrusage ru_maxrss), used around the PDF- and
+    image-heavy endpoints listed in Config.MEMORY_TRACKED_ENDPOINTS.
+  • tracemalloc helpers — start tracing, take a baseline snapshot and diff
+    later snapshots against it, exposed to admins by routes/diagnostics.py.
+
+Everything here is per worker process: a gunicorn worker keeps its own RSS,
+tracemalloc state and baseline, so a diff only means something when taken
+on the same worker (check the "pid" field in responses).
+"""
+
+import gc
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import logging
+
+try:
+    import resource
+except ImportError:          # Windows dev machines
+    resource = None
+
+from config import Config
+from utils import metrics
+
+logger = logging.getLogger('memory')
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+PROCESS_RSS = metrics.gauge('process_resident_memory_bytes', 'Worker resident set size at last reading.')
+REQUEST_RSS_DELTA = metrics.histogram(
+    'http_request_rss_delta_bytes', 'RSS growth across a tracked request.',
+    ('route',),
+    buckets=(0, 1 << 20, 4 << 20, 16 << 20, 32 << 20, 64 << 20, 128 << 20, 256 << 20),
+)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RSS readings
+# ─────────────────────────────────────────────────────────────────────────────
+
+def current_rss_bytes() -> int:
+    """Current RSS. Reads /proc on Linux, falls back to the peak elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """High-water RSS of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mb(value: int) -> float:
+    return round(value / (1024 * 1024), 1)
+
+
+def start_request_tracking(g, request) -> None:
+    if request.endpoint not in Config.MEMORY_TRACKED_ENDPOINTS:
+        return
+    g._rss_before  = current_rss_bytes()
+    g._peak_before = peak_rss_bytes()
+
+
+def finish_request_tracking(g, request, response) -> None:
+    before = getattr(g, '_rss_before', None)
+    if before is None:
+        return
+    after = current_rss_bytes()
+    peak  = peak_rss_bytes()
+    PROCESS_RSS.set(after)
+    REQUEST_RSS_DELTA.observe(max(after - before, 0), route=request.url_rule.rule)
+    # The peak only moves when this request pushed the worker past its previous
+    # high-water mark, so peak_growth is a lower bound on the request's own peak.
+    logger.info(
+        f'[memory] pid={os.getpid()} {request.method} {request.endpoint} status={response.status_code} '
+        f'rss_before={_mb(before)}MB rss_after={_mb(after)}MB delta={_mb(after - before)}MB '
+        f'peak={_mb(peak)}MB peak_growth={_mb(peak - g._peak_before)}MB'
+    )
+
+
+def memory_summary() -> dict:
+    rss = current_rss_bytes()
+    PROCESS_RSS.set(rss)
+    return {
+        'pid':                os.getpid(),
+        'rss_mb':             _mb(rss),
+        'peak_rss_mb':        _mb(peak_rss_bytes()),
+        'gc_counts':          gc.get_count(),
+        'gc_objects':         len(gc.get_objects()),
+        'threads':            threading.active_count(),
+        'tracemalloc':        tracemalloc.is_tracing(),
+        'baseline_taken_at':  _baseline['taken_at'],
+        'tracked_endpoints':  sorted(Config.MEMORY_TRACKED_ENDPOINTS),
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# tracemalloc
+# ─────────────────────────────────────────────────────────────────────────────
+
+_baseline = {'snapshot': None, 'taken_at': None}
+_tracemalloc_lock = threading.Lock()
+
+# Tracing our own bookkeeping would pollute every diff
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def start_tracing(frames: int = 1) -> dict:
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(frames, 50)))
+            logger.info(f'[memory] tracemalloc started on pid={os.getpid()} ({frames} frame(s))')
+    return tracing_status()
+
+
+def stop_tracing() -> dict:
+    with _tracemalloc_lock:
+        tracemalloc.stop()
+        _baseline['snapshot'] = None
+        _baseline['taken_at'] = None
+    return tracing_status()
+
+
+def tracing_status() -> dict:
+    status = {'pid': os.getpid(), 'tracing': tracemalloc.is_tracing()}
+    if status['tracing']:
+        current, peak = tracemalloc.get_traced_memory()
+        status.update({
+            'traced_mb':      _mb(current),
+            'traced_peak_mb': _mb(peak),
+            'frames':         tracemalloc.get_traceback_limit(),
+            'overhead_mb':    _mb(tracemalloc.get_tracemalloc_memory()),
+        })
+    status['baseline_taken_at'] = _baseline['taken_at']
+    return status
+
+
+def _format_stat(stat, with_diff: bool) -> dict:
+    frame = stat.traceback[0]
+    row = {
+        'location': f'{frame.filename}:{frame.lineno}',
+        'size_kb':  round(stat.size / 1024, 1),
+        'count':    stat.count,
+    }
+    if with_diff:
+        row['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+        row['count_diff']   = stat.count_diff
+    if len(stat.traceback) > 1:
+        row['traceback'] = [f'{f.filename}:{f.lineno}' for f in stat.traceback]
+    return row
+
+
+def take_snapshot(key_type: str = 'lineno', limit: int = 25, set_baseline: bool = True) -> dict:
+    """Top allocations right now; optionally store the snapshot as the diff baseline."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc is not running')
+    started  = time.perf_counter()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    if set_baseline:
+        _baseline['snapshot'] = snapshot
+        _baseline['taken_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    stats = snapshot.statistics(key_type)
+    return {
+        **tracing_status(),
+        'key_type':   key_type,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'top':        [_format_stat(s, False) for s in stats[:limit]],
+    }
+
+
+def diff_snapshot(key_type: str = 'lineno', limit: int = 25) -> dict:
+    """Compare a fresh snapshot with the baseline; largest growth first."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc is not running')
+    if _baseline['snapshot'] is None:
+        raise RuntimeError('no baseline snapshot on this worker — take one first')
+    started  = time.perf_counter()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    stats    = snapshot.compare_to(_baseline['snapshot'], key_type)
+    return {
+        **tracing_status(),
+        'key_type':      key_type,
+        'elapsed_ms':    round((time.perf_counter() - started) * 1000, 1),
+        'total_diff_kb': round(sum(s.size_diff for s in stats) / 1024, 1),
+        'top':           [_format_stat(s, True) for s in stats[:limit]],
+    }
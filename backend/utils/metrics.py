@@ -0,0 +1,243 @@
+"""
+utils/metrics.py — Minimal in-process metrics registry (Prometheus text format).
+
+No external dependency: counters, gauges and histograms are plain Python
+objects guarded by a lock and rendered by render_latest() for the
+/e-portal/api/metrics endpoint (see app.py).
+
+Each gunicorn worker keeps its own registry, so a scrape reflects the
+worker that served it — fine for local charting, sum across workers if
+you run more than one.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self._lock         = threading.Lock()
+        self._values       = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def _header(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f'{self.name}_total{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum']   += value
+            state['count'] += 1
+
+    def total_count(self) -> int:
+        """Observations across all label values (handy for scripts and checks)."""
+        with self._lock:
+            return sum(state['count'] for state in self._values.values())
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, dict(v, counts=list(v['counts']))) for k, v in self._values.items())
+        lines = self._header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{labels} {state["count"]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock    = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name, documentation, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Application metrics
+# ─────────────────────────────────────────────────────────────────────────────
+
+HTTP_REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds', 'Request latency by blueprint and route.',
+    ('blueprint', 'route', 'method'),
+)
+HTTP_REQUESTS = counter(
+    'http_requests', 'Requests served by blueprint, route and status code.',
+    ('blueprint', 'route', 'method', 'status'),
+)
+HTTP_REQUEST_DB_SECONDS = histogram(
+    'http_request_db_seconds', 'Time spent in database calls per request.',
+    ('blueprint', 'route'),
+)
+DB_QUERY_SECONDS = histogram(
+    'db_query_duration_seconds', 'Latency of Database.execute_query / execute_update calls.',
+    ('kind',),
+)
+DB_POOL_WAIT_SECONDS = histogram(
+    'db_pool_wait_seconds', 'Time spent checking a connection out of the pool.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+DB_POOL_IN_USE = gauge('db_pool_connections_in_use', 'Connections currently checked out of the pool.')
+DB_POOL_MAX = gauge('db_pool_connections_max', 'Configured maximum pool size.')
+DB_POOL_ERRORS = counter('db_pool_checkout_errors', 'Failed pool checkouts (exhausted or unreachable).')
+INTERSWITCH_SECONDS = histogram(
+    'interswitch_request_duration_seconds', 'Interswitch call latency by operation and response code.',
+    ('operation', 'response_code'),
+)
+SMTP_SEND_SECONDS = histogram(
+    'smtp_send_duration_seconds', 'SMTP send latency by sender profile and outcome.',
+    ('profile', 'outcome'),
+)
+BACKGROUND_RUN_SECONDS = histogram(
+    'background_run_duration_seconds', 'Duration of background worker runs.',
+    ('worker', 'outcome'),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+
+def record_db_time(kind: str, elapsed: float, query=None) -> None:
+    """Observe one DB call and add it to the current request's DB time."""
+    DB_QUERY_SECONDS.observe(elapsed, kind=kind)
+    try:
+        from flask import g, has_request_context
+        if has_request_context():
+            g._db_time = getattr(g, '_db_time', 0.0) + elapsed
+            if getattr(g, '_profile_queries', None) is not None:
+                from utils.profiler import record_query
+                record_query(g, kind, query, elapsed)
+    except Exception:
+        pass
@@ -0,0 +1,183 @@
+"""
+utils/payment_archive.py — Move old failed / cancelled payments out of the hot table.
+
+payment_transactions keeps every row forever, but everything that reads it
+at any age only wants successful rows (receipts, "has paid" checks, the
+session ledger, reconciliation) while the engine, callbacks and webhooks
+only touch recent or pending ones.  Failed and cancelled rows older than
+PAYMENT_ARCHIVE_AFTER_DAYS are therefore moved, in batches, to
+payment_transactions_archive — one DELETE … RETURNING feeding an INSERT, so
+a row is always in exactly one of the two tables.  Successful rows are
+never archived.
+
+On the way into the archive raw_response_payload is compacted the same way
+new writes are (see compact_response in utils/payment_status.py): the keys
+already stored in their own columns and empty values are dropped.
+
+The table comes from scripts/migration_add_payment_transactions_archive.sql,
+which also copies over any column payment_transactions has gained since;
+re-run it after adding one.  ensure_table() only reads the column lists and
+refuses to archive (database.MissingTable / RuntimeError) while the archive
+is missing or lacks a column, rather than dropping that column's data.
+"""
+
+import threading
+import time
+import logging
+
+from config import Config
+from database import Database, MissingTable
+from utils import metrics
+from utils.payment_status import RESPONSE_COLUMN_KEYS
+
+logger = logging.getLogger('payment_archive')
+
+PAYMENTS_ARCHIVED = metrics.counter('payments_archived', 'Failed / cancelled payments moved to the archive.')
+
+ARCHIVABLE_STATUSES = ('failed', 'cancelled')
+
+_table_ready = False
+_table_lock  = threading.Lock()
+_columns     = ()      # columns shared by both tables, in payment_transactions order
+_started     = False
+_lease       = None
+
+
+def compact_payload_sql(column: str) -> str:
+    """SQL expression: the jsonb `column` with column-backed keys and empty values removed (NULL if nothing is left)."""
+    keys = ', '.join(f"'{k}'" for k in RESPONSE_COLUMN_KEYS)
+    return f'''CASE WHEN jsonb_typeof({column}) = 'object' THEN
+                   (SELECT jsonb_object_agg(e.key, e.value) FROM jsonb_each({column}) e
+                    WHERE e.key NOT IN ({keys})
+                      AND e.value NOT IN ('null'::jsonb, '""'::jsonb, '[]'::jsonb, '{{}}'::jsonb))
+               ELSE {column} END'''
+
+
+def _table_columns(cursor, table: str) -> list:
+    cursor.execute(
+        '''SELECT a.attname AS name
+           FROM pg_attribute a
+           WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+           ORDER BY a.attnum''',
+        (table,)
+    )
+    return [r['name'] for r in cursor.fetchall()]
+
+
+def ensure_table():
+    """Load the shared column list. Read-only; the schema lives in the migration."""
+    global _table_ready, _columns
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        migration = 'migration_add_payment_transactions_archive.sql'
+        Database.require_tables(migration, 'payment_transactions_archive')
+        with Database.get_cursor() as cursor:
+            hot      = _table_columns(cursor, 'payment_transactions')
+            archived = set(_table_columns(cursor, 'payment_transactions_archive'))
+        missing = [c for c in hot if c not in archived]
+        if missing:
+            raise RuntimeError(
+                f"payment_transactions_archive lacks column(s) {', '.join(missing)}: "
+                f"re-run scripts/{migration}"
+            )
+        _columns = tuple(hot)
+        _table_ready = True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Mover
+# ─────────────────────────────────────────────────────────────────────────────
+
+def archive_batch(after_days: float | None = None, batch_size: int | None = None) -> int:
+    """Move one batch of archivable rows. Returns how many moved."""
+    ensure_table()
+    after_days = Config.PAYMENT_ARCHIVE_AFTER_DAYS if after_days is None else after_days
+    batch_size = batch_size or Config.PAYMENT_ARCHIVE_BATCH_SIZE
+    cols = ', '.join(f'"{c}"' for c in _columns)
+    select = ', '.join(
+        compact_payload_sql('"raw_response_payload"') if c == 'raw_response_payload' else f'"{c}"'
+        for c in _columns
+    )
+    with Database.get_cursor() as cursor:
+        # SKIP LOCKED: rows a requery or callback is updating right now wait
+        # for the next batch instead of blocking the mover
+        cursor.execute(
+            f'''WITH moved AS (
+                    DELETE FROM payment_transactions
+                    WHERE id IN (SELECT id FROM payment_transactions
+                                 WHERE tran_status = ANY(%(statuses)s)
+                                   AND updated_at < NOW() - %(days)s * INTERVAL '1 day'
+                                 ORDER BY updated_at
+                                 LIMIT %(limit)s
+                                 FOR UPDATE SKIP LOCKED)
+                      AND tran_status = ANY(%(statuses)s)
+                    RETURNING *
+                )
+                INSERT INTO payment_transactions_archive ({cols})
+                SELECT {select} FROM moved''',
+            {'statuses': list(ARCHIVABLE_STATUSES), 'days': after_days, 'limit': batch_size}
+        )
+        moved = cursor.rowcount
+    PAYMENTS_ARCHIVED.inc(moved)
+    return moved
+
+
+def run_archive(after_days: float | None = None, batch_size: int | None = None,
+                deadline_seconds: float | None = None) -> dict:
+    """Move batches until nothing is left to archive or the deadline passes."""
+    started = time.monotonic()
+    batch_size = batch_size or Config.PAYMENT_ARCHIVE_BATCH_SIZE
+    archived = batches = 0
+    while True:
+        moved = archive_batch(after_days, batch_size)
+        archived += moved
+        batches += 1
+        if moved < batch_size:
+            break
+        if deadline_seconds is not None and time.monotonic() - started > deadline_seconds:
+            break
+    return {'archived': archived, 'batches': batches}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Background worker
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _worker_loop():
+    while True:
+        if not _lease.is_leader():
+            time.sleep(_lease.ttl_seconds / 3)
+            continue
+        started = time.perf_counter()
+        try:
+            summary = run_archive(deadline_seconds=Config.PAYMENT_ARCHIVE_INTERVAL_SECONDS / 2)
+            metrics.BACKGROUND_RUN_SECONDS.observe(time.perf_counter() - started, worker='payment-archive', outcome='ok')
+            _lease.record_run(summary)
+            if summary['archived']:
+                logger.info(f"[payment_archive] Archived {summary['archived']} payment(s)")
+        except Exception as exc:
+            metrics.BACKGROUND_RUN_SECONDS.observe(time.perf_counter() - started, worker='payment-archive', outcome='error')
+            logger.exception(f'[payment_archive] Archive run failed: {exc}')
+        time.sleep(Config.PAYMENT_ARCHIVE_INTERVAL_SECONDS)
+
+
+def start_archive_worker():
+    global _started, _lease
+    if not Config.PAYMENT_ARCHIVE_ENABLED:
+        return
+    with _table_lock:
+        if _started:
+            return
+        _started = True
+    try:
+        ensure_table()
+    except (MissingTable, RuntimeError) as exc:
+        logger.error(f'[payment_archive] Archive worker not started: {exc}')
+        return
+    from utils.leader_lease import LeaderLease
+    _lease = LeaderLease('payment-archive', ttl_seconds=Config.REQUERY_LEASE_TTL_SECONDS)
+    _lease.start()
+    threading.Thread(target=_worker_loop, name='payment-archive', daemon=True).start()
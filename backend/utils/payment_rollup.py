@@ -0,0 +1,240 @@
+"""
+utils/payment_rollup.py — Daily revenue and payment-funnel rollups.
+
+payment_daily_rollup holds one row per
+(day, tran_type, program_type, tran_status) with the transaction count, the
+amount charged and paid, amount mismatches and the median seconds from
+initiation to confirmation.  `day` is the day the payment was *initiated*,
+so each day is a funnel cohort: conversion = successful / all rows of that
+day, and revenue for the day is the amount_paid of its successful rows.
+program_type comes from the initiation payload, else the student's session
+ledger (once its migration has run), else their latest application
+(0 = could not be determined).
+
+Freshness:
+  • atomic_settle_payment marks the payment's day in payment_rollup_dirty,
+    inside the settlement transaction (one INSERT … ON CONFLICT DO NOTHING,
+    which takes no lock on an existing row).
+  • A worker, run by one process cluster-wide through a LeaderLease,
+    recomputes the dirty days plus the last PAYMENT_ROLLUP_TRAILING_DAYS
+    days every PAYMENT_ROLLUP_REFRESH_SECONDS.  The trailing window picks up
+    everything that does not go through settlement (new pending rows,
+    failures, the 24h stale expiry).
+  • scripts/rebuild_payment_rollup.py rebuilds any range from scratch.
+
+A day is recomputed as a whole (DELETE + INSERT … SELECT over that day's
+rows, through the created_at index), so refreshing is idempotent and never
+drifts the way incremental counters could.  The day's rows are read from
+payment_transactions and, once its migration has run,
+payment_transactions_archive together, so archiving old failures does not
+change the funnel.
+
+The tables come from scripts/migration_add_payment_rollup.sql; until it has
+run the worker logs the file and stays idle and the report answers 503.
+"""
+
+import threading
+import time
+import logging
+from datetime import date, timedelta
+
+from config import Config
+from database import Database, MissingTable
+from utils import metrics
+
+logger = logging.getLogger('payment_rollup')
+
+ROLLUP_DAYS_REFRESHED = metrics.counter('payment_rollup_days_refreshed', 'Rollup days recomputed.', ('source',))
+
+_table_ready = False
+_table_lock  = threading.Lock()
+_started     = False
+_lease       = None
+
+# program_type for a payment_transactions row `pt`; {ledger} is _LEDGER_PROGRAM_TYPE_SQL
+# when student_session_ledger exists, else nothing
+_PROGRAM_TYPE_SQL = r'''COALESCE(
+    CASE WHEN pt.raw_request_payload->>'program_type_id' ~ '^\d+$'
+         THEN (pt.raw_request_payload->>'program_type_id')::int END,{ledger}
+    (SELECT a.prog_type FROM applications a
+      WHERE a.user_id = pt.user_id ORDER BY a.created_at DESC LIMIT 1),
+    (SELECT 2 FROM pg_application pg WHERE pg.user_id = pt.user_id LIMIT 1),
+    0)'''
+
+_LEDGER_PROGRAM_TYPE_SQL = r'''
+    (SELECT CASE WHEN l.program_type ~ '^\d+$' THEN l.program_type::int END
+       FROM student_session_ledger l
+      WHERE l.user_id = pt.user_id AND l.academic_session_id = pt.academic_session_id),'''
+
+# A day's payments, wherever they live now (see utils/payment_archive.py)
+_DAY_ROWS_SQL = '''SELECT user_id, academic_session_id, tran_type, tran_status, amount, amount_paid,
+                 is_amount_mismatch, raw_request_payload, created_at, confirmed_at
+          FROM {table}
+          WHERE created_at >= %(day)s::date AND created_at < %(day)s::date + 1'''
+
+_REFRESH_DAY_SQL = '''
+    INSERT INTO payment_daily_rollup
+        (day, tran_type, program_type, tran_status, txn_count, amount, amount_paid,
+         mismatches, median_settle_seconds, refreshed_at)
+    SELECT %(day)s::date, tran_type, program_type, tran_status,
+           COUNT(*),
+           COALESCE(SUM(amount), 0),
+           COALESCE(SUM(amount_paid), 0),
+           COUNT(*) FILTER (WHERE is_amount_mismatch),
+           PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY settle_seconds)
+               FILTER (WHERE settle_seconds >= 0),
+           NOW()
+    FROM (
+        SELECT COALESCE(pt.tran_type, 'unknown')   AS tran_type,
+               {program_type_sql}                  AS program_type,
+               COALESCE(pt.tran_status, 'unknown') AS tran_status,
+               pt.amount, pt.amount_paid, pt.is_amount_mismatch,
+               EXTRACT(EPOCH FROM (pt.confirmed_at - pt.created_at)) AS settle_seconds
+        FROM ({day_rows}) pt
+    ) src
+    GROUP BY tran_type, program_type, tran_status'''
+
+
+def _refresh_day_sql() -> str:
+    """
+    _REFRESH_DAY_SQL over the hot table, plus the archive when it exists; the
+    session ledger is consulted for program_type only once its migration has run.
+    """
+    rows = Database.execute_query(
+        """SELECT to_regclass('payment_transactions_archive') IS NOT NULL AS archived,
+                  to_regclass('student_session_ledger') IS NOT NULL AS ledger"""
+    )
+    present = rows[0] if rows else {'archived': False, 'ledger': False}
+    day_rows = _DAY_ROWS_SQL.format(table='payment_transactions')
+    if present['archived']:
+        day_rows += ' UNION ALL ' + _DAY_ROWS_SQL.format(table='payment_transactions_archive')
+    program_type_sql = _PROGRAM_TYPE_SQL.format(ledger=_LEDGER_PROGRAM_TYPE_SQL if present['ledger'] else '')
+    return _REFRESH_DAY_SQL.format(program_type_sql=program_type_sql, day_rows=day_rows)
+
+
+def ensure_table():
+    """Raise database.MissingTable until migration_add_payment_rollup.sql has run."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        Database.require_tables('migration_add_payment_rollup.sql', 'payment_daily_rollup', 'payment_rollup_dirty')
+        _table_ready = True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Marking
+# ─────────────────────────────────────────────────────────────────────────────
+
+def mark_dirty(reference_nos) -> None:
+    """
+    Queue the days of these payments for the next refresh.  Safe inside a
+    caller's transaction: runs under a savepoint and never raises.
+    """
+    if not reference_nos:
+        return
+    try:
+        ensure_table()
+    except MissingTable:
+        return   # nothing to mark into; start_rollup_worker logs the migration
+    with Database.transaction() as cursor:
+        cursor.execute('SAVEPOINT payment_rollup')
+        try:
+            cursor.execute(
+                '''INSERT INTO payment_rollup_dirty (day)
+                   SELECT DISTINCT created_at::date FROM payment_transactions
+                   WHERE reference_no = ANY(%s) AND created_at IS NOT NULL
+                   ON CONFLICT (day) DO NOTHING''',
+                (list(reference_nos),)
+            )
+        except Exception as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT payment_rollup')
+            logger.warning(f'[payment_rollup] Could not mark {len(reference_nos)} payment(s) dirty: {e}')
+            return
+        cursor.execute('RELEASE SAVEPOINT payment_rollup')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Refreshing
+# ─────────────────────────────────────────────────────────────────────────────
+
+def refresh_days(days, source: str = 'manual') -> int | None:
+    """
+    Recompute the given days in one transaction.  Returns the number of days
+    refreshed, or None if another process is refreshing right now.
+    """
+    ensure_table()
+    days = sorted(set(days))
+    refresh_sql = _refresh_day_sql()
+    with Database.transaction() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('payment_rollup')) AS got")
+        if not cursor.fetchone()['got']:
+            return None
+        for day in days:
+            cursor.execute('DELETE FROM payment_daily_rollup WHERE day = %s', (day,))
+            cursor.execute(refresh_sql, {'day': day})
+    ROLLUP_DAYS_REFRESHED.inc(len(days), source=source)
+    return len(days)
+
+
+def refresh_due() -> dict:
+    """Recompute the dirty days and the trailing window. Returns a run summary."""
+    ensure_table()
+    today = date.today()
+    trailing = {today - timedelta(days=i) for i in range(max(1, Config.PAYMENT_ROLLUP_TRAILING_DAYS))}
+    refresh_sql = _refresh_day_sql()
+    with Database.transaction() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('payment_rollup')) AS got")
+        if not cursor.fetchone()['got']:
+            return {'skipped': 'another refresh is running'}
+        # Taking the marks in the same transaction as the recompute: a payment
+        # marked after this DELETE stays marked for the next run
+        cursor.execute('DELETE FROM payment_rollup_dirty RETURNING day')
+        dirty = {r['day'] for r in cursor.fetchall()}
+        for day in sorted(dirty | trailing):
+            cursor.execute('DELETE FROM payment_daily_rollup WHERE day = %s', (day,))
+            cursor.execute(refresh_sql, {'day': day})
+    ROLLUP_DAYS_REFRESHED.inc(len(dirty - trailing), source='dirty')
+    ROLLUP_DAYS_REFRESHED.inc(len(trailing), source='trailing')
+    return {'dirty_days': len(dirty), 'days_refreshed': len(dirty | trailing)}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Background worker
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _worker_loop():
+    while True:
+        if not _lease.is_leader():
+            time.sleep(_lease.ttl_seconds / 3)
+            continue
+        started = time.perf_counter()
+        try:
+            summary = refresh_due()
+            metrics.BACKGROUND_RUN_SECONDS.observe(time.perf_counter() - started, worker='payment-rollup', outcome='ok')
+            _lease.record_run(summary)
+        except Exception as exc:
+            metrics.BACKGROUND_RUN_SECONDS.observe(time.perf_counter() - started, worker='payment-rollup', outcome='error')
+            logger.exception(f'[payment_rollup] Refresh failed: {exc}')
+        time.sleep(Config.PAYMENT_ROLLUP_REFRESH_SECONDS)
+
+
+def start_rollup_worker():
+    global _started, _lease
+    if not Config.PAYMENT_ROLLUP_ENABLED:
+        return
+    with _table_lock:
+        if _started:
+            return
+        _started = True
+    try:
+        ensure_table()
+    except MissingTable as exc:
+        logger.error(f'[payment_rollup] Rollup worker not started: {exc}')
+        return
+    from utils.leader_lease import LeaderLease
+    _lease = LeaderLease('payment-rollup', ttl_seconds=Config.REQUERY_LEASE_TTL_SECONDS)
+    _lease.start()
+    threading.Thread(target=_worker_loop, name='payment-rollup', daemon=True).start()
@@ -1,5 +1,9 @@
-from database import Database
+from database import Database, MissingTable
 from utils.auth import AuthHandler
+from utils.counters import allocate as allocate_counter
+from utils.fee_matrix import get_fee_matrix
+from utils import metrics, session_ledger, payment_rollup
+from psycopg2.extras import execute_values
 import json
 import secrets
 import string
@@ -63,6 +67,16 @@ FAIL_AFTER_REQUERIES = 6
 
 STALE_THRESHOLD_MINUTES = 24 * 60  # 24 hours
 
+# ── Requery scheduling (next_requery_at) ──────────────────────────────────────
+# Backoff class → (base seconds, cap seconds).  The delay before the next
+# requery is base * 2^requery_count, capped, with ±10% jitter so rows created
+# together do not stay in lock-step.
+REQUERY_BACKOFF = {
+    'processing':    (60,      30 * 60),   # known pending / bank-transfer codes
+    'unknown':       (5 * 60, 2 * 60 * 60), # unrecognised codes — keep checking, slowly
+    'requery_error': (30,      15 * 60),   # network error talking to Interswitch
+}
+
 
 # ── Core classifier ───────────────────────────────────────────────────────────
 
@@ -107,14 +121,10 @@ def generate_receipt_no(payment_type: str = '', session_id=None) -> str:
         except Exception:
             pass
 
-    # ── Build the receipt prefix and get the next sequential number ───────────
+    # ── Build the receipt prefix and allocate the next sequential number ──────
     prefix = f"PCU/{type_code}/{session_label}"
     try:
-        count_res = Database.execute_query(
-            "SELECT COUNT(*) AS cnt FROM payment_transactions WHERE receipt_no LIKE %s",
-            (f"{prefix}/%",)
-        )
-        seq = (int(count_res[0]['cnt']) if count_res else 0) + 1
+        seq = allocate_counter(f"receipt:{prefix}", seed=lambda: _max_receipt_seq(prefix))
     except Exception:
         # Fallback: use a random 6-digit number to avoid collisions
         seq = int(secrets.token_hex(3), 16) % 900000 + 100000
@@ -122,6 +132,52 @@ def generate_receipt_no(payment_type: str = '', session_id=None) -> str:
     return f"{prefix}/{seq:06d}"
 
 
+def _max_receipt_seq(prefix: str) -> int:
+    """Highest counter already used under a receipt prefix (seeds a new counter)."""
+    res = Database.execute_query(
+        r"""SELECT MAX(CAST(SUBSTRING(receipt_no FROM '/([0-9]+)$') AS BIGINT)) AS n
+            FROM payment_transactions WHERE receipt_no LIKE %s""",
+        (f"{prefix}/%",)
+    )
+    if res is None:
+        raise RuntimeError(f"Could not read existing receipts for {prefix}")
+    return int(res[0]['n'] or 0) if res else 0
+
+
+def generate_form_no(program_type_id) -> str:
+    """
+    Next application form number, PCU/{YEAR}/{CODE}{NNNN} e.g. PCU/2026/UTME0042.
+    One sequence per year + programme code, shared by applications and
+    pg_application so a number is never issued twice.
+
+    Until migration_add_document_counters.sql has run the number is the
+    highest one in use + 1, serialised per prefix by an advisory lock held
+    for the caller's transaction.
+    """
+    prefix = f"PCU/{datetime.now().year}/{_prog_code_from_id(program_type_id)}"
+    try:
+        seq = allocate_counter(f"form:{prefix}", seed=lambda: _max_form_seq(prefix))
+    except MissingTable:
+        Database.execute_query('SELECT pg_advisory_xact_lock(hashtext(%s))', (f"form:{prefix}",))
+        seq = _max_form_seq(prefix) + 1
+    return f"{prefix}{seq:04d}"
+
+
+def _max_form_seq(prefix: str) -> int:
+    """Highest numeric suffix already used under a form-number prefix."""
+    res = Database.execute_query(
+        """SELECT MAX(CAST(SUBSTRING(form_no FROM %(start)s) AS BIGINT)) AS n
+           FROM (SELECT form_no FROM applications   WHERE form_no LIKE %(like)s
+                 UNION ALL
+                 SELECT form_no FROM pg_application WHERE form_no LIKE %(like)s) f
+           WHERE SUBSTRING(form_no FROM %(start)s) ~ '^[0-9]+$'""",
+        {'start': len(prefix) + 1, 'like': f"{prefix}%"}
+    )
+    if res is None:
+        raise RuntimeError(f"Could not read existing form numbers for {prefix}")
+    return int(res[0]['n'] or 0) if res else 0
+
+
 def classify_response(
     response_code: str,
     current_requery_count: int,
@@ -172,6 +228,117 @@ def classify_response(
     return 'pending'
 
 
+def requery_backoff_class(tran_status: str, response_code: str = '') -> str | None:
+    """Backoff class for a row that stays unresolved; None once it is final."""
+    if tran_status == 'requery_error':
+        return 'requery_error'
+    if tran_status != 'pending':
+        return None
+    return 'processing' if (response_code or '').strip() in PENDING_CODES else 'unknown'
+
+
+def next_requery_sql(backoff_class: str | None) -> tuple:
+    """
+    SQL expression (and params) for next_requery_at inside an UPDATE ... SET.
+    Reads the row's requery_count *before* the same statement increments it.
+    """
+    if backoff_class is None:
+        return 'NULL', ()
+    base, cap = REQUERY_BACKOFF[backoff_class]
+    return (
+        "NOW() + LEAST(%s * POWER(2, LEAST(COALESCE(requery_count, 0), 16)), %s)"
+        " * (0.9 + random() * 0.2) * INTERVAL '1 second'",
+        (base, cap),
+    )
+
+
+_requery_schedule_ready = False
+
+
+def ensure_requery_schedule() -> bool:
+    """
+    True once next_requery_at exists (checked once per process, read-only).
+    The column and its "due now" index come from
+    scripts/migration_add_next_requery_at.sql, never from app startup: DDL on
+    payment_transactions from every booting worker would lock the hottest
+    table each time.
+    """
+    global _requery_schedule_ready
+    if _requery_schedule_ready:
+        return True
+    rows = Database.execute_query(
+        '''SELECT 1 FROM information_schema.columns
+           WHERE table_schema = current_schema()
+             AND table_name = 'payment_transactions' AND column_name = 'next_requery_at\''''
+    )
+    _requery_schedule_ready = bool(rows)
+    if not _requery_schedule_ready:
+        print("[requery] payment_transactions.next_requery_at is missing: "
+              "run scripts/migration_add_next_requery_at.sql")
+    return _requery_schedule_ready
+
+
+def mark_requery_error(reference_no: str) -> None:
+    """
+    Record a failed requery call (network / gateway error) and schedule the
+    retry.  Only unresolved rows are touched: a row settled meanwhile keeps
+    its final status.
+    """
+    next_sql, next_params = next_requery_sql('requery_error')
+    Database.execute_update(
+        f'''UPDATE payment_transactions
+           SET tran_status     = 'requery_error',
+               next_requery_at = {next_sql},
+               requery_count   = COALESCE(requery_count, 0) + 1,
+               updated_at      = NOW()
+           WHERE reference_no = %s
+             AND tran_status IN ('pending', 'requery_error', 'cancelled')''',
+        (*next_params, reference_no),
+    )
+
+
+def expire_stale_pending(dry_run: bool = False, batch_size: int | None = None) -> int:
+    """
+    Mark every unresolved transaction older than STALE_THRESHOLD_MINUTES as
+    'failed', batch_size rows per UPDATE (each its own short transaction, rows
+    locked elsewhere are left for the next run).  Returns the number of rows
+    expired (or that would be, with dry_run).
+
+    Expiry is final: atomic_settle_payment does not claim 'failed' rows, so a
+    bank transfer confirmed after this point is not settled automatically.
+    """
+    from config import Config
+    where = """tran_status IN ('pending', 'requery_error')
+               AND created_at < NOW() - %s * INTERVAL '1 minute'"""
+    if dry_run:
+        res = Database.execute_query(
+            f'SELECT COUNT(*) AS n FROM payment_transactions WHERE {where}',
+            (STALE_THRESHOLD_MINUTES,)
+        )
+        return int(res[0]['n']) if res else 0
+    batch_size = batch_size or Config.REQUERY_EXPIRE_BATCH
+    expired = 0
+    while True:
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                f'''UPDATE payment_transactions
+                   SET tran_status          = 'failed',
+                       response_description = 'Transaction expired (stale pending)',
+                       next_requery_at      = NULL,
+                       updated_at           = NOW()
+                   WHERE id IN (SELECT id FROM payment_transactions
+                                WHERE {where}
+                                LIMIT %s
+                                FOR UPDATE SKIP LOCKED)
+                     AND {where}''',
+                (STALE_THRESHOLD_MINUTES, batch_size, STALE_THRESHOLD_MINUTES)
+            )
+            count = cursor.rowcount
+        expired += count
+        if count < batch_size:
+            return expired
+
+
 # ── Application row creation (post-payment) ──────────────────────────────────
 
 def _prog_code_from_id(pt_id) -> str:
@@ -256,16 +423,7 @@ def _create_application_row_on_success(user_id: int, reference_no: str):
             )
             return
 
-        # Generate a unique form_no
-        year = datetime.now().year
-        code = _prog_code_from_id(program_type_id)
-        while True:
-            suffix  = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(4))
-            form_no = f"PCU/{year}/{code}{suffix}"
-            if not Database.execute_query(
-                'SELECT uuid FROM pg_application WHERE form_no = %s', (form_no,)
-            ):
-                break
+        form_no = generate_form_no(program_type_id)
 
         Database.execute_update(
             '''INSERT INTO pg_application
@@ -305,16 +463,7 @@ def _create_application_row_on_success(user_id: int, reference_no: str):
         )
         return
 
-    # Generate a unique form_no
-    year = datetime.now().year
-    code = _prog_code_from_id(program_type_id)
-    while True:
-        suffix  = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(4))
-        form_no = f"PCU/{year}/{code}{suffix}"
-        if not Database.execute_query(
-            'SELECT id FROM applications WHERE form_no = %s', (form_no,)
-        ):
-            break
+    form_no = generate_form_no(program_type_id)
 
     Database.execute_update(
         '''INSERT INTO applications
@@ -554,6 +703,41 @@ def apply_downstream_success(user_id: int, payment_type: str, reference_no: str
 
 # ── Shared DB update helper ───────────────────────────────────────────────────
 
+def _response_fields(isw_resp: dict, amount_kobo: int) -> tuple:
+    """(amount_paid, amount_paid_kobo, is_mismatch, payment_method, card_number, bank_code, bank_name)."""
+    amount_paid_kobo = isw_resp.get('Amount', amount_kobo)
+    return (
+        float(amount_paid_kobo) / 100 if amount_paid_kobo else None,
+        amount_paid_kobo,
+        (amount_paid_kobo != amount_kobo) if amount_paid_kobo else False,
+        (isw_resp.get('PaymentMethodCode') or '').upper() or None,
+        isw_resp.get('CardNumber') or None,
+        isw_resp.get('BankCode')   or None,
+        isw_resp.get('BankName')   or None,
+    )
+
+
+# Interswitch response keys that _response_fields already stores in their own
+# columns (MerchantReference is our reference_no); compact_response drops them
+RESPONSE_COLUMN_KEYS = (
+    'ResponseCode', 'ResponseDescription', 'Amount', 'MerchantReference',
+    'PaymentMethodCode', 'CardNumber', 'BankCode', 'BankName',
+)
+
+
+def compact_response(isw_resp: dict) -> str | None:
+    """
+    raw_response_payload as stored: the Interswitch response minus the keys
+    kept in columns and minus empty values (None, '', [], {}).  None when
+    nothing is left, e.g. a bare pending answer.
+    """
+    rest = {
+        k: v for k, v in (isw_resp or {}).items()
+        if k not in RESPONSE_COLUMN_KEYS and v not in (None, '', [], {})
+    }
+    return json.dumps(rest, separators=(',', ':')) if rest else None
+
+
 def build_update_sql_params(
     tran_status: str,
     reference_no: str,
@@ -568,16 +752,12 @@ def build_update_sql_params(
     Used by verify_payment, payment_webhook, and the background worker so the
     SQL is never duplicated.
     """
-    is_successful    = (tran_status == 'successful')
-    amount_paid_kobo = isw_resp.get('Amount', amount_kobo)
-    amount_paid      = float(amount_paid_kobo) / 100 if amount_paid_kobo else None
-    is_mismatch      = (amount_paid_kobo != amount_kobo) if amount_paid_kobo else False
-    payment_method   = (isw_resp.get('PaymentMethodCode') or '').upper() or None
-    card_number      = isw_resp.get('CardNumber') or None
-    bank_code        = isw_resp.get('BankCode')   or None
-    bank_name        = isw_resp.get('BankName')   or None
-
-    sql = '''UPDATE payment_transactions
+    is_successful = (tran_status == 'successful')
+    (amount_paid, amount_paid_kobo, is_mismatch,
+     payment_method, card_number, bank_code, bank_name) = _response_fields(isw_resp, amount_kobo)
+    next_sql, next_params = next_requery_sql(requery_backoff_class(tran_status, response_code))
+
+    sql = f'''UPDATE payment_transactions
                SET tran_status          = %s,
                    tran_ref             = %s,
                    response_code        = %s,
@@ -590,6 +770,7 @@ def build_update_sql_params(
                    bank_code            = %s,
                    bank_name            = %s,
                    raw_response_payload = %s::jsonb,
+                   next_requery_at      = {next_sql},
                    requery_count        = COALESCE(requery_count, 0) + 1,
                    payment_at    = CASE WHEN %s THEN NOW() ELSE payment_at END,
                    confirmed_at  = CASE WHEN %s THEN NOW() ELSE confirmed_at END,
@@ -603,7 +784,8 @@ def build_update_sql_params(
         amount_paid, amount_paid_kobo,
         is_mismatch,
         payment_method, card_number, bank_code, bank_name,
-        json.dumps(isw_resp),
+        compact_response(isw_resp),
+        *next_params,
         is_successful, is_successful,
         is_successful, receipt_no,
         reference_no,
@@ -611,23 +793,153 @@ def build_update_sql_params(
     return sql, params
 
 
+class RequeryWriteBatch:
+    """
+    Collects the background worker's unresolved requery outcomes (pending,
+    failed, cancelled) and requery errors, and writes each kind with one
+    multi-row UPDATE instead of one statement per row.  Flushes itself every
+    `size` rows; call flush() at the end of the run.
+
+    Successful outcomes never go through here: they are settled one by one
+    by atomic_settle_payment.  Rows that another handler resolved in the
+    meantime (no longer pending / requery_error) are left alone.
+    """
+
+    _RESULTS_SQL = '''UPDATE payment_transactions t
+           SET tran_status          = v.tran_status,
+               tran_ref             = v.reference_no,
+               response_code        = v.response_code,
+               response_description = v.response_description,
+               amount_paid          = v.amount_paid,
+               amount_paid_in_kobo  = v.amount_paid_in_kobo,
+               is_amount_mismatch   = v.is_amount_mismatch,
+               payment_method       = v.payment_method,
+               card_number          = v.card_number,
+               bank_code            = v.bank_code,
+               bank_name            = v.bank_name,
+               raw_response_payload = v.raw_response_payload,
+               next_requery_at      = NOW() + LEAST(v.backoff_base * POWER(2, LEAST(COALESCE(t.requery_count, 0), 16)),
+                                                    v.backoff_cap)
+                                            * (0.9 + random() * 0.2) * INTERVAL '1 second',
+               requery_count        = COALESCE(t.requery_count, 0) + 1,
+               updated_at           = NOW()
+           FROM (VALUES %s) AS v (reference_no, tran_status, response_code, response_description,
+                                  amount_paid, amount_paid_in_kobo, is_amount_mismatch,
+                                  payment_method, card_number, bank_code, bank_name,
+                                  raw_response_payload, backoff_base, backoff_cap)
+           WHERE t.reference_no = v.reference_no
+             AND t.tran_status IN ('pending', 'requery_error')'''
+
+    _RESULTS_TEMPLATE = ('(%s, %s, %s, %s, %s::numeric, %s::bigint, %s::boolean, '
+                         '%s, %s, %s, %s, %s::jsonb, %s::float8, %s::float8)')
+
+    def __init__(self, size: int = 200):
+        self.size     = max(1, size)
+        self._results = []
+        self._errors  = []
+        self.written  = 0
+
+    def add_result(self, tran_status: str, reference_no: str, response_code: str,
+                   response_desc: str, isw_resp: dict, amount_kobo: int):
+        """Queue the same write build_update_sql_params would make (not for 'successful')."""
+        backoff = requery_backoff_class(tran_status, response_code)
+        base, cap = REQUERY_BACKOFF[backoff] if backoff else (None, None)   # NULL → next_requery_at NULL
+        self._results.append((
+            reference_no, tran_status, response_code, response_desc,
+            *_response_fields(isw_resp, amount_kobo),
+            compact_response(isw_resp), base, cap,
+        ))
+        if len(self._results) >= self.size:
+            self._flush_results()
+
+    def add_error(self, reference_no: str):
+        """Queue what mark_requery_error would write."""
+        self._errors.append(reference_no)
+        if len(self._errors) >= self.size:
+            self._flush_errors()
+
+    def flush(self) -> int:
+        """Write everything queued. Returns the number of rows updated so far."""
+        self._flush_results()
+        self._flush_errors()
+        return self.written
+
+    def clear(self):
+        """Drop everything queued without writing it."""
+        self._results, self._errors = [], []
+
+    def __len__(self):
+        return len(self._results) + len(self._errors)
+
+    def _flush_results(self):
+        if not self._results:
+            return
+        rows, self._results = self._results, []
+        try:
+            with Database.get_cursor() as cursor:
+                execute_values(cursor, self._RESULTS_SQL, rows, template=self._RESULTS_TEMPLATE, page_size=len(rows))
+                self.written += cursor.rowcount
+        except Exception as exc:
+            # Rows keep their old next_requery_at and are simply requeried again
+            print(f"[requery_write_batch] Could not write {len(rows)} requery result(s): {exc}")
+
+    def _flush_errors(self):
+        if not self._errors:
+            return
+        refs, self._errors = self._errors, []
+        next_sql, next_params = next_requery_sql('requery_error')
+        try:
+            with Database.get_cursor() as cursor:
+                cursor.execute(
+                    f'''UPDATE payment_transactions
+                       SET tran_status     = 'requery_error',
+                           next_requery_at = {next_sql},
+                           requery_count   = COALESCE(requery_count, 0) + 1,
+                           updated_at      = NOW()
+                       WHERE reference_no = ANY(%s)
+                         AND tran_status IN ('pending', 'requery_error')''',
+                    (*next_params, refs),
+                )
+                self.written += cursor.rowcount
+        except Exception as exc:
+            print(f"[requery_write_batch] Could not mark {len(refs)} requery error(s): {exc}")
+
+
 # ── Atomic settlement with race condition prevention ────────────────────────
 
-def atomic_settle_payment(reference_no: str, user_id: int, payment_type: str) -> bool:
+SETTLEMENTS = metrics.counter(
+    'payment_settlements', 'atomic_settle_payment calls by outcome (won, lost, failed).', ('outcome',),
+)
+
+
+class SettlementFailed(Exception):
+    """Downstream work failed; the claim was rolled back and the row left for a retry."""
+
+
+def atomic_settle_payment(reference_no: str, user_id: int, payment_type: str,
+                          final_update: tuple | None = None) -> bool:
     """
     Atomically settle a payment transaction. Only one process (callback, worker, or verify)
     can win the race to settle a given transaction.
-    
+
     This prevents duplicate downstream operations (e.g., creating two student records).
-    
+
+    The claim (UPDATE … RETURNING), the downstream effects and final_update —
+    the (sql, params) pair from build_update_sql_params — run in one
+    transaction on one connection.  A concurrent claim blocks on the row lock
+    until the winner commits and then finds the row already settled.
+
     Returns:
         True if this process won the settlement race and applied downstream logic
         False if another process already won (abort silently)
+    Raises:
+        SettlementFailed if downstream work failed; nothing was applied and the
+        row is marked requery_error so the worker settles it later.
     """
     # ✅ ATOMIC: Only update if status is still 'pending' OR 'requery_error'
     # (transfer payments may be in 'requery_error' when the background worker
     # finally gets the '00' confirmation from the bank hours later)
-    update_sql = '''UPDATE payment_transactions
+    claim_sql = '''UPDATE payment_transactions
                    SET tran_status = 'processing'
                    WHERE reference_no = %s AND user_id = %s
                      AND (
@@ -636,29 +948,38 @@ def atomic_settle_payment(reference_no: str, user_id: int, payment_type: str) ->
                              tran_status = 'cancelled'
                              AND COALESCE(response_description, '') <> 'Cancelled by user'
                          )
-                     ) '''
-    
-    Database.execute_update(update_sql, (reference_no, user_id))
-    
-    # Check if we actually updated the row (only 1 process can win)
-    check_res = Database.execute_query(
-        'SELECT tran_status FROM payment_transactions WHERE reference_no = %s AND user_id = %s',
-        (reference_no, user_id)
-    )
-    
-    if not check_res or check_res[0]['tran_status'] != 'processing':
-        # Another process already grabbed it or it's already settled
-        print(f"[atomic_settle] {reference_no} already being processed by another handler")
-        return False
-    
-    # ✅ We own this transaction — apply downstream
-    print(f"[atomic_settle] {reference_no} acquired lock, applying downstream success")
-    apply_downstream_success(user_id, payment_type, reference_no=reference_no)
-    
-    # ✅ If this is a tuition payment, update the fully_paid_for_session flag
-    if payment_type == 'tuition':
-        update_session_payment_status(reference_no, user_id)
-    
+                     )
+                   RETURNING id'''
+
+    try:
+        with Database.transaction():
+            if not Database.execute_query(claim_sql, (reference_no, user_id)):
+                # Another process already grabbed it or it's already settled
+                print(f"[atomic_settle] {reference_no} already being processed by another handler")
+                SETTLEMENTS.inc(outcome='lost')
+                return False
+
+            # ✅ We own this transaction — apply downstream
+            print(f"[atomic_settle] {reference_no} acquired lock, applying downstream success")
+            apply_downstream_success(user_id, payment_type, reference_no=reference_no)
+
+            # Write the final row (successful, amount_paid) before the ledger
+            # refresh below sums this session's successful payments
+            if final_update is not None:
+                Database.execute_update(*final_update)
+
+            # ✅ If this is a tuition payment, update the fully_paid_for_session flag
+            if payment_type == 'tuition':
+                update_session_payment_status(reference_no, user_id)
+
+            payment_rollup.mark_dirty([reference_no])
+    except Exception as exc:
+        print(f"[atomic_settle] {reference_no} settlement rolled back: {exc}")
+        SETTLEMENTS.inc(outcome='failed')
+        mark_requery_error(reference_no)
+        raise SettlementFailed(str(exc)) from exc
+
+    SETTLEMENTS.inc(outcome='won')
     return True
 
 
@@ -666,16 +987,10 @@ def atomic_settle_payment(reference_no: str, user_id: int, payment_type: str) ->
 
 def update_session_payment_status(reference_no: str, user_id: int) -> None:
     """
-    After a tuition payment is marked successful, check if the student has now
-    fully paid all fees for that academic session.
-    
-    Logic:
-      1. Get the academic_session_id from this transaction
-      2. Get the student's program_type, level, and faculty_id (same as frontend uses)
-      3. Query: SUM(amount_paid) for all successful tuition payments for this user+session
-      4. Query: expected fees for this student+session using SAME FILTERS as frontend
-      5. If SUM >= expected_fees: Set fully_paid_for_session = TRUE for ALL txns in this session
-      6. Else: Set to FALSE
+    After a tuition payment is marked successful, refresh the student's
+    student_session_ledger row for that academic session (see
+    utils/session_ledger.py) and copy its fully_paid flag onto ALL tuition
+    transactions of the session, so installments stay consistent.
     """
     # Get the academic_session_id from this transaction
     txn = Database.execute_query(
@@ -689,191 +1004,23 @@ def update_session_payment_status(reference_no: str, user_id: int) -> None:
         return
     
     session_id = txn[0]['academic_session_id']
-    
-    # Get current student level AND program context (program_type, faculty_id)
-    # Uses SAME query as frontend's _get_applicant_fee_context()
-    is_pg = bool(Database.execute_query('SELECT uuid FROM pg_application WHERE user_id = %s LIMIT 1', (user_id,)))
 
-    student_res = None
-    if is_pg:
-        student_res = Database.execute_query(
-            '''SELECT s.current_level_id,
-                      2 AS prog_type,
-                      pg.proposed_faculty_id AS faculty_id
-               FROM students s
-               JOIN users u ON u.id = s."UserId"
-               LEFT JOIN pg_application pg ON pg.user_id = u.id AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-               WHERE s."UserId" = %s
-               ORDER BY s."CreatedDate" DESC LIMIT 1''',
-            (user_id,)
-        )
-    else:
-        student_res = Database.execute_query(
-            '''SELECT s.current_level_id,
-                      app.prog_type,
-                      ps.faculty_id
-               FROM students s
-               JOIN users u ON u.id = s."UserId"
-               LEFT JOIN applications app ON app.user_id = u.id 
-                  AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-                  AND app.created_at = (
-                    SELECT MAX(created_at) FROM applications WHERE user_id = u.id
-                  )
-               LEFT JOIN program_setup ps ON LOWER(ps.name) = LOWER(COALESCE(app.finalised_course, app.approved_course))
-               WHERE s."UserId" = %s
-               ORDER BY s."CreatedDate" DESC LIMIT 1''',
-            (user_id,)
-        )
-    
-    current_level_id = None
-    program_type = None
-    faculty_id = None
-    
-    if student_res and student_res[0].get('current_level_id'):
-        current_level_id = student_res[0]['current_level_id']
-        program_type = student_res[0].get('prog_type')
-        faculty_id = student_res[0].get('faculty_id')
-    else:
-        # Fallback for new students who don't have a record in `students` yet
-        try:
-            if is_pg:
-                pg_res = Database.execute_query(
-                    '''SELECT pg.uuid, 2 AS prog_type, pg.proposed_course, pg.proposed_faculty_id, pt.level_id,
-                              pg.finalised_course, pg.approved_course
-                       FROM pg_application pg
-                       LEFT JOIN program_types pt ON pt.id = 2
-                       WHERE pg.user_id = %s AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-                       ORDER BY pg.updated_date DESC LIMIT 1''',
-                    (user_id,)
-                )
-                if pg_res:
-                    app_row = pg_res[0]
-                    program_type = 2
-                    current_level_id = app_row['level_id'] or 5
-                    faculty_id = app_row['proposed_faculty_id']
-            else:
-                app_res = Database.execute_query(
-                    '''SELECT app.prog_type,
-                              pt.level_id,
-                              app.finalised_course,
-                              app.approved_course,
-                              app.program_setup_id
-                       FROM applications app
-                       JOIN program_types pt ON app.prog_type = pt.id
-                       WHERE app.user_id = %s AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-                       ORDER BY app.created_at DESC LIMIT 1''',
-                    (user_id,)
-                )
-                if app_res:
-                    app_row = app_res[0]
-                    program_type = app_row['prog_type']
-                    current_level_id = app_row['level_id']
-                    
-                    finalised_course = (app_row.get('finalised_course') or '').strip()
-                    if not finalised_course:
-                        finalised_course = (app_row.get('approved_course') or '').strip()
-                    if not finalised_course and app_row.get('program_setup_id'):
-                        ps_res = Database.execute_query(
-                            'SELECT name FROM program_setup WHERE id = %s',
-                            (app_row['program_setup_id'],)
-                        )
-                        if ps_res:
-                            finalised_course = ps_res[0]['name']
-                    
-                    if finalised_course:
-                        faculty_res = Database.execute_query(
-                            '''SELECT faculty_id
-                               FROM program_setup
-                               WHERE LOWER(name) = LOWER(%s)
-                               LIMIT 1''',
-                            (finalised_course,)
-                        )
-                        if faculty_res:
-                            faculty_id = faculty_res[0].get('faculty_id')
-        except Exception as e:
-            print(f"[update_session_payment_status] Fallback lookup failed: {e}")
+    ledger = session_ledger.refresh(user_id, session_id, log_tag='update_session_payment_status')
+    if ledger is None:
+        return
 
-    if not current_level_id:
+    if not ledger['level_id']:
         print(f"[update_session_payment_status] {reference_no}: No current_level_id found")
         return
     
-    if not program_type or not faculty_id:
-        print(f"[update_session_payment_status] {reference_no}: Missing program_type ({program_type}) or faculty_id ({faculty_id})")
+    if not ledger['program_type'] or not ledger['faculty_id']:
+        print(f"[update_session_payment_status] {reference_no}: Missing program_type ({ledger['program_type']}) or faculty_id ({ledger['faculty_id']})")
         return
-    
-    # Get total amount paid for this session
-    paid_res = Database.execute_query(
-        '''SELECT COALESCE(SUM(amount_paid), 0) as total_paid,
-                  COUNT(*) as payment_count,
-                  STRING_AGG(DISTINCT tran_status, ', ') as statuses,
-                  STRING_AGG(DISTINCT tran_type, ', ') as types,
-                  STRING_AGG(CAST(amount_paid AS VARCHAR), ', ') as individual_amounts
-           FROM payment_transactions
-           WHERE user_id = %s 
-             AND academic_session_id = %s 
-             AND tran_type = 'tuition'
-             AND tran_status = 'successful' ''',
-        (user_id, session_id)
-    )
-    
-    total_paid = float(paid_res[0]['total_paid'] or 0) if paid_res else 0
-    payment_count = paid_res[0]['payment_count'] if paid_res else 0
-    
-    # Debug: Log all tuition transactions for this user+session
-    if paid_res and payment_count > 0:
-        print(f"[update_session_payment_status] {reference_no}: Found {payment_count} successful tuition payments: {paid_res[0]['individual_amounts']}")
-    else:
-        print(f"[update_session_payment_status] {reference_no}: WARNING - No successful tuition payments found for user {user_id}, session {session_id}")
-        all_txns = Database.execute_query(
-            '''SELECT reference_no, tran_type, tran_status, amount_paid, amount_paid_in_kobo
-               FROM payment_transactions
-               WHERE user_id = %s AND academic_session_id = %s
-               LIMIT 10''',
-            (user_id, session_id)
-        )
-        print(f"[update_session_payment_status] {reference_no}: All transactions for this user+session: {all_txns}")
-    
-    # Get expected fees for this student+session+level
-    # Uses SAME filters as frontend's getTuitionBreakdown:
-    # program_type, level, faculty_id
-    expected_res = Database.execute_query(
-        '''SELECT COALESCE(SUM(pf.amount), 0) as expected_fees
-           FROM program_fees pf
-           JOIN fee_components fc ON fc.id = pf.fee_component_id
-           WHERE pf.program_type = %s
-             AND pf.level = %s
-             AND pf.faculty_id = %s
-             AND pf.academic_session_id = %s
-             AND LOWER(fc.name) NOT LIKE '%%acceptance%%' ''',
-        (str(program_type), str(current_level_id), str(faculty_id), session_id)
-    )
-    
-    expected_fees = float(expected_res[0]['expected_fees'] or 0) if expected_res else 0
-    
-    # Debug: Log which fees were matched (same breakdown as frontend shows)
-    fee_check = Database.execute_query(
-        '''SELECT fc.name, SUM(pf.amount) as total
-           FROM program_fees pf
-           JOIN fee_components fc ON fc.id = pf.fee_component_id
-           WHERE pf.program_type = %s
-             AND pf.level = %s
-             AND pf.faculty_id = %s
-             AND pf.academic_session_id = %s
-             AND LOWER(fc.name) NOT LIKE '%%acceptance%%'
-           GROUP BY fc.name
-           ORDER BY fc.name ASC''',
-        (str(program_type), str(current_level_id), str(faculty_id), session_id)
-    )
-    print(f"[update_session_payment_status] {reference_no}: Fee breakdown (program_type={program_type}, level={current_level_id}, faculty_id={faculty_id}): {fee_check}")
+
     print(f"[update_session_payment_status] {reference_no}: "
-          f"Session {session_id}, Level {current_level_id}, "
-          f"Paid: ₦{total_paid}, Expected: ₦{expected_fees}")
-    
-    # Determine if fully paid
-    is_fully_paid = (total_paid >= expected_fees) if expected_fees > 0 else False
+          f"Session {session_id}, Level {ledger['level_id']}, "
+          f"Paid: ₦{ledger['paid']} in {ledger['payments_count']} payment(s), Expected: ₦{ledger['expected']}")
     
-    # Update ALL tuition transactions for this session to have the same fully_paid_for_session flag
-    # (This ensures consistency across installments)
     Database.execute_update(
         '''UPDATE payment_transactions
            SET fully_paid_for_session = %s,
@@ -881,17 +1028,21 @@ def update_session_payment_status(reference_no: str, user_id: int) -> None:
            WHERE user_id = %s 
              AND academic_session_id = %s 
              AND tran_type = 'tuition' ''',
-        (is_fully_paid, user_id, session_id)
+        (ledger['fully_paid'], user_id, session_id)
     )
     
     print(f"[update_session_payment_status] {reference_no}: "
-          f"Set fully_paid_for_session = {is_fully_paid}")
+          f"Set fully_paid_for_session = {ledger['fully_paid']}")
 
 
 def get_session_payment_summary(user_id: int, session_id: int) -> dict:
     """
     Get payment summary for a student for a specific academic session.
-    Uses SAME fee lookup as getTuitionBreakdown (program_type, level, faculty_id).
+    Reads the student_session_ledger row (session_ledger.get, read-only);
+    expected fees are priced from the fee matrix with the row's
+    (program_type, level, faculty_id), resolved live when the row has none,
+    the SAME fee lookup as getTuitionBreakdown, so fee changes show up
+    immediately.
     
     Returns:
       {
@@ -899,147 +1050,28 @@ def get_session_payment_summary(user_id: int, session_id: int) -> dict:
         'total_paid': float,
         'is_fully_paid': bool,
         'remaining': float,
-        'payment_percentage': int (0-100)
+        'payment_percentage': int (0-100),
+        'installments_paid': [installment_plans.id, ...]
       }
     """
-    # Get student's current level, program_type, and faculty_id
-    is_pg = bool(Database.execute_query('SELECT uuid FROM pg_application WHERE user_id = %s LIMIT 1', (user_id,)))
+    ledger = session_ledger.get(user_id, session_id)
+    fee_key = (ledger['program_type'], ledger['level_id'], ledger['faculty_id']) if ledger else (None, None, None)
+    if ledger and not all(fee_key):
+        # No ledger row yet, or written before the student's program was known
+        fee_key = session_ledger.fee_context(user_id, 'get_session_payment_summary')
 
-    student_res = None
-    if is_pg:
-        student_res = Database.execute_query(
-            '''SELECT s.current_level_id,
-                      2 AS prog_type,
-                      pg.proposed_faculty_id AS faculty_id
-               FROM students s
-               JOIN users u ON u.id = s."UserId"
-               LEFT JOIN pg_application pg ON pg.user_id = u.id AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-               WHERE s."UserId" = %s
-               ORDER BY s."CreatedDate" DESC LIMIT 1''',
-            (user_id,)
-        )
-    else:
-        student_res = Database.execute_query(
-            '''SELECT s.current_level_id,
-                      app.prog_type,
-                      ps.faculty_id
-               FROM students s
-               JOIN users u ON u.id = s."UserId"
-               LEFT JOIN applications app ON app.user_id = u.id 
-                  AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-                  AND app.created_at = (
-                    SELECT MAX(created_at) FROM applications WHERE user_id = u.id
-                  )
-               LEFT JOIN program_setup ps ON LOWER(ps.name) = LOWER(COALESCE(app.finalised_course, app.approved_course))
-               WHERE s."UserId" = %s
-               ORDER BY s."CreatedDate" DESC LIMIT 1''',
-            (user_id,)
-        )
-    
-    current_level_id = None
-    program_type = None
-    faculty_id = None
-    
-    if student_res and student_res[0].get('current_level_id'):
-        current_level_id = student_res[0]['current_level_id']
-        program_type = student_res[0].get('prog_type')
-        faculty_id = student_res[0].get('faculty_id')
-    else:
-        # Fallback for new students who don't have a record in `students` yet
-        try:
-            if is_pg:
-                pg_res = Database.execute_query(
-                    '''SELECT pg.uuid, 2 AS prog_type, pg.proposed_course, pg.proposed_faculty_id, pt.level_id,
-                              pg.finalised_course, pg.approved_course
-                       FROM pg_application pg
-                       LEFT JOIN program_types pt ON pt.id = 2
-                       WHERE pg.user_id = %s AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-                       ORDER BY pg.updated_date DESC LIMIT 1''',
-                    (user_id,)
-                )
-                if pg_res:
-                    app_row = pg_res[0]
-                    program_type = 2
-                    current_level_id = app_row['level_id'] or 5
-                    faculty_id = app_row['proposed_faculty_id']
-            else:
-                app_res = Database.execute_query(
-                    '''SELECT app.prog_type,
-                              pt.level_id,
-                              app.finalised_course,
-                              app.approved_course,
-                              app.program_setup_id
-                       FROM applications app
-                       JOIN program_types pt ON app.prog_type = pt.id
-                       WHERE app.user_id = %s AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
-                       ORDER BY app.created_at DESC LIMIT 1''',
-                    (user_id,)
-                )
-                if app_res:
-                    app_row = app_res[0]
-                    program_type = app_row['prog_type']
-                    current_level_id = app_row['level_id']
-                    
-                    finalised_course = (app_row.get('finalised_course') or '').strip()
-                    if not finalised_course:
-                        finalised_course = (app_row.get('approved_course') or '').strip()
-                    if not finalised_course and app_row.get('program_setup_id'):
-                        ps_res = Database.execute_query(
-                            'SELECT name FROM program_setup WHERE id = %s',
-                            (app_row['program_setup_id'],)
-                        )
-                        if ps_res:
-                            finalised_course = ps_res[0]['name']
-                    
-                    if finalised_course:
-                        faculty_res = Database.execute_query(
-                            '''SELECT faculty_id
-                               FROM program_setup
-                               WHERE LOWER(name) = LOWER(%s)
-                               LIMIT 1''',
-                            (finalised_course,)
-                        )
-                        if faculty_res:
-                            faculty_id = faculty_res[0].get('faculty_id')
-        except Exception as e:
-            print(f"[get_session_payment_summary] Fallback lookup failed: {e}")
-
-    if not current_level_id or not program_type or not faculty_id:
+    if not ledger or not all(fee_key):
         return {
             'total_expected': 0,
             'total_paid': 0,
             'is_fully_paid': False,
             'remaining': 0,
             'payment_percentage': 0,
+            'installments_paid': [],
         }
-    
-    # Get total paid
-    paid_res = Database.execute_query(
-        '''SELECT COALESCE(SUM(amount_paid), 0) as total_paid
-           FROM payment_transactions
-           WHERE user_id = %s 
-             AND academic_session_id = %s 
-             AND tran_type = 'tuition'
-             AND tran_status = 'successful' ''',
-        (user_id, session_id)
-    )
-    
-    total_paid = float(paid_res[0]['total_paid'] or 0) if paid_res else 0
-    
-    # Get expected fees using SAME filters as frontend
-    expected_res = Database.execute_query(
-        '''SELECT COALESCE(SUM(pf.amount), 0) as expected_fees
-           FROM program_fees pf
-           JOIN fee_components fc ON fc.id = pf.fee_component_id
-           WHERE pf.program_type = %s
-             AND pf.level = %s
-             AND pf.faculty_id = %s
-             AND pf.academic_session_id = %s
-             AND LOWER(fc.name) NOT LIKE '%%acceptance%%' ''',
-        (str(program_type), str(current_level_id), str(faculty_id), session_id)
-    )
-    
-    expected_fees = float(expected_res[0]['expected_fees'] or 0) if expected_res else 0
+
+    total_paid    = float(ledger['paid'] or 0)
+    expected_fees = get_fee_matrix().tuition_total(*fee_key, session_id)
     
     is_fully_paid = (total_paid >= expected_fees) if expected_fees > 0 else False
     remaining = max(0, expected_fees - total_paid)
@@ -1055,4 +1087,5 @@ def get_session_payment_summary(user_id: int, session_id: int) -> dict:
         'is_fully_paid': is_fully_paid,
         'remaining': remaining,
         'payment_percentage': payment_percentage,
+        'installments_paid': list(ledger['installments_paid'] or []),
     }
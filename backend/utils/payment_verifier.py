@@ -0,0 +1,242 @@
+"""
+utils/payment_verifier.py — Background verification hand-off for the
+Interswitch payment callback.
+
+In PAYMENT_CALLBACK_MODE=deferred the callback only records the txnref,
+submits verify_reference() to a small per-process executor and redirects
+the browser to /applicant/payment/verifying.  That page long-polls
+GET /applicant/payment/status/<ref>, answered by wait_for_status(), which
+only reads payment_transactions and never requeries Interswitch itself.
+
+Requeries are de-duplicated twice: within a process by reference (one
+in-flight future each) and across workers by claiming last_queried_at with
+a conditional UPDATE, so however many tabs poll, a reference is requeried
+at most once per VERIFY_MIN_INTERVAL_SECONDS.
+"""
+
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from database import Database
+from utils import metrics
+
+logger = logging.getLogger('payment_verifier')
+
+FINAL_STATUSES             = ('successful', 'failed', 'cancelled')
+VERIFY_MIN_INTERVAL_SECONDS = 15
+STATUS_RECHECK_SECONDS     = 2.0   # DB re-read interval while long-polling
+
+VERIFICATIONS = metrics.counter(
+    'payment_verifications', 'Deferred callback verifications by outcome.', ('outcome',),
+)
+STATUS_WAIT_SECONDS = metrics.histogram(
+    'payment_status_wait_seconds', 'Time a status long-poll was held open.', ('result',),
+    buckets=(0.05, 0.25, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0),
+)
+
+_executor     = None
+_executor_pid = None
+_lock         = threading.Lock()
+_inflight     = {}                  # reference_no → Future
+_changed      = threading.Condition()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.PAYMENT_VERIFY_WORKERS, thread_name_prefix='payment-verify',
+                )
+                _executor_pid = os.getpid()
+                _inflight.clear()
+    return _executor
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Verification
+# ─────────────────────────────────────────────────────────────────────────────
+
+def verify_reference(reference_no: str):
+    """Requery one reference and settle it. Returns the resulting tran_status."""
+    from utils.interswitch import InterswitchClient
+    from utils.payment_status import (
+        classify_response,
+        atomic_settle_payment,
+        build_update_sql_params,
+        generate_receipt_no,
+        mark_requery_error,
+        SettlementFailed,
+    )
+    if not reference_no:
+        return None
+
+    txn_res = Database.execute_query(
+        '''SELECT id, amount_in_kobo, amount, tran_status, receipt_no,
+                  response_description, academic_session_id,
+                  tran_type, COALESCE(requery_count, 0) AS requery_count, user_id
+           FROM payment_transactions
+           WHERE reference_no = %s
+           ORDER BY created_at DESC LIMIT 1''',
+        (reference_no,)
+    )
+    if not txn_res:
+        print(f"[callback verify] Transaction {reference_no} not found in database.")
+        return None
+
+    txn = txn_res[0]
+    user_id = txn['user_id']
+    payment_type = txn['tran_type']
+    session_id = txn.get('academic_session_id')
+    requery_count = int(txn['requery_count'])
+
+    user_cancelled = (
+        txn['tran_status'] == 'cancelled'
+        and (txn.get('response_description') or '') == 'Cancelled by user'
+    )
+    if txn['tran_status'] in ('successful', 'failed') or user_cancelled:
+        return txn['tran_status']
+
+    amount_kobo = txn['amount_in_kobo'] or (round(float(txn['amount'] or 0) * 100))
+
+    try:
+        isw_resp = InterswitchClient.requery_transaction(reference_no, amount_kobo)
+    except Exception as e:
+        print(f"[callback verify] Interswitch requery error for {reference_no}: {e}")
+        mark_requery_error(reference_no)
+        return 'pending'
+
+    response_code = str(isw_resp.get('ResponseCode', '')).strip()
+    response_desc = isw_resp.get('ResponseDescription', '')
+
+    tran_status = classify_response(response_code, requery_count, response_desc)
+    is_successful = (tran_status == 'successful')
+
+    # Another handler (webhook, requery worker) may have finalised it meanwhile
+    latest_after = Database.execute_query(
+        '''SELECT tran_status, response_description FROM payment_transactions
+           WHERE reference_no = %s
+           ORDER BY created_at DESC LIMIT 1''',
+        (reference_no,)
+    )
+    if latest_after:
+        latest_status = latest_after[0].get('tran_status')
+        latest_user_cancelled = (
+            latest_status == 'cancelled'
+            and (latest_after[0].get('response_description') or '') == 'Cancelled by user'
+        )
+        if latest_status not in ('pending', 'requery_error', 'cancelled') or latest_user_cancelled:
+            return latest_status
+
+    receipt_no_val = txn.get('receipt_no') or (generate_receipt_no(payment_type=payment_type, session_id=session_id) if is_successful else '') or ''
+
+    sql, params = build_update_sql_params(
+        tran_status, reference_no, response_code, response_desc,
+        isw_resp, amount_kobo, receipt_no_val,
+    )
+    try:
+        settled = is_successful and atomic_settle_payment(reference_no, user_id, payment_type, final_update=(sql, params))
+    except SettlementFailed:
+        return 'requery_error'
+    if not settled:
+        Database.execute_update(sql, params)
+
+    print(f"[callback verify] Transaction {reference_no} verified and updated to: {tran_status}")
+    return tran_status
+
+
+def _claim_requery_slot(reference_no: str) -> bool:
+    """Cross-worker throttle: True if this caller may requery the reference now."""
+    rows = Database.execute_query(
+        f'''UPDATE payment_transactions
+            SET last_queried_at = NOW()
+            WHERE reference_no = %s
+              AND tran_status IN ('pending', 'requery_error', 'cancelled')
+              AND (last_queried_at IS NULL
+                   OR last_queried_at < NOW() - INTERVAL '{VERIFY_MIN_INTERVAL_SECONDS} seconds')
+            RETURNING id''',
+        (reference_no,)
+    )
+    return bool(rows)
+
+
+def _run(reference_no: str):
+    try:
+        status = verify_reference(reference_no)
+        VERIFICATIONS.inc(outcome=status or 'not_found')
+        return status
+    except Exception as exc:
+        VERIFICATIONS.inc(outcome='error')
+        logger.exception(f'[callback verify] Verification failed for {reference_no}: {exc}')
+        return None
+    finally:
+        with _lock:
+            _inflight.pop(reference_no, None)
+        with _changed:
+            _changed.notify_all()
+
+
+def submit_verification(reference_no: str) -> bool:
+    """Queue a background requery unless one is running or ran very recently."""
+    executor = _get_executor()
+    with _lock:
+        if reference_no in _inflight:
+            return False
+    if not _claim_requery_slot(reference_no):
+        return False
+    with _lock:
+        if reference_no in _inflight:
+            return False
+        _inflight[reference_no] = executor.submit(_run, reference_no)
+    return True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Long-poll status
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _read_status(reference_no: str, user_id):
+    rows = Database.execute_query(
+        '''SELECT tran_status, receipt_no, response_description, tran_type
+           FROM payment_transactions
+           WHERE reference_no = %s AND user_id = %s
+           ORDER BY created_at DESC LIMIT 1''',
+        (reference_no, user_id)
+    )
+    return rows[0] if rows else None
+
+
+def wait_for_status(reference_no: str, user_id, wait_seconds: float):
+    """
+    Return the transaction's status as soon as it is final, or after
+    wait_seconds.  Woken immediately when a verification finishes in this
+    process; re-reads the row every STATUS_RECHECK_SECONDS to catch updates
+    made by other workers (webhook inbox, requery worker).
+    """
+    started  = time.monotonic()
+    deadline = started + max(0.0, wait_seconds)
+    txn      = _read_status(reference_no, user_id)
+    while txn and txn['tran_status'] not in FINAL_STATUSES and time.monotonic() < deadline:
+        with _changed:
+            _changed.wait(min(STATUS_RECHECK_SECONDS, deadline - time.monotonic()))
+        txn = _read_status(reference_no, user_id)
+
+    result = 'not_found' if not txn else ('final' if txn['tran_status'] in FINAL_STATUSES else 'timeout')
+    STATUS_WAIT_SECONDS.observe(time.monotonic() - started, result=result)
+    if not txn:
+        return None
+    return {
+        'reference_no':  reference_no,
+        'tran_status':   txn['tran_status'],
+        'is_final':      txn['tran_status'] in FINAL_STATUSES,
+        'is_successful': txn['tran_status'] == 'successful',
+        'receipt_no':    txn['receipt_no'],
+        'payment_type':  txn['tran_type'],
+        'verifying':     reference_no in _inflight,
+        'message':       txn['response_description'],
+    }
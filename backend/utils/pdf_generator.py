@@ -3,6 +3,7 @@ import re
 import io
 import base64
 from datetime import datetime
+from functools import lru_cache
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -478,10 +479,12 @@ class NewTemplateParser:
 # Public API
 # ---------------------------------------------------------------------------
 
+@lru_cache(maxsize=8)
 def _load_image_b64(filename: str) -> str:
     """
     Load an image file from the same directory as this module (utils/) and
     return it as a base64-encoded string, or an empty string if not found.
+    Cached per process — the bundled images only change on deploy.
     """
     path = os.path.join(os.path.dirname(__file__), filename)
     if os.path.exists(path):
@@ -493,17 +496,41 @@ def _load_image_b64(filename: str) -> str:
 class PDFGenerator:
     """Generate PDFs from the JUPEB admission letter template using ReportLab."""
 
+    _template_cache: str | None = None
+
     @staticmethod
     def _load_template() -> str:
+        if PDFGenerator._template_cache is not None:
+            return PDFGenerator._template_cache
         template_path = os.path.join(
             os.path.dirname(__file__),
             "admission_letter_template.html",
         )
         if os.path.exists(template_path):
             with open(template_path, "r", encoding="utf-8") as f:
-                return f.read()
+                PDFGenerator._template_cache = f.read()
+            return PDFGenerator._template_cache
         return "<body><p>No template found</p></body>"
 
+    @staticmethod
+    def warm() -> int:
+        """
+        Load the template, logo and signature into the process caches and
+        render one throwaway letter so BeautifulSoup, the ReportLab style
+        sheet and the Helvetica font metrics are initialised before the first
+        real request.  Returns the size of the rendered PDF in bytes.
+        """
+        PDFGenerator._load_template()
+        _load_image_b64("logo.png")
+        _load_image_b64("signature.png")
+        pdf_bytes = PDFGenerator.generate_admission_letter_pdf(
+            ref_number="WARMUP",
+            date=datetime.now().strftime("%d %B %Y"),
+            candidate_name="Warmup",
+            programme="Warmup",
+        )
+        return len(pdf_bytes)
+
     @staticmethod
     def generate_admission_letter_pdf(body_html: str = "", **kwargs) -> bytes:
         """
@@ -0,0 +1,184 @@
+"""
+utils/profiler.py — On-demand sampling profiler for single requests.
+
+An admin (or ICT director) adds either
+
+    X-Profile: 1                      (header)
+    ?__profile=1                      (query flag, for window.open / browser)
+
+to any API call.  The request is then sampled every PROFILE_INTERVAL_MS by a
+side thread reading sys._current_frames(), and two files are written to
+PROFILE_DIR when the response goes out:
+
+    <id>.collapsed   folded stacks ("a;b;c 42"), load in speedscope.app or
+                     feed to flamegraph.pl
+    <id>.json        request metadata + every DB call made during the request
+                     (kind, SQL, elapsed, offset from request start)
+
+The profile id is returned in the X-Profile-Id response header.  Use
+scripts/profiles.py to list / inspect / open saved profiles.
+
+Non-admin callers asking for a profile are silently ignored — the request is
+served normally so the flag cannot be used to probe roles.
+"""
+
+import os
+import sys
+import json
+import secrets
+import time
+import threading
+import logging
+from collections import Counter
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger('profiler')
+
+PROFILE_ROLES = ('admin', 'ict_director')
+MAX_QUERIES   = 500     # DB calls recorded per profile
+MAX_SQL_CHARS = 300
+
+
+def profiling_requested(request) -> bool:
+    """True when the request asks for a profile AND carries an admin token."""
+    if not Config.PROFILE_ENABLED:
+        return False
+    flag = request.headers.get('X-Profile') or request.args.get('__profile')
+    if not flag or flag.lower() in ('0', 'false', 'no'):
+        return False
+
+    from utils.auth import AuthHandler
+    header = request.headers.get('Authorization', '')
+    token  = header.split(' ', 1)[1] if ' ' in header else request.args.get('token')
+    if not token:
+        return False
+    payload = AuthHandler.verify_token(token)
+    return 'error' not in payload and payload.get('role') in PROFILE_ROLES
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval until stopped."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval  = interval
+        self.stacks    = Counter()
+        self.samples   = 0
+        self._stop     = threading.Event()
+        self._thread   = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == own_ident:
+                continue
+            self.stacks[self._fold(frame)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _fold(frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f'{code.co_name} ({_short_path(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        parts.reverse()
+        return ';'.join(parts)
+
+
+def _short_path(filename: str) -> str:
+    backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if filename.startswith(backend_root):
+        return os.path.relpath(filename, backend_root)
+    for marker in ('site-packages' + os.sep, 'lib' + os.sep + 'python'):
+        idx = filename.find(marker)
+        if idx != -1:
+            return filename[idx:].split(os.sep, 1)[-1]
+    return os.path.basename(filename)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Request integration (wired up in app.py)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def start_request_profile(g, request) -> None:
+    if not profiling_requested(request):
+        return
+    g._profile_queries = []
+    g._profiler = SamplingProfiler(threading.get_ident(), Config.PROFILE_INTERVAL_MS / 1000.0)
+    g._profiler.start()
+
+
+def record_query(g, kind: str, query, elapsed: float) -> None:
+    """Called from metrics.record_db_time for every DB call in a profiled request."""
+    queries = getattr(g, '_profile_queries', None)
+    if queries is None or len(queries) >= MAX_QUERIES:
+        return
+    started = getattr(g, '_request_started', None)
+    offset  = (time.perf_counter() - elapsed - started) * 1000 if started else None
+    queries.append({
+        'kind':      kind,
+        'sql':       ' '.join(str(query or '').split())[:MAX_SQL_CHARS],
+        'ms':        round(elapsed * 1000, 3),
+        'offset_ms': round(offset, 3) if offset is not None else None,
+    })
+
+
+def finish_request_profile(g, request, response):
+    profiler = getattr(g, '_profiler', None)
+    if profiler is None:
+        return response
+    profiler.stop()
+    g._profiler = None
+
+    started  = getattr(g, '_request_started', None)
+    duration = (time.perf_counter() - started) * 1000 if started else None
+    rule     = request.url_rule.rule if request.url_rule else request.path
+    slug     = rule.strip('/').replace('/', '_').replace('<', '').replace('>', '').replace(':', '-')[:80]
+    # Random part: ids only have one-second resolution, and two profiles of the
+    # same route in the same second must not overwrite each other
+    profile_id = (f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{secrets.token_hex(3)}'
+                  f'-{request.method.lower()}-{slug}')
+
+    queries = g._profile_queries or []
+    meta = {
+        'id':           profile_id,
+        'created_at':   datetime.now().isoformat(timespec='seconds'),
+        'method':       request.method,
+        'path':         request.path,        # no query string: ?token=<JWT> must not reach disk
+        'route':        rule,
+        'status':       response.status_code,
+        'duration_ms':  round(duration, 3) if duration is not None else None,
+        'db_ms':        round(getattr(g, '_db_time', 0.0) * 1000, 3),
+        'interval_ms':  Config.PROFILE_INTERVAL_MS,
+        'samples':      profiler.samples,
+        'query_count':  len(queries),
+        'queries':      queries,
+    }
+
+    try:
+        os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(Config.PROFILE_DIR, profile_id)
+        with open(base + '.collapsed', 'w') as f:
+            for stack, count in profiler.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f, indent=2, default=str)
+        response.headers['X-Profile-Id'] = profile_id
+        logger.info(f'[profiler] {request.method} {rule} → {profile_id} '
+                    f'({profiler.samples} samples, {len(queries)} queries)')
+    except OSError as e:
+        logger.warning(f'[profiler] Could not write profile {profile_id}: {e}')
+    return response
@@ -0,0 +1,39 @@
+"""
+utils/rate_limit.py — Thread-safe token bucket.
+
+Used to keep the concurrent requery engine (background_requery.py) under a
+global request rate toward Interswitch no matter how many threads call it.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int | None = None):
+        """rate_per_second <= 0 disables limiting."""
+        self.rate     = float(rate_per_second)
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self._tokens  = self.capacity
+        self._updated = time.monotonic()
+        self._lock    = threading.Lock()
+
+    def acquire(self, deadline: float | None = None) -> bool:
+        """
+        Block until a token is available. Returns False (without consuming a
+        token) if it would have to wait past `deadline` (a time.monotonic() value).
+        """
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens  = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
@@ -0,0 +1,302 @@
+"""
+utils/session_ledger.py — Per-student, per-session tuition ledger.
+
+One row of student_session_ledger per (user_id, academic_session_id) holds
+what the student owes and has paid for that session: the fee key it was
+priced with (program_type, level_id, faculty_id), expected, paid, remaining,
+the installment plans and semesters already paid, and the fully_paid flag.
+
+refresh() rebuilds a row from payment_transactions and is called when a
+tuition payment settles (inside the settlement transaction, see
+payment_status.atomic_settle_payment).  Readers — the session payment
+summary, the "full payment" quote and the course-registration guard — then
+need one primary-key lookup instead of re-resolving the student's program
+and summing their transactions.
+
+Readers never write.  Without a row (payments made before the ledger
+existed, until scripts/rebuild_session_ledger.py has run) they sum
+payment_transactions as before.  Payments with no academic_session_id
+never get a row; has_paid_tuition's grandfather clause checks
+payment_transactions for those directly.
+
+The table comes from scripts/migration_add_student_session_ledger.sql.
+Until it exists readers fall back to payment_transactions and refresh()
+logs and skips, so a settlement is never rolled back over it.
+"""
+
+import threading
+
+from database import Database, MissingTable
+from utils.fee_matrix import get_fee_matrix
+
+_table_ready = False
+_table_lock  = threading.Lock()
+
+_LEDGER_COLUMNS = '''user_id, academic_session_id, program_type, level_id, faculty_id,
+                     expected, paid, remaining, payments_count, installments_paid,
+                     semesters_paid, fully_paid, updated_at'''
+
+# A session's successful tuition payments, summed the way the ledger stores them
+_TOTALS_SQL = '''SELECT COALESCE(SUM(amount_paid), 0) AS paid,
+                  COUNT(*) AS payments_count,
+                  COALESCE(ARRAY_AGG(DISTINCT installment_plan_id)
+                           FILTER (WHERE installment_plan_id IS NOT NULL), '{}') AS installments_paid,
+                  COALESCE(ARRAY_AGG(DISTINCT semester_id)
+                           FILTER (WHERE semester_id IS NOT NULL), '{}') AS semesters_paid
+           FROM payment_transactions
+           WHERE user_id = %s
+             AND academic_session_id = %s
+             AND tran_type = 'tuition'
+             AND tran_status = 'successful' '''
+
+
+def ensure_table():
+    """Raise database.MissingTable until migration_add_student_session_ledger.sql has run."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        Database.require_tables('migration_add_student_session_ledger.sql', 'student_session_ledger')
+        _table_ready = True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fee context
+# ─────────────────────────────────────────────────────────────────────────────
+
+def fee_context(user_id: int, log_tag: str = 'session_ledger') -> tuple:
+    """
+    (program_type, level_id, faculty_id) the student's tuition is priced with,
+    any of which may be None.  Prefers the students row (current level), then
+    falls back to the admitted application for students without one yet.
+    """
+    is_pg = bool(Database.execute_query('SELECT uuid FROM pg_application WHERE user_id = %s LIMIT 1', (user_id,)))
+
+    if is_pg:
+        student_res = Database.execute_query(
+            '''SELECT s.current_level_id,
+                      2 AS prog_type,
+                      pg.proposed_faculty_id AS faculty_id
+               FROM students s
+               JOIN users u ON u.id = s."UserId"
+               LEFT JOIN pg_application pg ON pg.user_id = u.id AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
+               WHERE s."UserId" = %s
+               ORDER BY s."CreatedDate" DESC LIMIT 1''',
+            (user_id,)
+        )
+    else:
+        student_res = Database.execute_query(
+            '''SELECT s.current_level_id,
+                      app.prog_type,
+                      ps.faculty_id
+               FROM students s
+               JOIN users u ON u.id = s."UserId"
+               LEFT JOIN applications app ON app.user_id = u.id
+                  AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
+                  AND app.created_at = (
+                    SELECT MAX(created_at) FROM applications WHERE user_id = u.id
+                  )
+               LEFT JOIN program_setup ps ON LOWER(ps.name) = LOWER(COALESCE(app.finalised_course, app.approved_course))
+               WHERE s."UserId" = %s
+               ORDER BY s."CreatedDate" DESC LIMIT 1''',
+            (user_id,)
+        )
+
+    if student_res and student_res[0].get('current_level_id'):
+        row = student_res[0]
+        return row.get('prog_type'), row['current_level_id'], row.get('faculty_id')
+
+    # Fallback for new students who don't have a record in `students` yet
+    matrix = get_fee_matrix()
+    try:
+        if is_pg:
+            pg_res = Database.execute_query(
+                '''SELECT pg.proposed_faculty_id
+                   FROM pg_application pg
+                   WHERE pg.user_id = %s AND pg.applicant_stage IN ('admitted', 'accepted', 'enrolled')
+                   ORDER BY pg.updated_date DESC LIMIT 1''',
+                (user_id,)
+            )
+            if pg_res:
+                return 2, matrix.program_levels.get(2) or 5, pg_res[0]['proposed_faculty_id']
+        else:
+            app_res = Database.execute_query(
+                '''SELECT app.prog_type,
+                          app.finalised_course,
+                          app.approved_course,
+                          app.program_setup_id
+                   FROM applications app
+                   JOIN program_types pt ON app.prog_type = pt.id
+                   WHERE app.user_id = %s AND app.applicant_stage IN ('admitted', 'accepted', 'enrolled')
+                   ORDER BY app.created_at DESC LIMIT 1''',
+                (user_id,)
+            )
+            if app_res:
+                app_row = app_res[0]
+                finalised_course = (app_row.get('finalised_course') or '').strip()
+                if not finalised_course:
+                    finalised_course = (app_row.get('approved_course') or '').strip()
+                if not finalised_course and app_row.get('program_setup_id'):
+                    finalised_course = matrix.course_name(app_row['program_setup_id']) or ''
+                faculty_id = matrix.faculty_for_course(finalised_course) if finalised_course else None
+                return app_row['prog_type'], matrix.program_levels.get(app_row['prog_type']), faculty_id
+    except Exception as e:
+        print(f"[{log_tag}] Fallback lookup failed: {e}")
+
+    return None, None, None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Writing
+# ─────────────────────────────────────────────────────────────────────────────
+
+def refresh(user_id: int, session_id: int, context=None, log_tag: str = 'session_ledger') -> dict | None:
+    """
+    Recompute the ledger row for (user_id, session_id) from payment_transactions
+    and return it.  context: optional (program_type, level_id, faculty_id) to
+    skip resolving it again.
+
+    Joins the caller's transaction if there is one, under a savepoint: a
+    ledger failure is logged and returns None rather than aborting the
+    settlement that called it.
+    """
+    try:
+        ensure_table()
+    except MissingTable as e:
+        print(f"[{log_tag}] Ledger not refreshed for user {user_id}, session {session_id}: {e}")
+        return None
+    program_type, level_id, faculty_id = context or fee_context(user_id, log_tag)
+
+    with Database.transaction() as cursor:
+        cursor.execute('SAVEPOINT session_ledger')
+        try:
+            row = _write(cursor, user_id, session_id, program_type, level_id, faculty_id)
+        except Exception as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT session_ledger')
+            print(f"[{log_tag}] Ledger refresh failed for user {user_id}, session {session_id}: {e}")
+            return None
+        cursor.execute('RELEASE SAVEPOINT session_ledger')
+        return row
+
+
+def _write(cursor, user_id, session_id, program_type, level_id, faculty_id) -> dict:
+    # Lock the row first so that two payments settling for the same
+    # student serialise here and the second sum sees the first payment
+    cursor.execute(
+        '''INSERT INTO student_session_ledger (user_id, academic_session_id)
+           VALUES (%s, %s) ON CONFLICT DO NOTHING''',
+        (user_id, session_id)
+    )
+    cursor.execute(
+        '''SELECT 1 FROM student_session_ledger
+           WHERE user_id = %s AND academic_session_id = %s FOR UPDATE''',
+        (user_id, session_id)
+    )
+    cursor.execute(_TOTALS_SQL, (user_id, session_id))
+    totals = cursor.fetchone()
+
+    paid = float(totals['paid'] or 0)
+    expected = 0.0
+    if program_type and level_id and faculty_id:
+        expected = get_fee_matrix().tuition_total(program_type, level_id, faculty_id, session_id)
+
+    cursor.execute(
+        f'''UPDATE student_session_ledger
+            SET program_type      = %s,
+                level_id          = %s,
+                faculty_id        = %s,
+                expected          = %s,
+                paid              = %s,
+                remaining         = %s,
+                payments_count    = %s,
+                installments_paid = %s,
+                semesters_paid    = %s,
+                fully_paid        = %s,
+                updated_at        = NOW()
+            WHERE user_id = %s AND academic_session_id = %s
+            RETURNING {_LEDGER_COLUMNS}''',
+        (
+            str(program_type) if program_type is not None else None,
+            str(level_id) if level_id is not None else None,
+            str(faculty_id) if faculty_id is not None else None,
+            expected, paid, max(0.0, expected - paid), totals['payments_count'],
+            list(totals['installments_paid']), list(totals['semesters_paid']),
+            (paid >= expected) if expected > 0 else False,
+            user_id, session_id,
+        )
+    )
+    return cursor.fetchone()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reading
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _from_payments(user_id: int, session_id: int) -> dict | None:
+    """
+    A ledger-shaped row summed from payment_transactions, without writing it.
+    The fee key is unknown (None) and expected is 0; callers that price the
+    session resolve it with fee_context().
+    """
+    rows = Database.execute_query(_TOTALS_SQL, (user_id, session_id))
+    if not rows:
+        return None
+    totals = rows[0]
+    return {
+        'user_id': user_id, 'academic_session_id': session_id,
+        'program_type': None, 'level_id': None, 'faculty_id': None,
+        'expected': 0.0, 'paid': totals['paid'], 'remaining': 0.0,
+        'payments_count': totals['payments_count'],
+        'installments_paid': list(totals['installments_paid']),
+        'semesters_paid': list(totals['semesters_paid']),
+        'fully_paid': False, 'updated_at': None,
+    }
+
+
+def get(user_id: int, session_id: int) -> dict | None:
+    """
+    The ledger row for (user_id, session_id): one primary-key lookup, or,
+    without a row or before the migration, the same fields summed from
+    payment_transactions (see _from_payments).  Never writes.
+    """
+    try:
+        ensure_table()
+    except MissingTable:
+        return _from_payments(user_id, session_id)
+    rows = Database.execute_query(
+        f'''SELECT {_LEDGER_COLUMNS} FROM student_session_ledger
+            WHERE user_id = %s AND academic_session_id = %s''',
+        (user_id, session_id)
+    )
+    return rows[0] if rows else _from_payments(user_id, session_id)
+
+
+def has_paid_tuition(user_id: int, session_id: int, semester_id=None) -> bool:
+    """
+    True if the student paid tuition for the session (and semester, when
+    given), or — grandfather clause — has any successful tuition payment.
+    """
+    try:
+        ensure_table()
+        rows = Database.execute_query(
+            '''SELECT payments_count, semesters_paid FROM student_session_ledger
+               WHERE user_id = %s AND academic_session_id = %s''',
+            (user_id, session_id)
+        )
+    except MissingTable:
+        rows = None
+    current = rows[0] if rows else None
+    if current and current['payments_count'] > 0:
+        if not semester_id or semester_id in (current['semesters_paid'] or []):
+            return True
+    # Grandfather clause, read from payment_transactions itself: it also
+    # covers sessions without a ledger row and payments made before session
+    # tracking (no academic_session_id, so no ledger row at all)
+    return bool(Database.execute_query(
+        '''SELECT 1 FROM payment_transactions
+           WHERE user_id = %s AND tran_type = 'tuition' AND tran_status = 'successful'
+           LIMIT 1''',
+        (user_id,)
+    ))
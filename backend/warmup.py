@@ -0,0 +1,101 @@
+"""
+warmup.py — One-off warmup routine run once per worker process.
+
+Without it the first requests after a deploy or dyno restart pay for pool
+creation, the TLS handshake to Neon, the Interswitch OAuth token fetch and
+the admission-letter template / image / ReportLab initialisation.
+
+Called from create_app() (see app.py).  Each step is timed and logged; a
+failing step is logged and skipped, it never stops the worker from booting.
+
+Configuration (env):
+  WARMUP_ENABLED  — 'true' (default) / 'false'
+  WARMUP_STEPS    — comma-separated subset of the steps below, in order
+"""
+
+import os
+import time
+import logging
+
+logger = logging.getLogger('warmup')
+logger.setLevel(logging.INFO)
+
+_warmed_pid = None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Steps
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _warm_db_pool():
+    from database import Database
+    return f'{Database.warm_pool()} connection(s) opened'
+
+
+def _warm_fee_matrix():
+    # Also caches the active session, installment plans and program levels
+    from utils.fee_matrix import get_fee_matrix
+    matrix = get_fee_matrix()
+    return f'{len(matrix.fee_amounts)} fee row(s), {len(matrix.tuition)} tuition key(s) cached'
+
+
+def _warm_interswitch_token():
+    from config import Config
+    from utils.interswitch import InterswitchClient
+    if not Config.INTERSWITCH_CLIENT_ID or not Config.INTERSWITCH_CLIENT_SECRET:
+        return 'skipped (Interswitch not configured)'
+    InterswitchClient._get_token()
+    return 'token cached'
+
+
+def _warm_pdf_templates():
+    from utils.pdf_generator import PDFGenerator
+    return f'admission letter rendered ({PDFGenerator.warm()} bytes)'
+
+
+STEPS = {
+    'db_pool':           _warm_db_pool,
+    'fee_matrix':        _warm_fee_matrix,
+    'interswitch_token': _warm_interswitch_token,
+    'pdf_templates':     _warm_pdf_templates,
+}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Entry point
+# ─────────────────────────────────────────────────────────────────────────────
+
+def run_warmup(steps=None) -> dict:
+    """
+    Run the configured warmup steps once for the current process.
+
+    Returns {step_name: elapsed_ms} for the steps that ran.  Safe to call more
+    than once — subsequent calls in the same process are no-ops, while a
+    forked child (different pid) warms itself again.
+    """
+    global _warmed_pid
+    from config import Config
+
+    if not Config.WARMUP_ENABLED or _warmed_pid == os.getpid():
+        return {}
+    _warmed_pid = os.getpid()
+
+    timings = {}
+    started = time.perf_counter()
+    for name in (steps or Config.WARMUP_STEPS):
+        step = STEPS.get(name)
+        if step is None:
+            logger.warning(f'[warmup] Unknown step {name!r} — skipped')
+            continue
+        t0 = time.perf_counter()
+        try:
+            detail = step()
+            timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+            logger.info(f'[warmup] {name}: {detail} in {timings[name]} ms')
+        except Exception as exc:
+            timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+            logger.warning(f'[warmup] {name} failed after {timings[name]} ms: {exc}')
+
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f'[warmup] pid={_warmed_pid} done in {total_ms} ms')
+    return timings
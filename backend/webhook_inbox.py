@@ -0,0 +1,367 @@
+"""
+webhook_inbox.py — Durable inbox for Interswitch payment webhooks.
+
+applicant.payment_webhook only persists the notification here and returns
+200 straight away; a small pool of daemon threads (started from app.py)
+drains the inbox with the same classify_response / atomic_settle_payment
+logic the webhook used to run inline.
+
+  • De-duplication: at most one 'received' row per reference_no.  Repeat
+    notifications for a reference that is still queued only bump
+    receive_count; once a row is being processed a new notification queues
+    a fresh row, so nothing that arrives mid-processing is lost.
+  • Claiming uses FOR UPDATE SKIP LOCKED, so any number of threads across
+    gunicorn workers can drain the same table, and skips references that
+    are already being processed so one reference is never settled twice
+    in parallel.  Rows stuck in 'processing' (worker died) are reclaimed
+    after STUCK_AFTER_MINUTES.
+  • A requery network error leaves the transaction in 'requery_error' with
+    a next_requery_at backoff, so the background requery worker takes it
+    from there; the inbox row itself is finished.
+  • The endpoint is public, so only notifications for an existing
+    transaction are stored, and only a capped copy of the body (top-level
+    scalar fields, truncated) is kept — processing never reads it, it is
+    there for support.  'done' rows older than WEBHOOK_INBOX_RETENTION_DAYS
+    are purged in batches by the workers; 'failed' rows are kept.
+  • The table comes from scripts/migration_add_payment_webhook_inbox.sql.
+    Until it has run the endpoint processes each webhook synchronously
+    (as before the inbox) and the workers wait for it.
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+
+from utils import metrics
+
+logger = logging.getLogger('webhook_inbox')
+logger.setLevel(logging.INFO)
+
+WEBHOOK_RECOVERY_WINDOW_MINUTES = 30
+STUCK_AFTER_MINUTES             = 5
+DEPTH_REFRESH_SECONDS           = 15
+PURGE_INTERVAL_SECONDS          = 3600
+PURGE_BATCH_SIZE                = 1000
+TABLE_RECHECK_SECONDS           = 60     # until the migration has run
+PAYLOAD_MAX_KEYS                = 40
+PAYLOAD_MAX_VALUE_CHARS         = 256
+
+WEBHOOKS_RECEIVED = metrics.counter(
+    'webhook_inbox_received', 'Webhook notifications persisted to the inbox.', ('result',),
+)
+WEBHOOK_LAG_SECONDS = metrics.histogram(
+    'webhook_inbox_lag_seconds', 'Time from webhook receipt to processing start.',
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+WEBHOOK_PROCESSING_SECONDS = metrics.histogram(
+    'webhook_processing_seconds', 'Time to process one inbox row (requery + settlement).',
+    ('outcome',),
+)
+WEBHOOK_INBOX_DEPTH = metrics.gauge('webhook_inbox_depth', 'Inbox rows waiting to be processed.')
+WEBHOOK_INBOX_PURGED = metrics.counter('webhook_inbox_purged', "Processed ('done') inbox rows deleted by retention.")
+
+_wakeup         = threading.Event()
+_started_pid    = None
+_start_lock     = threading.Lock()
+_table_ready    = False
+_table_lock     = threading.Lock()
+_missing_logged = False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Schema
+# ─────────────────────────────────────────────────────────────────────────────
+
+def ensure_table():
+    """Raise database.MissingTable until migration_add_payment_webhook_inbox.sql has run."""
+    global _table_ready
+    if _table_ready:
+        return
+    from database import Database
+    with _table_lock:
+        if _table_ready:
+            return
+        Database.require_tables('migration_add_payment_webhook_inbox.sql', 'payment_webhook_inbox')
+        _table_ready = True
+
+
+def inbox_available() -> bool:
+    """Whether the inbox table exists; logs the migration to run once per process if not."""
+    global _missing_logged
+    from database import MissingTable
+    try:
+        ensure_table()
+        return True
+    except MissingTable as exc:
+        if not _missing_logged:
+            _missing_logged = True
+            logger.warning(f'[webhook] {exc}; processing webhooks synchronously until then')
+        return False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Ingest (request path)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _stored_payload(payload: dict) -> dict:
+    """The part of a notification body worth keeping: top-level scalars, truncated."""
+    kept = {}
+    for key, value in list(payload.items())[:PAYLOAD_MAX_KEYS]:
+        if isinstance(value, (dict, list)):
+            continue
+        if isinstance(value, str):
+            value = value[:PAYLOAD_MAX_VALUE_CHARS]
+        kept[str(key)[:PAYLOAD_MAX_VALUE_CHARS]] = value
+    return kept
+
+
+def enqueue_webhook(reference_no: str, payload: dict) -> bool:
+    """Persist a notification. Returns False if it could not be stored."""
+    from database import Database
+    try:
+        ensure_table()
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                '''INSERT INTO payment_webhook_inbox (reference_no, payload)
+                   VALUES (%s, %s::jsonb)
+                   ON CONFLICT (reference_no) WHERE status = 'received'
+                   DO UPDATE SET receive_count    = payment_webhook_inbox.receive_count + 1,
+                                 payload          = EXCLUDED.payload,
+                                 last_received_at = NOW()
+                   RETURNING (xmax = 0) AS inserted''',
+                (reference_no, json.dumps(_stored_payload(payload), default=str)),
+            )
+            inserted = cursor.fetchone()['inserted']
+    except Exception as exc:
+        logger.error(f'[webhook] Could not persist webhook for {reference_no}: {exc}')
+        return False
+    WEBHOOKS_RECEIVED.inc(result='new' if inserted else 'duplicate')
+    _wakeup.set()
+    return True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Processing (shared by the inbox workers and the synchronous fallback)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def process_webhook(reference_no: str) -> str:
+    """
+    Requery Interswitch for one reference and settle it.
+
+    Returns the outcome: 'not_found', 'already_processed', 'requery_error'
+    or the tran_status written ('successful', 'pending', 'failed', 'cancelled').
+    """
+    from database import Database
+    from utils.interswitch import InterswitchClient
+    from utils.payment_status import (
+        classify_response,
+        atomic_settle_payment,
+        build_update_sql_params,
+        generate_receipt_no,
+        mark_requery_error,
+        SettlementFailed,
+    )
+
+    # ── Look up the transaction (include requery_count) ───────────────────────
+    txn_res = Database.execute_query(
+        '''SELECT id, user_id, amount_in_kobo, amount, tran_status, receipt_no,
+                  response_description,
+                  tran_type, COALESCE(requery_count, 0) AS requery_count,
+                  updated_at
+           FROM payment_transactions
+           WHERE reference_no = %s
+           ORDER BY created_at DESC LIMIT 1''',
+        (reference_no,)
+    )
+    if not txn_res:
+        print(f"[webhook] Transaction not found: {reference_no}")
+        return 'not_found'
+
+    txn           = txn_res[0]
+    user_id       = txn['user_id']
+    payment_type  = txn['tran_type']
+    requery_count = int(txn['requery_count'])
+
+    if txn['tran_status'] in ('successful', 'cancelled'):
+        print(f"[webhook] Already finalised ({txn['tran_status']}): {reference_no}")
+        return 'already_processed'
+
+    if txn['tran_status'] == 'failed':
+        updated_at = txn.get('updated_at')
+        if not updated_at:
+            return 'already_processed'
+        age_minutes = (datetime.now().replace(tzinfo=None) - updated_at).total_seconds() / 60
+        if age_minutes >= WEBHOOK_RECOVERY_WINDOW_MINUTES:
+            return 'already_processed'
+
+    amount_kobo = txn['amount_in_kobo'] or (round(float(txn['amount'] or 0) * 100))
+
+    # Re-query Interswitch
+    try:
+        isw_resp = InterswitchClient.requery_transaction(reference_no, amount_kobo)
+    except Exception as e:
+        print(f"[webhook] Requery error for {reference_no}: {e}")
+        mark_requery_error(reference_no)
+        return 'requery_error'
+
+    response_code = str(isw_resp.get('ResponseCode', '')).strip()
+    response_desc = isw_resp.get('ResponseDescription', '')
+
+    tran_status   = classify_response(response_code, requery_count, response_desc)
+    is_successful = (tran_status == 'successful')
+    is_cancelled  = (tran_status == 'cancelled')
+
+    log_msg = f"[webhook] {reference_no} | code={response_code!r} requery_count={requery_count} → {tran_status} (type={payment_type})"
+    if is_cancelled:
+        log_msg += f" (cancelled by user, response_desc='{response_desc}')"
+    print(log_msg)
+
+    # ── Update transaction record ─────────────────────────────────────────────
+    receipt_no: str = txn.get('receipt_no') or (generate_receipt_no(payment_type=payment_type) if is_successful else '') or ''
+    sql, params = build_update_sql_params(
+        tran_status, reference_no, response_code, response_desc,
+        isw_resp, amount_kobo, receipt_no,
+    )
+    try:
+        settled = is_successful and atomic_settle_payment(reference_no, user_id, payment_type, final_update=(sql, params))
+    except SettlementFailed:
+        return 'requery_error'
+    if not settled:
+        Database.execute_update(sql, params)
+    return tran_status
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker pool
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _claim_next():
+    from database import Database
+    rows = Database.execute_query(
+        f'''UPDATE payment_webhook_inbox
+            SET status = 'processing', started_at = NOW(), attempts = attempts + 1
+            WHERE id = (
+                SELECT i.id FROM payment_webhook_inbox i
+                WHERE (i.status = 'received'
+                       OR (i.status = 'processing' AND i.started_at < NOW() - INTERVAL '{STUCK_AFTER_MINUTES} minutes'))
+                  -- one reference at a time; later notifications wait (and merge)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM payment_webhook_inbox p
+                      WHERE p.reference_no = i.reference_no
+                        AND p.status = 'processing'
+                        AND p.id <> i.id
+                        AND p.started_at >= NOW() - INTERVAL '{STUCK_AFTER_MINUTES} minutes'
+                  )
+                ORDER BY i.id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, reference_no, attempts,
+                      EXTRACT(EPOCH FROM (NOW() - received_at)) AS lag_seconds'''
+    )
+    return rows[0] if rows else None
+
+
+def _finish(row_id: int, status: str, outcome: str, error: str | None = None):
+    from database import Database
+    Database.execute_update(
+        '''UPDATE payment_webhook_inbox
+           SET status = %s, outcome = %s, last_error = %s, processed_at = NOW()
+           WHERE id = %s''',
+        (status, outcome, error, row_id),
+    )
+
+
+def _refresh_depth():
+    from database import Database
+    rows = Database.execute_query(
+        "SELECT COUNT(*) AS n FROM payment_webhook_inbox WHERE status = 'received'"
+    )
+    if rows:
+        WEBHOOK_INBOX_DEPTH.set(rows[0]['n'])
+
+
+def purge_done(retention_days: float | None = None) -> int:
+    """Delete 'done' rows processed more than retention_days ago, in batches. Returns how many."""
+    from database import Database
+    from config import Config
+    retention_days = Config.WEBHOOK_INBOX_RETENTION_DAYS if retention_days is None else retention_days
+    purged = 0
+    while True:
+        with Database.get_cursor() as cursor:
+            cursor.execute(
+                '''DELETE FROM payment_webhook_inbox
+                   WHERE id IN (SELECT id FROM payment_webhook_inbox
+                                WHERE status = 'done'
+                                  AND processed_at < NOW() - %s * INTERVAL '1 day'
+                                LIMIT %s
+                                FOR UPDATE SKIP LOCKED)''',
+                (retention_days, PURGE_BATCH_SIZE),
+            )
+            deleted = cursor.rowcount
+        purged += deleted
+        if deleted < PURGE_BATCH_SIZE:
+            break
+    if purged:
+        WEBHOOK_INBOX_PURGED.inc(purged)
+        logger.info(f'[webhook] Purged {purged} processed inbox row(s)')
+    return purged
+
+
+def drain_once() -> bool:
+    """Process one inbox row if any is available. Returns True if a row was handled."""
+    row = _claim_next()
+    if not row:
+        return False
+
+    WEBHOOK_LAG_SECONDS.observe(float(row['lag_seconds'] or 0))
+    started = time.perf_counter()
+    try:
+        outcome = process_webhook(row['reference_no'])
+        _finish(row['id'], 'done', outcome)
+    except Exception as exc:
+        outcome = 'error'
+        logger.exception(f"[webhook] Processing failed for {row['reference_no']}: {exc}")
+        _finish(row['id'], 'failed', outcome, str(exc)[:1000])
+    WEBHOOK_PROCESSING_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+    return True
+
+
+def _worker_loop(poll_seconds: float):
+    last_depth = 0.0
+    last_purge = 0.0
+    while True:
+        try:
+            if not inbox_available():
+                time.sleep(TABLE_RECHECK_SECONDS)
+                continue
+            if drain_once():
+                continue
+            if time.monotonic() - last_depth >= DEPTH_REFRESH_SECONDS:
+                _refresh_depth()
+                last_depth = time.monotonic()
+            if time.monotonic() - last_purge >= PURGE_INTERVAL_SECONDS:
+                last_purge = time.monotonic()
+                purge_done()
+        except Exception as exc:
+            logger.exception(f'[webhook] Unhandled error in inbox worker: {exc}')
+        # Woken early by enqueue_webhook in this process; other workers poll
+        _wakeup.wait(poll_seconds)
+        _wakeup.clear()
+
+
+def start_webhook_workers():
+    global _started_pid
+    from config import Config
+    with _start_lock:
+        if _started_pid == os.getpid() or Config.WEBHOOK_WORKERS <= 0:
+            return
+        for i in range(Config.WEBHOOK_WORKERS):
+            threading.Thread(
+                target=_worker_loop, args=(Config.WEBHOOK_POLL_SECONDS,),
+                name=f'webhook-inbox-{i}', daemon=True,
+            ).start()
+        _started_pid = os.getpid()
@@ -20,6 +20,7 @@ type StaffRole =
   | "pgadmin"
   | "ptadmin"
   | "registrar"
+  | "bursar"
   | "admissionofficer"
   | "ictdirector"
   | "ict_director"
@@ -46,6 +47,7 @@ export const STAFF_ROLES: string[] = [
   "pgadmin",
   "ptadmin",
   "registrar",
+  "bursar",
   "freshapplicant",
   "admissionofficer",
   "ictdirector",
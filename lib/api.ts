@@ -825,6 +825,28 @@ export class ApiClient {
     return data;
   }
 
+  /**
+   * Long-poll the payment status for the /applicant/payment/verifying page.
+   * Read-only on the server: the request is held for up to `wait` seconds
+   * until the transaction is final, and never triggers an inline requery.
+   */
+  static async getPaymentStatus(reference_no: string, wait = 15): Promise<{
+    reference_no: string;
+    tran_status: string;
+    is_final: boolean;
+    is_successful: boolean;
+    receipt_no: string | null;
+    payment_type: string;
+    verifying: boolean;
+    message: string | null;
+  }> {
+    // Unique query string so the GET cache / in-flight dedup never serves a stale status
+    const { data } = await this.fetch(
+      `/applicant/payment/status/${encodeURIComponent(reference_no)}?wait=${wait}&t=${Date.now()}`,
+    );
+    return data;
+  }
+
   static async cancelPayment(reference_no: string): Promise<{
     message: string;
     tran_status: string;